@@ -0,0 +1,140 @@
+"""Local OpenAI-compatible stand-in for OpenRouter, used by the benchmarks.
+
+    python -m bench.mock_llm --port 8766 --latency-ms 300 --tps 40 --error-rate 0.02
+
+Point the app at it with OPENROUTER_BASE_URL=http://127.0.0.1:8766/v1.
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+LATENCY_MS = float(os.getenv("MOCK_LLM_LATENCY_MS", "200"))
+JITTER_MS = float(os.getenv("MOCK_LLM_JITTER_MS", "50"))
+TOKENS_PER_SEC = float(os.getenv("MOCK_LLM_TPS", "50"))
+ERROR_RATE = float(os.getenv("MOCK_LLM_ERROR_RATE", "0"))
+ERROR_STATUS = int(os.getenv("MOCK_LLM_ERROR_STATUS", "500"))
+THINK = os.getenv("MOCK_LLM_THINK", "1") == "1"
+
+
+def _per_model(raw):
+    """"model-a=5000,model-b=0.5" -> {"model-a": 5000.0, "model-b": 0.5}"""
+    values = {}
+    for item in raw.split(","):
+        model, _, value = item.strip().rpartition("=")
+        if model:
+            values[model] = float(value)
+    return values
+
+
+# Per-model overrides, to exercise the app's model routing (LLM_MODELS)
+MODEL_LATENCY_MS = _per_model(os.getenv("MOCK_LLM_MODEL_LATENCY_MS", ""))
+MODEL_ERROR_RATE = _per_model(os.getenv("MOCK_LLM_MODEL_ERROR_RATE", ""))
+
+EXCUSES = [
+    "My laptop decided to install a critical update right before the meeting, and I am joining as soon as it finishes.",
+    "A water pipe burst in my building this morning, so I need to stay until the plumber arrives.",
+    "My train was held outside the station due to a signal failure; I will be about thirty minutes late.",
+    "I woke up with a fever and do not want to risk passing it on, so I am resting today.",
+    "A family member needed an urgent ride to the clinic, and I will catch up on everything this afternoon.",
+]
+APOLOGIES = [
+    "I am truly sorry for missing our call; it was careless of me and I will make sure it does not happen again.",
+    "I sincerely apologize for the confusion I caused and I regret not checking the details first.",
+    "I am deeply sorry for my late reply, and I appreciate your patience while I sorted things out.",
+]
+
+app = FastAPI()
+stats = {"requests": 0, "streamed": 0, "errors_injected": 0, "by_model": {}}
+
+
+def _reply(prompt: str) -> str:
+    """Picks a plausible answer for the prompt shape the app sends."""
+    digest = int(hashlib.sha1(f"{prompt}{stats['requests']}".encode("utf-8")).hexdigest(), 16)
+    if '"score"' in prompt:
+        return json.dumps({"score": 40 + digest % 55, "reason": "Sincere tone with a clear acknowledgement of the mistake."})
+    base = APOLOGIES[digest % len(APOLOGIES)] if "apology" in prompt.lower() else EXCUSES[digest % len(EXCUSES)]
+    if '"english"' in prompt and '"translated"' in prompt:
+        return json.dumps({"english": base, "translated": f"[translated] {base}"})
+    if prompt.startswith("Translate this to"):
+        return f"[translated] {prompt.split(chr(10), 1)[-1]}"
+    return base
+
+
+def _latency(model=None) -> float:
+    return max(MODEL_LATENCY_MS.get(model, LATENCY_MS) + random.uniform(-JITTER_MS, JITTER_MS), 0) / 1000
+
+
+def _tokens(text: str) -> list:
+    # Roughly one token per word, keeping the spaces so the chunks join back to the text
+    words = text.split(" ")
+    return [w + (" " if i < len(words) - 1 else "") for i, w in enumerate(words)]
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get("model", "mock")
+    stats["requests"] += 1
+    stats["by_model"][model] = stats["by_model"].get(model, 0) + 1
+    error_rate = MODEL_ERROR_RATE.get(model, ERROR_RATE)
+    if error_rate and random.random() < error_rate:
+        stats["errors_injected"] += 1
+        await asyncio.sleep(_latency(model) / 4)
+        headers = {"Retry-After": "1"} if ERROR_STATUS == 429 else {}
+        return JSONResponse({"error": {"message": "injected failure", "type": "mock"}}, status_code=ERROR_STATUS, headers=headers)
+
+    prompt = body["messages"][-1]["content"]
+    text = _reply(prompt)
+    if THINK:
+        text = "<think>Considering the request.</think>" + text
+    created = int(time.time())
+
+    if body.get("stream"):
+        stats["streamed"] += 1
+
+        async def events():
+            await asyncio.sleep(_latency(model))
+            for token in _tokens(text):
+                chunk = {"id": "mock", "object": "chat.completion.chunk", "created": created, "model": model,
+                         "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(1 / TOKENS_PER_SEC)
+            done = {"id": "mock", "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            yield f"data: {json.dumps(done)}\n\n"
+            yield "data: [DONE]\n\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    await asyncio.sleep(_latency(model) + len(_tokens(text)) / TOKENS_PER_SEC)
+    return {
+        "id": "mock", "object": "chat.completion", "created": created, "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": len(prompt.split()), "completion_tokens": len(_tokens(text)), "total_tokens": len(prompt.split()) + len(_tokens(text))},
+    }
+
+
+@app.get("/stats")
+def get_stats():
+    return stats
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible LLM server")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--latency-ms", type=float, default=LATENCY_MS, help="time to first token")
+    parser.add_argument("--jitter-ms", type=float, default=JITTER_MS)
+    parser.add_argument("--tps", type=float, default=TOKENS_PER_SEC, help="tokens per second after the first")
+    parser.add_argument("--error-rate", type=float, default=ERROR_RATE, help="fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=ERROR_STATUS)
+    args = parser.parse_args()
+    LATENCY_MS, JITTER_MS, TOKENS_PER_SEC = args.latency_ms, args.jitter_ms, args.tps
+    ERROR_RATE, ERROR_STATUS = args.error_rate, args.error_status
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
@@ -0,0 +1,208 @@
+"""Post-processing regression check and micro-benchmark (no app or network needed).
+
+    python -m bench.postprocess
+    python -m bench.postprocess --fuzz 20000 --number 2000
+
+1. Every output in bench/corpus/postprocess.jsonl must give the recorded strip_reasoning and
+   postprocess results, both in one call and streamed through OutputCleaner in chunks of several
+   sizes. The recorded results come from the original regex implementation (LEGACY below).
+2. --fuzz N random outputs (reasoning tags, quotes, lead-ins, blank lines) are compared with LEGACY.
+3. Per-call time of LEGACY vs utils.postprocess over the corpus, one-shot and streamed.
+Exits non-zero on any mismatch; timings are saved under bench/results/.
+"""
+import os
+import re
+import sys
+import json
+import random
+import timeit
+import argparse
+from datetime import datetime
+from bench.run_bench import REPO, RESULTS_DIR, git_commit
+from utils.postprocess import strip_reasoning, clean_llm_text, postprocess, OutputCleaner
+
+CORPUS = os.path.join(REPO, "bench", "corpus", "postprocess.jsonl")
+CHUNK_SIZES = (1, 3, 7, 16, 64)
+
+
+# ============ LEGACY: the regex implementation the engine replaced ============
+def legacy_strip_reasoning(text):
+    if not text:
+        return text
+    cleaned = re.sub(r'<(think|thought)>.*?</\1>', '', text, flags=re.DOTALL)
+    cleaned = re.sub(r'<(think|thought)>.*', '', cleaned, flags=re.DOTALL)
+    return cleaned.strip()
+
+
+def legacy_clean_llm_text(text):
+    text = text.strip()
+    match = re.search(r'"([^"]{10,})"', text)
+    if match:
+        return match.group(1).strip()
+    text = re.sub(r'^(Here is.*?:\s*)', '', text, flags=re.IGNORECASE)
+    lines = [L for L in text.split('\n') if L.strip()]
+    if len(lines) > 1 and len(lines[0]) > 10:
+        return lines[0].strip().replace('"', '')
+    return text.replace('"', '').strip()
+
+
+class LegacyReasoningFilter:
+    OPEN_TAGS = ("<think>", "<thought>")
+
+    def __init__(self):
+        self._buffer = ""
+        self._closing = None
+
+    def feed(self, chunk):
+        self._buffer += chunk
+        visible = []
+        while self._buffer:
+            if self._closing:
+                idx = self._buffer.find(self._closing)
+                if idx == -1:
+                    self._buffer = self._buffer[-(len(self._closing) - 1):]
+                    break
+                self._buffer = self._buffer[idx + len(self._closing):]
+                self._closing = None
+                continue
+            idx = self._buffer.find("<")
+            if idx == -1:
+                visible.append(self._buffer)
+                self._buffer = ""
+                break
+            visible.append(self._buffer[:idx])
+            rest = self._buffer[idx:]
+            tag = next((t for t in self.OPEN_TAGS if rest.startswith(t)), None)
+            if tag:
+                self._closing = "</" + tag[1:]
+                self._buffer = rest[len(tag):]
+            elif any(t.startswith(rest) for t in self.OPEN_TAGS):
+                self._buffer = rest
+                break
+            else:
+                visible.append("<")
+                self._buffer = rest[1:]
+        return "".join(visible)
+
+    def flush(self):
+        tail = "" if self._closing else self._buffer
+        self._buffer = ""
+        return tail
+
+
+def legacy_stream(chunks):
+    reasoning = LegacyReasoningFilter()
+    parts = [reasoning.feed(chunk) for chunk in chunks]
+    parts.append(reasoning.flush())
+    return legacy_clean_llm_text("".join(parts).strip())
+
+
+def engine_stream(chunks):
+    cleaner = OutputCleaner()
+    for chunk in chunks:
+        cleaner.feed(chunk)
+    cleaner.flush()
+    return cleaner.cleaned()
+
+
+def chunked(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+
+# ============ Checks ============
+def check_case(name, raw, stripped, cleaned):
+    failures = []
+    if strip_reasoning(raw) != stripped:
+        failures.append(f"{name}: strip_reasoning -> {strip_reasoning(raw)!r}, expected {stripped!r}")
+    if postprocess(raw) != cleaned:
+        failures.append(f"{name}: postprocess -> {postprocess(raw)!r}, expected {cleaned!r}")
+    if clean_llm_text(stripped) != cleaned:
+        failures.append(f"{name}: clean_llm_text -> {clean_llm_text(stripped)!r}, expected {cleaned!r}")
+    for size in CHUNK_SIZES:
+        streamed = engine_stream(chunked(raw, size))
+        if streamed != cleaned:
+            failures.append(f"{name}: OutputCleaner (chunks of {size}) -> {streamed!r}, expected {cleaned!r}")
+    return failures
+
+
+FUZZ_PIECES = (
+    "<think>", "</think>", "<thought>", "</thought>", '"', '"', "Here is", "here is the excuse", ":", " ",
+    "\n", "\n\n", "  ", "\r\n", "I'm late", "sorry about that", "the train broke down", "x" * 12, "ok", "<b>",
+    "**Excuse:**", "—", "🚗",
+)
+
+
+def fuzz_case(rng):
+    return "".join(rng.choice(FUZZ_PIECES) for _ in range(rng.randint(0, 24)))
+
+
+def load_corpus():
+    with open(CORPUS, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def per_call_us(fn, inputs, number):
+    total = timeit.timeit(lambda: [fn(item) for item in inputs], number=number)
+    return total / (number * len(inputs)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fuzz", type=int, default=5000, help="random outputs compared with the legacy implementation")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--number", type=int, default=500, help="timing repetitions over the corpus")
+    parser.add_argument("--stream-chunk", type=int, default=8, help="characters per streamed chunk when timing")
+    parser.add_argument("--label", default="postprocess")
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    failures = []
+    for case in corpus:
+        failures += check_case(case["name"], case["raw"], case["strip_reasoning"], case["postprocess"])
+        if legacy_clean_llm_text(legacy_strip_reasoning(case["raw"])) != case["postprocess"]:
+            failures.append(f"{case['name']}: recorded result no longer matches LEGACY")
+    rng = random.Random(args.seed)
+    for i in range(args.fuzz):
+        raw = fuzz_case(rng)
+        stripped = legacy_strip_reasoning(raw)
+        failures += check_case(f"fuzz#{i}", raw, stripped, legacy_clean_llm_text(stripped))
+    print(f"✔ {len(corpus)} corpus outputs, {args.fuzz} fuzzed outputs, chunk sizes {CHUNK_SIZES}")
+    for failure in failures[:20]:
+        print("✘", failure)
+
+    raws = [case["raw"] for case in corpus]
+    streams = [chunked(raw, args.stream_chunk) for raw in raws]
+    # Undecorated functions, so the comparison leaves out the metrics timer
+    results = {
+        "strip_reasoning": (per_call_us(legacy_strip_reasoning, raws, args.number), per_call_us(strip_reasoning.__wrapped__, raws, args.number)),
+        "clean_llm_text": (
+            per_call_us(legacy_clean_llm_text, [case["strip_reasoning"] for case in corpus], args.number),
+            per_call_us(clean_llm_text.__wrapped__, [case["strip_reasoning"] for case in corpus], args.number),
+        ),
+        "postprocess": (
+            per_call_us(lambda raw: legacy_clean_llm_text(legacy_strip_reasoning(raw)), raws, args.number),
+            per_call_us(postprocess.__wrapped__, raws, args.number),
+        ),
+        "stream": (per_call_us(legacy_stream, streams, max(1, args.number // 10)), per_call_us(engine_stream, streams, max(1, args.number // 10))),
+    }
+    print(f"\n{'step':<18}{'legacy µs':>12}{'engine µs':>12}{'speed-up':>10}")
+    for step, (legacy, engine) in results.items():
+        print(f"{step:<18}{legacy:>12.2f}{engine:>12.2f}{legacy / engine:>9.2f}x")
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    out = os.path.join(RESULTS_DIR, f"{stamp}-{args.label}.json")
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump({
+            "label": args.label, "timestamp": stamp, "commit": git_commit(), "config": vars(args),
+            "failures": len(failures),
+            "results": {step: {"legacy_us": round(legacy, 3), "engine_us": round(engine, 3)} for step, (legacy, engine) in results.items()},
+        }, f, indent=2)
+    print(f"\n💾 Saved {out}")
+    if failures:
+        print(f"❌ {len(failures)} mismatches")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+"""Load benchmark for the API against the local mock LLM (no OpenRouter quota used).
+
+    python -m bench.run_bench --concurrency 32 --requests 300 --label baseline
+    python -m bench.run_bench --label after --compare bench/results/<baseline>.json --fail-on-regression
+
+Boots bench.mock_llm and main:app (in a scratch working directory with its own database), drives each
+scenario at the given concurrency and reports p50/p95/p99 latency, requests/sec, upstream LLM calls and
+bytes written per request. Results are saved as JSON under bench/results/.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime
+import httpx
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO, "bench", "results")
+
+SCENARIOS = ["excuse", "apology", "guilt", "rankings", "top-apologies", "calendar"]
+
+
+def build_request(scenario, i, distinct):
+    """(method, path, json body) for request i; `distinct` bounds how many different payloads are cycled."""
+    n = i % distinct
+    if scenario == "excuse":
+        return "POST", "/api/excuse", {"scenario": f"late for stand-up #{n}", "urgency": ["medium", "high", "critical"][n % 3], "language": "en", "style": "professional"}
+    if scenario == "apology":
+        return "POST", "/api/apology", {"context": f"missed deadline #{n}", "tone": "sincere", "type": "professional", "style": "formal", "language": "en"}
+    if scenario == "guilt":
+        return "POST", "/api/guilt-score", {"text": f"I am truly sorry for missing the deadline #{n}."}
+    if scenario == "rankings":
+        return "GET", "/api/rankings?limit=20", None
+    if scenario == "top-apologies":
+        return "GET", "/api/top-apologies?limit=20", None
+    if scenario == "calendar":
+        return "GET", "/api/calendar", None
+    raise ValueError(f"Unknown scenario '{scenario}'")
+
+
+# ============ Process helpers ============
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(url, timeout=60.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+
+def process_tree(pid):
+    """pid plus all descendants (uvicorn --workers forks children)."""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, ValueError, IndexError):
+                continue
+            children.setdefault(ppid, []).append(int(entry))
+    tree, stack = [], [pid]
+    while stack:
+        p = stack.pop()
+        tree.append(p)
+        stack.extend(children.get(p, []))
+    return tree
+
+
+def disk_write_bytes(pid):
+    """Bytes the app's processes sent to the storage layer (Linux /proc/<pid>/io); None elsewhere."""
+    total, seen = 0, False
+    for p in process_tree(pid):
+        try:
+            with open(f"/proc/{p}/io") as f:
+                for line in f:
+                    if line.startswith("write_bytes:"):
+                        total += int(line.split()[1])
+                        seen = True
+        except OSError:
+            continue
+    return total if seen else None
+
+
+def file_sizes(root):
+    sizes = {}
+    for dirpath, _, names in os.walk(root):
+        for name in names:
+            path = os.path.join(dirpath, name)
+            try:
+                sizes[os.path.relpath(path, root)] = os.path.getsize(path)
+            except OSError:
+                pass
+    return sizes
+
+
+def file_kind(name):
+    if ".db" in name:
+        return "sqlite"
+    if name.endswith(".jsonl") or ".jsonl." in name:
+        return "jsonl"
+    if name.endswith(".json"):
+        return "json"
+    return "other"
+
+
+# ============ Load driver ============
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    rank = max(int(round(pct / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+async def drive(base_url, scenario, total, concurrency, distinct, timeout):
+    latencies, statuses = [], {}
+    counter = iter(range(total))
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout) as client:
+        async def worker():
+            for i in counter:
+                method, path, body = build_request(scenario, i, distinct)
+                start = time.perf_counter()
+                try:
+                    res = await client.request(method, path, json=body)
+                    status = str(res.status_code)
+                    # The app reports upstream failures as 200 {"error": ...}
+                    if res.status_code == 200 and res.headers.get("content-type", "").startswith("application/json"):
+                        data = res.json()
+                        if isinstance(data, dict) and "error" in data:
+                            status = "app_error"
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                latencies.append(time.perf_counter() - start)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        wall = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall = time.perf_counter() - wall
+    return sorted(latencies), statuses, wall
+
+
+def run_scenario(args, scenario, app_proc, base_url, mock_url, workdir):
+    upstream_before = httpx.get(f"{mock_url}/stats").json()["requests"]
+    disk_before, files_before = disk_write_bytes(app_proc.pid), file_sizes(workdir)
+
+    latencies, statuses, wall = asyncio.run(drive(base_url, scenario, args.requests, args.concurrency, args.distinct, args.timeout))
+
+    time.sleep(0.5)  # let background jobs/threads settle before measuring writes
+    upstream = httpx.get(f"{mock_url}/stats").json()["requests"] - upstream_before
+    disk_after, files_after = disk_write_bytes(app_proc.pid), file_sizes(workdir)
+    growth = {}
+    for name, size in files_after.items():
+        delta = size - files_before.get(name, 0)
+        if delta:
+            growth[file_kind(name)] = growth.get(file_kind(name), 0) + delta
+
+    n = len(latencies)
+    ok = statuses.get("200", 0)
+    disk = disk_after - disk_before if disk_before is not None and disk_after is not None else None
+    ms = lambda v: round(v * 1000, 2) if v is not None else None
+    return {
+        "requests": n,
+        "ok": ok,
+        "statuses": statuses,
+        "rps": round(n / wall, 2) if wall else None,
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "mean_ms": ms(sum(latencies) / n) if n else None,
+        "upstream_calls_per_request": round(upstream / n, 3) if n else None,
+        "disk_write_bytes_per_request": round(disk / n, 1) if disk is not None and n else None,
+        "file_growth_bytes_per_request": {kind: round(b / n, 1) for kind, b in growth.items()},
+    }
+
+
+# ============ Reporting ============
+def print_table(results):
+    print(f"\n{'scenario':<15}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ok':>7}{'llm/req':>9}{'disk B/req':>12}")
+    for scenario, r in results.items():
+        disk = r["disk_write_bytes_per_request"]
+        print(f"{scenario:<15}{r['rps']:>9}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}{r['ok']:>7}"
+              f"{r['upstream_calls_per_request']:>9}{disk if disk is not None else '-':>12}")
+
+
+def compare(results, baseline_path, threshold):
+    """Prints deltas against a saved run; returns the list of regressions beyond `threshold`."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+    regressions = []
+    print(f"\nvs {os.path.basename(baseline_path)}")
+    for scenario, r in results.items():
+        base = baseline.get(scenario)
+        if not base:
+            continue
+        parts = []
+        for metric, higher_is_better in (("rps", True), ("p50_ms", False), ("p95_ms", False), ("p99_ms", False)):
+            old, new = base.get(metric), r.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            parts.append(f"{metric} {change:+.1%}")
+            worse = -change if higher_is_better else change
+            if worse > threshold:
+                regressions.append(f"{scenario} {metric}: {old} -> {new}")
+        print(f"  {scenario:<15}" + "  ".join(parts))
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--distinct", type=int, default=50, help="distinct payloads cycled per scenario")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes for the app")
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--jitter-ms", type=float, default=50)
+    parser.add_argument("--tps", type=float, default=50)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--model-latency-ms", default="", help="per-model mock latency, e.g. model-a=5000,model-b=200")
+    parser.add_argument("--model-error-rate", default="", help="per-model mock error rate, e.g. model-a=1")
+    parser.add_argument("--env", action="append", default=[], help="extra KEY=VALUE for the app (repeatable)")
+    parser.add_argument("--verbose", action="store_true", help="show the app's request log")
+    parser.add_argument("--label", default="run")
+    parser.add_argument("--compare", help="saved result JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed relative regression")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    return parser
+
+
+def run(args):
+    """Boots the mock LLM and the app, drives every scenario and returns {scenario: result}."""
+    workdir = tempfile.mkdtemp(prefix="excuse-bench-")
+    mock_port, app_port = free_port(), free_port()
+    mock_url, base_url = f"http://127.0.0.1:{mock_port}", f"http://127.0.0.1:{app_port}"
+
+    mock_env = {
+        **os.environ,
+        "MOCK_LLM_LATENCY_MS": str(args.latency_ms), "MOCK_LLM_JITTER_MS": str(args.jitter_ms),
+        "MOCK_LLM_TPS": str(args.tps), "MOCK_LLM_ERROR_RATE": str(args.error_rate),
+        "MOCK_LLM_ERROR_STATUS": str(args.error_status),
+        "MOCK_LLM_MODEL_LATENCY_MS": args.model_latency_ms, "MOCK_LLM_MODEL_ERROR_RATE": args.model_error_rate,
+    }
+    app_env = {
+        **os.environ,
+        "OPENROUTER_BASE_URL": f"{mock_url}/v1",
+        "OPENROUTER_API_KEY": "bench",
+        "EXCUSE_DB_PATH": os.path.join(workdir, "excuse_store.db"),
+        "SCREENSHOT_BACKEND": "local",
+        "DISABLE_AUDIO": "1",
+        # Tells the app it runs multi-worker, which switches on the shared state backend
+        "WEB_CONCURRENCY": str(args.workers),
+        **dict(kv.split("=", 1) for kv in args.env),
+    }
+
+    procs = []
+    try:
+        procs.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "bench.mock_llm:app", "--port", str(mock_port), "--log-level", "warning"],
+            cwd=REPO, env=mock_env,
+        ))
+        wait_ready(f"{mock_url}/stats")
+        app_proc = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", REPO, "--port", str(app_port),
+             "--workers", str(args.workers), "--log-level", "warning"],
+            cwd=workdir, env=app_env, stdout=None if args.verbose else subprocess.DEVNULL,
+        )
+        procs.append(app_proc)
+        wait_ready(f"{base_url}/")
+
+        results = {}
+        for scenario in [s.strip() for s in args.scenarios.split(",") if s.strip()]:
+            print(f"▶ {scenario}: {args.requests} requests @ concurrency {args.concurrency} ({args.workers} worker(s))")
+            results[scenario] = run_scenario(args, scenario, app_proc, base_url, mock_url, workdir)
+            if app_proc.poll() is not None:
+                raise RuntimeError(f"The app exited with status {app_proc.returncode} during '{scenario}'; rerun with --verbose")
+    finally:
+        for proc in reversed(procs):
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+    return results
+
+
+def save(args, results, extra=None):
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    out = os.path.join(RESULTS_DIR, f"{stamp}-{args.label}.json")
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump({
+            "label": args.label,
+            "timestamp": stamp,
+            "commit": git_commit(),
+            "config": {k: v for k, v in vars(args).items() if k not in ("compare", "fail_on_regression")},
+            "results": results,
+            **(extra or {}),
+        }, f, indent=2)
+    print(f"\n💾 Saved {out}")
+    return out
+
+
+def main():
+    args = build_parser().parse_args()
+    results = run(args)
+    print_table(results)
+    save(args, results)
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        if regressions:
+            print("\n⚠️ Regressions beyond threshold:\n  " + "\n  ".join(regressions))
+            if args.fail_on_regression:
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Worker scaling benchmark: the same load against 1, 2, 4... uvicorn workers.
+
+    python -m bench.scaling --worker-counts 1,2,4 --scenarios excuse,guilt,rankings --concurrency 64
+
+Runs bench.run_bench once per worker count (each with a fresh database, WEB_CONCURRENCY set so the
+app uses the shared SQLite state backend above one worker) and reports requests/sec per scenario plus
+scaling efficiency, rps(N) / (N * rps(1)). Keep the mock latency low so the app, not the mock LLM,
+is the bottleneck; counts above the number of CPU cores cannot scale.
+"""
+import os
+import copy
+from bench.run_bench import build_parser, run, save
+
+
+def efficiency(rps, base_rps, workers):
+    if not rps or not base_rps:
+        return None
+    return round(rps / (base_rps * workers), 3)
+
+
+def main():
+    parser = build_parser()
+    parser.description = __doc__
+    parser.set_defaults(scenarios="excuse,guilt,rankings", concurrency=64, requests=600, latency_ms=20, jitter_ms=5, tps=2000, label="scaling")
+    parser.add_argument("--worker-counts", default="1,2,4", help="comma-separated worker counts to compare")
+    args = parser.parse_args()
+
+    counts = [int(n) for n in args.worker_counts.split(",") if n.strip()]
+    cores = os.cpu_count() or 1
+    if max(counts) > cores:
+        print(f"⚠️ Only {cores} CPU core(s); worker counts above that will not scale")
+
+    runs = {}
+    for n in counts:
+        run_args = copy.copy(args)
+        run_args.workers = n
+        runs[n] = run(run_args)
+
+    base = counts[0]
+    scenarios = list(runs[base])
+    print(f"\n{'scenario':<15}" + "".join(f"{f'{n}w req/s':>12}{f'{n}w eff':>9}{f'{n}w p95':>10}" for n in counts))
+    summary = {}
+    for scenario in scenarios:
+        row = f"{scenario:<15}"
+        base_rps = runs[base][scenario]["rps"]
+        for n in counts:
+            r = runs[n][scenario]
+            eff = efficiency(r["rps"], base_rps, n / base)
+            summary.setdefault(scenario, {})[n] = {"rps": r["rps"], "efficiency": eff, "p95_ms": r["p95_ms"]}
+            row += f"{r['rps']:>12}{eff if eff is not None else '-':>9}{r['p95_ms']:>10}"
+        print(row)
+
+    save(args, {f"{n}w": results for n, results in runs.items()}, {"scaling": summary, "cpu_count": cores})
+
+
+if __name__ == "__main__":
+    main()
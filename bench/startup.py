@@ -0,0 +1,123 @@
+"""Startup benchmark: import time and time-to-first-successful-request, lazy vs eager startup.
+
+    python -m bench.startup --runs 5
+
+For each mode (LAZY_STARTUP=1 / 0) and run, in a fresh scratch directory and database:
+  import    seconds for `import main` in a new interpreter
+  ready     seconds from spawning uvicorn until GET / answers 200
+  first     seconds from spawning uvicorn until POST /api/excuse returns an excuse (mock LLM)
+Medians are printed and saved under bench/results/.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+from datetime import datetime
+import httpx
+from bench.run_bench import REPO, RESULTS_DIR, free_port, wait_ready, git_commit
+
+MODES = {"lazy": "1", "eager": "0"}
+EXCUSE = {"scenario": "late for stand-up", "urgency": "high", "language": "en", "style": "professional"}
+
+
+def app_env(mode, workdir, mock_url):
+    return {
+        **os.environ,
+        "LAZY_STARTUP": MODES[mode],
+        "OPENROUTER_BASE_URL": f"{mock_url}/v1",
+        "OPENROUTER_API_KEY": "bench",
+        "EXCUSE_DB_PATH": os.path.join(workdir, "excuse_store.db"),
+        "SCREENSHOT_BACKEND": "local",
+        "DISABLE_AUDIO": "1",
+    }
+
+
+def measure_import(env, workdir):
+    code = f"import sys, time; sys.path.insert(0, {REPO!r}); t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, "-c", code], cwd=workdir, env=env, capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def poll(fn, deadline):
+    while time.perf_counter() < deadline:
+        try:
+            if fn():
+                return time.perf_counter()
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.01)
+    raise RuntimeError("timed out waiting for the app")
+
+
+def measure_server(env, workdir, timeout):
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", REPO, "--port", str(port), "--log-level", "warning"],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL,
+    )
+    try:
+        deadline = start + timeout
+        ready = poll(lambda: httpx.get(f"{base}/", timeout=1.0).status_code == 200, deadline)
+        first = poll(lambda: "english" in httpx.post(f"{base}/api/excuse", json=EXCUSE, timeout=timeout).json(), deadline)
+        return ready - start, first - start
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--modes", default="lazy,eager")
+    parser.add_argument("--latency-ms", type=float, default=50, help="mock LLM time to first token")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--label", default="startup")
+    args = parser.parse_args()
+
+    mock_port = free_port()
+    mock_url = f"http://127.0.0.1:{mock_port}"
+    mock = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "bench.mock_llm:app", "--port", str(mock_port), "--log-level", "warning"],
+        cwd=REPO, env={**os.environ, "MOCK_LLM_LATENCY_MS": str(args.latency_ms), "MOCK_LLM_JITTER_MS": "0", "MOCK_LLM_TPS": "1000"},
+    )
+    results = {}
+    try:
+        wait_ready(f"{mock_url}/stats")
+        for mode in [m.strip() for m in args.modes.split(",") if m.strip()]:
+            samples = {"import": [], "ready": [], "first": []}
+            for i in range(args.runs):
+                workdir = tempfile.mkdtemp(prefix="excuse-startup-")
+                env = app_env(mode, workdir, mock_url)
+                samples["import"].append(measure_import(env, workdir))
+                ready, first = measure_server(env, tempfile.mkdtemp(prefix="excuse-startup-"), args.timeout)
+                samples["ready"].append(ready)
+                samples["first"].append(first)
+                print(f"▶ {mode} run {i + 1}: import {samples['import'][-1]:.3f}s  ready {ready:.3f}s  first {first:.3f}s")
+            results[mode] = {f"{k}_s": round(statistics.median(v), 3) for k, v in samples.items()}
+    finally:
+        mock.terminate()
+        mock.wait(timeout=10)
+
+    print(f"\n{'mode':<8}{'import s':>10}{'ready s':>10}{'first s':>10}")
+    for mode, r in results.items():
+        print(f"{mode:<8}{r['import_s']:>10}{r['ready_s']:>10}{r['first_s']:>10}")
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    out = os.path.join(RESULTS_DIR, f"{stamp}-{args.label}.json")
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump({"label": args.label, "timestamp": stamp, "commit": git_commit(), "config": vars(args), "results": results}, f, indent=2)
+    print(f"\n💾 Saved {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,13 @@ const API_BASE = (window.location.hostname === "127.0.0.1" || window.location.ho
     ? "http://127.0.0.1:8000"
     : "https://auc6-intelligent-excuse-generator.hf.space";
 
+// Per-browser session so history, favorites and screenshots are not shared with other users
+const SESSION_ID = localStorage.getItem("sessionId") || (() => {
+    const id = (crypto.randomUUID ? crypto.randomUUID() : `${Date.now()}-${Math.random().toString(36).slice(2)}`).replace(/[^A-Za-z0-9_-]/g, "");
+    localStorage.setItem("sessionId", id);
+    return id;
+})();
+
 // --- 1. TOAST NOTIFICATIONS (Replaces native alerts) ---
 function showToast(message, type = 'info') {
     let toastContainer = document.getElementById('toast-container');
@@ -33,7 +40,7 @@ window.alert = (msg) => showToast(msg, 'info');
 
 // --- 2. CENTRALIZED API CALLER ---
 async function callApi(endpoint, body = null) {
-    const options = { headers: { "Content-Type": "application/json" } };
+    const options = { headers: { "Content-Type": "application/json", "X-Session-ID": SESSION_ID } };
     if (body) {
         options.method = "POST";
         options.body = JSON.stringify(body);
@@ -43,6 +50,11 @@ async function callApi(endpoint, body = null) {
         const url = new URL(`${API_BASE}${endpoint}`, window.location.origin);
         if (options.method === "GET") url.searchParams.append("_t", Date.now());
         const res = await fetch(url.toString(), options);
+        if (res.status === 503) {
+            // Model throttled: the backend says how long to wait
+            const data = await res.json().catch(() => null);
+            if (data && data.error) { showToast(data.error, "error"); return null; }
+        }
         if (!res.ok) { throw new Error(`HTTP error! status: ${res.status}`); }
         return await res.json();
     } catch (err) {
@@ -292,7 +304,7 @@ async function removeFavorite(endpoint, text, btnElement) {
 
     const options = {
         method: "DELETE",
-        headers: { "Content-Type": "application/json" },
+        headers: { "Content-Type": "application/json", "X-Session-ID": SESSION_ID },
         body: JSON.stringify({ text })
     };
 
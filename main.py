@@ -1,27 +1,52 @@
 import os
 import json
 import uuid
-import shelve
-import requests
 import re
-from openai import OpenAI
+import time
+import asyncio
+import threading
 from fastapi import FastAPI, Body, Depends, HTTPException, Response, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, FileResponse, JSONResponse
+from fastapi.responses import HTMLResponse, FileResponse, JSONResponse, StreamingResponse
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from email.message import EmailMessage
 from datetime import datetime
-from typing import Optional
+from typing import Optional, List
 from pydantic import BaseModel
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.date import DateTrigger
 from dotenv import load_dotenv
 
 # Note: Ensure utils/openai_handler.py is updated to use OpenRouter as discussed previously
 from utils.openai_handler import (
     generate_excuse,
     generate_apology,
+    excuse_prompt,
+    apology_prompt,
+    stream_completion,
+    translate,
+    close_client,
+    get_client,
+    response_cache,
+    translation_cache,
+    llm_flights,
+    candidate_pool,
+    RESPONSE_CACHE_ENABLED,
+    MODEL_NAME,
+    limiter_stats,
+    router,
 )
+from utils.ratelimit import UpstreamBusy, EMERGENCY, INTERACTIVE, BACKGROUND
+from utils.cache import make_key
+from utils.postprocess import strip_reasoning, postprocess, OutputCleaner
+from utils.routing import parse_budgets, start_budget
+from utils import storage, prompts, metrics, shared_state
+from utils.jobs import job_queue, QueueFull
+from utils.mailer import mailer
+from utils.event_log import emergency_log
+from utils.sessions import sessions, SESSION_HEADER, SESSION_COOKIE
+from utils.rankings import apology_breakdown, URGENCY_POINTS
+from utils.renderer import render_cache, render_card, render_card_sync, load_image_bytes, local_render_path, close_renderer
+from utils.prewarm import pool_warmer, PREWARM_INTERVAL
 
 # ============ Environment & Files =============
 load_dotenv()
@@ -39,47 +64,140 @@ required = ["OPENROUTER_API_KEY", "HCTI_API_USER", "HCTI_API_KEY"]
 if not OPENROUTER_API_KEY:
     print("⚠️ Missing OPENROUTER_API_KEY")
 
-# ============ File Setup =============
+# ============ Storage Setup =============
+# Legacy JSON files, imported once into the SQLite store (utils/storage.py)
 EXCUSE_SCORE_FILE = "smart_scores.json"
 EXCUSE_CAL_FILE = "excuse_calendar.json"
 APOLOGY_SCORE_FILE = "apology_scores.json"
 APOLOGY_CAL_FILE = "apology_calendar.json"
 
-for fname in [EXCUSE_SCORE_FILE, APOLOGY_SCORE_FILE]:
-    if not os.path.exists(fname):
-        with open(fname, "w", encoding="utf-8") as f:
-            json.dump({}, f)
-for fname in [EXCUSE_CAL_FILE, APOLOGY_CAL_FILE]:
-    if not os.path.exists(fname):
-        with open(fname, "w", encoding="utf-8") as f:
-            json.dump([], f)
+def bootstrap_storage():
+    # Runs from lifespan, so importing main stays free of file and database I/O
+    storage.init_db()
+    storage.migrate_json_files(
+        {"excuse": EXCUSE_SCORE_FILE, "apology": APOLOGY_SCORE_FILE},
+        {"excuse": EXCUSE_CAL_FILE, "apology": APOLOGY_CAL_FILE},
+    )
+
+# Batch generation limits
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "50"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
 
 # ============ State =============
-excuse_history = []
-favorite_excuses = []
-apology_history = []
-favorite_apologies = []
-latest_text = ""
-latest_label = ""
-latest_excuse = None
-latest_apology = None
+# Per-client history/favorites/latest result live in the session store (utils/sessions.py)
+def current_session(request: Request, response: Response) -> str:
+    """Session ID from the X-Session-ID header or session cookie; a new one is issued otherwise."""
+    sid = request.headers.get(SESSION_HEADER) or request.cookies.get(SESSION_COOKIE)
+    if not sessions.valid_id(sid):
+        sid = sessions.new_id()
+        response.set_cookie(SESSION_COOKIE, sid, max_age=30 * 86400, httponly=True, samesite="none", secure=True)
+    response.headers[SESSION_HEADER] = sid
+    return sid
 
 # ========== OpenRouter Client =========
-# Handling moved to utils.openai_handler.py
-MODEL_NAME = "nvidia/nemotron-nano-12b-v2-vl:free"
+# Handling (and model routing, LLM_MODELS) moved to utils.openai_handler.py
 
 # ============ FastAPI & CORS ============
 from contextlib import asynccontextmanager
 
+# Lazy startup (default): the app reports ready once storage and the job queue are up; the
+# scheduler and the OpenAI client (the slow imports) are built on a background thread right after,
+# or on first use if a request gets there first. LAZY_STARTUP=0 builds everything before ready.
+LAZY_STARTUP = os.getenv("LAZY_STARTUP", "1") == "1"
+
+def warm_up():
+    started = time.perf_counter()
+    try:
+        get_scheduler()
+        get_client()
+    except Exception as e:
+        print("⚠️ Warm-up failed:", e)
+        return
+    print(f"🔥 Warm-up finished in {time.perf_counter() - started:.2f}s")
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Start scheduler only after Uvicorn forks the main process
-    scheduler.start()
+    # Start scheduler and job workers only after Uvicorn forks the main process
+    bootstrap_storage()
+    job_queue.start()
+    pool_warmer.attach(asyncio.get_running_loop())
+    if LAZY_STARTUP:
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    else:
+        warm_up()
+    if shared_state.ENABLED:
+        leader.start()
     yield
-    scheduler.shutdown()
+    if shared_state.ENABLED:
+        leader.stop()
+    if _scheduler is not None:
+        _scheduler.shutdown()
+    job_queue.stop()
+    mailer.close()
+    await close_client()
+    await close_renderer()
 
 app = FastAPI(lifespan=lifespan)
-scheduler = BackgroundScheduler()
+
+# Scheduled emergencies are persisted in the SQLite store so they survive restarts. The job store
+# keeps an index on next_run_time, so each wakeup only reads the jobs that are due.
+SCHEDULE_TABLE = "scheduled_emergencies"
+SCHEDULE_MISFIRE_GRACE = int(os.getenv("SCHEDULE_MISFIRE_GRACE", "3600"))
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler():
+    """Builds and starts the scheduler once (APScheduler + SQLAlchemy take a while to import)."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            from apscheduler.schedulers.background import BackgroundScheduler
+            from apscheduler.jobstores.memory import MemoryJobStore
+            from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+            ensure_schedule_table()
+            scheduler = BackgroundScheduler(
+                jobstores={
+                    "default": MemoryJobStore(),
+                    "emergencies": SQLAlchemyJobStore(url=f"sqlite:///{storage.DB_PATH}", tablename=SCHEDULE_TABLE),
+                },
+                job_defaults={"misfire_grace_time": SCHEDULE_MISFIRE_GRACE, "coalesce": True},
+            )
+            scheduler.add_job(fallback_calendar_sync, "interval", minutes=FALLBACK_SYNC_MINUTES, id="fallback", replace_existing=True)
+            if pool_warmer.enabled:
+                scheduler.add_job(pool_warmer.run, "interval", seconds=PREWARM_INTERVAL, id="prewarm", replace_existing=True, max_instances=1)
+            # With several workers every one can add/cancel scheduled jobs; only the elected leader runs them
+            scheduler.start(paused=shared_state.ENABLED and not leader.is_leader)
+            _scheduler = scheduler
+    return _scheduler
+
+def ensure_schedule_table():
+    """APScheduler checks for its table and then creates it, which races when several workers start
+    at once; creating it up front (same layout) with IF NOT EXISTS is atomic."""
+    storage.connect().executescript(f"""
+        CREATE TABLE IF NOT EXISTS {SCHEDULE_TABLE} (
+            id VARCHAR(191) NOT NULL PRIMARY KEY,
+            next_run_time FLOAT,
+            job_state BLOB NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS ix_{SCHEDULE_TABLE}_next_run_time ON {SCHEDULE_TABLE} (next_run_time);
+    """)
+
+def leader_tick():
+    # Jobs added by other workers only reach this scheduler through its job store, so poll it
+    get_scheduler().wakeup()
+    job_queue.requeue_stale()
+    if hasattr(sessions, "prune"):
+        sessions.prune()
+
+# With several uvicorn workers, one holds the lease and runs the scheduler; the rest take over
+# within LEADER_LEASE_TTL seconds if it dies.
+leader = shared_state.LeaderElector(
+    "scheduler",
+    ttl=float(os.getenv("LEADER_LEASE_TTL", "15")),
+    on_elected=lambda: get_scheduler().resume(),
+    on_demoted=lambda: get_scheduler().pause(),
+    on_tick=leader_tick,
+)
 
 # --- CRITICAL: CORS FOR GITHUB PAGES ---
 app.add_middleware(
@@ -96,6 +214,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# The upstream limiter (utils/ratelimit.py) gives up with UpstreamBusy when the model is throttling
+@app.exception_handler(UpstreamBusy)
+async def upstream_busy(request: Request, exc: UpstreamBusy):
+    return JSONResponse(
+        {"error": str(exc), "retry_after": exc.retry_after},
+        status_code=503,
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+def excuse_priority(urgency):
+    # Critical excuses are the emergency path, so they jump the upstream queue
+    return EMERGENCY if urgency == "critical" else INTERACTIVE
+
 # ============ Pydantic Models ============
 class ExcuseInput(BaseModel):
     scenario: str
@@ -110,6 +241,12 @@ class ApologyInput(BaseModel):
     style: str
     language: str = "en"
 
+class ExcuseBatchInput(BaseModel):
+    items: List[ExcuseInput]
+
+class ApologyBatchInput(BaseModel):
+    items: List[ApologyInput]
+
 class DeleteFavoritePayload(BaseModel):
     text: str
 
@@ -140,46 +277,34 @@ class SaveApologyText(BaseModel):
 class AutoCompleteInput(BaseModel):
     prompt: str
 
-# ============ HCTI Screenshot Utility ============
-def generate_screenshot(type="excuse"):
-    content = latest_excuse if type == "excuse" else latest_apology or "No data"
-    html = f"""
-    <html>
-      <body style="font-family: Inter; padding: 2em; background: #fff;">
-        <h1>{type.title()}</h1>
-        <p>{content}</p>
-      </body>
-    </html>
-    """
-    try:
-        res = requests.post("https://hcti.io/v1/image", auth=(HCTI_API_USER, HCTI_API_KEY), data={"html": html})
-        data = res.json()
-        return {"url": data.get("url")}
-    except Exception as e:
-        print("❌ Screenshot error:", e)
-        return {"error": str(e)}
+# ============ Persistence Helpers ============
+# Storage calls are blocking; async routes hand them to the threadpool.
+def record_excuses(sid, items):
+    """items: [(english, urgency), ...] – the last one becomes the latest excuse."""
+    # Session edits may hit the shared SQLite store, so they run here rather than on the event loop
+    time_now = datetime.now().strftime("%Y-%m-%d %H:%M")
+    with sessions.edit(sid) as session:
+        session.latest_text = session.latest_excuse = items[-1][0]
+        session.latest_label = "Excuse"
+        session.excuse_history.extend({"text": english, "time": time_now} for english, _ in items)
+    # Ranking + Calendar Logic (one transaction for the whole batch)
+    now = datetime.now()
+    storage.record_generations("excuse", [
+        (english, now.strftime("%Y-%m-%d"), now.strftime("%I:%M:%S %p"), URGENCY_POINTS.get(urgency, 0))
+        for english, urgency in items
+    ])
 
-def render_screenshot_html(main_text, label, theme):
-    logo_url = "https://aarushch.github.io/Intelligent-Excuse-Generator/static/images/logo.png"
-    
-    bg_gradient = {
-        "light": "linear-gradient(135deg, #fefcea 0%, #f1da36 100%)",
-        "dark": "linear-gradient(135deg, #1b263b 0%, #415a77 100%)"
-    }.get(theme, "linear-gradient(135deg, #fefcea 0%, #f1da36 100%)")
-    text_color = "#fff" if theme == "dark" else "#222"
-
-    html = f"""
-    <div style='
-        width: 600px; padding: 48px 36px; border-radius: 0; font-family: Inter, Rajdhani, Arial, sans-serif;
-        background: {bg_gradient}; box-shadow: 0 10px 40px rgba(0,0,0,0.15); color: {text_color}; position: relative;
-    '>
-        <div style='font-size: 14px; font-weight: bold; color: {text_color}; margin-bottom: 8px; opacity: 0.8;'>{label} – Intelligent Excuse Generator</div>
-        <div style='font-size: 24px; font-weight: 700; line-height: 1.4;'>{main_text}</div>
-        <img src="{logo_url}" style="position:absolute;bottom:20px;left:20px;width:50px;opacity:0.85;" />
-        <div style='position: absolute; bottom: 18px; right: 24px; font-size: 12px; opacity: 0.6;'>Generated on {datetime.now().strftime('%Y-%m-%d')}</div>
-    </div>
-    """
-    return html
+def record_apologies(sid, texts):
+    time_now = datetime.now().strftime("%Y-%m-%d %H:%M")
+    with sessions.edit(sid) as session:
+        session.latest_text = session.latest_apology = texts[-1]
+        session.latest_label = "Apology"
+        session.apology_history.extend({"text": english, "time": time_now} for english in texts)
+    # Scoring + Calendar Logic (one transaction for the whole batch)
+    now = datetime.now()
+    storage.record_generations("apology", [
+        (english, now.strftime("%Y-%m-%d"), now.strftime("%I:%M %p"), 0) for english in texts
+    ])
 
 # ============ Main Routes ============
 
@@ -191,90 +316,131 @@ def api_root():
         "frontend_url": "https://aarushch.github.io/Intelligent-Excuse-Generator/"
     }
 
+async def finish_excuses(sid, results):
+    """Updates session/history/scores/calendar for [(english, translated, urgency), ...] and builds the responses."""
+    await run_in_threadpool(record_excuses, sid, [(english, urgency) for english, _, urgency in results])
+    return [{"label": "Excuse", "english": english, "translated": translated} for english, translated, _ in results]
+
+async def finish_apologies(sid, results):
+    """Updates session/history/scores/calendar for [(english, translated), ...] and builds the responses."""
+    await run_in_threadpool(record_apologies, sid, [english for english, _ in results])
+    return [{"message": english, "translated": translated} for english, translated in results]
+
+async def finish_excuse(sid, english, translated, urgency):
+    return (await finish_excuses(sid, [(english, translated, urgency)]))[0]
+
+async def finish_apology(sid, english, translated):
+    return (await finish_apologies(sid, [(english, translated)]))[0]
+
 @app.post("/api/excuse")
-def generate_excuse_from_openai(payload: ExcuseInput):
-    global latest_text, latest_label, latest_excuse
-    english, translated = generate_excuse(
-        payload.scenario, payload.urgency, payload.language, payload.style
+async def generate_excuse_from_openai(payload: ExcuseInput, sid: str = Depends(current_session)):
+    english, translated = await generate_excuse(
+        payload.scenario, payload.urgency, payload.language, payload.style, excuse_priority(payload.urgency)
     )
-    latest_text = english
-    latest_label = "Excuse"
-    time_now = datetime.now().strftime("%Y-%m-%d %H:%M")
-    excuse_history.append({"text": english, "time": time_now})
-    with open("latest_excuse.txt", "w", encoding="utf-8") as f:
-        f.write(english)
-    
-    # Ranking Logic
-    with open(EXCUSE_SCORE_FILE, "r+", encoding="utf-8") as f:
-        try:
-            scores = json.load(f)
-        except Exception:
-            scores = {}
-        entry = scores.get(english, {"count": 0, "urgency_score": 0, "favorited": False})
-        entry["count"] += 1
-        if payload.urgency == "high": entry["urgency_score"] += 2
-        elif payload.urgency == "critical": entry["urgency_score"] += 4
-        elif payload.urgency == "medium": entry["urgency_score"] += 1
-        scores[english] = entry
-        f.seek(0); f.truncate(); json.dump(scores, f, indent=2, ensure_ascii=False)
-    
-    # Calendar Logic
-    now = datetime.now()
-    entry = {"text": english, "date": now.strftime("%Y-%m-%d"), "time": now.strftime("%I:%M:%S %p")}
-    with open(EXCUSE_CAL_FILE, "r+", encoding="utf-8") as f:
-        try:
-            data = json.load(f)
-            if not isinstance(data, list): data = []
-        except Exception:
-            data = []
-        data.append(entry)
-        f.seek(0); f.truncate(); json.dump(data, f, indent=2)
-    latest_excuse = english
-    return {"label": "Excuse", "english": english, "translated": translated}
+    return await finish_excuse(sid, english, translated, payload.urgency)
 
 @app.post("/api/apology")
-def create_apology(payload: ApologyInput):
-    global latest_text, latest_label, latest_apology
-    english, translated = generate_apology(payload.context, payload.tone, payload.type, payload.style, payload.language)
-    latest_text = english
-    latest_label = "Apology"
-    latest_apology = english
-    with open("latest_apology.txt", "w", encoding="utf-8") as f:
-        f.write(english)
-    apology_history.append({"text": english, "time": datetime.now().strftime("%Y-%m-%d %H:%M")})
-    
-    # Scoring Logic
-    with open(APOLOGY_SCORE_FILE, "r+", encoding="utf-8") as f:
-        try:
-            scores = json.load(f)
-        except Exception:
-            scores = {}
-        entry = scores.get(english, {"count": 0})
-        entry["count"] += 1
-        scores[english] = entry
-        f.seek(0); f.truncate(); json.dump(scores, f, indent=2, ensure_ascii=False)
-    
-    # Calendar Logic
-    now = datetime.now()
-    cal_entry = {"text": english, "date": now.strftime("%Y-%m-%d"), "time": now.strftime("%I:%M %p")}
-    with open(APOLOGY_CAL_FILE, "r+", encoding="utf-8") as f:
-        try:
-            data = json.load(f)
-        except:
-            data = []
-        data.append(cal_entry)
-        f.seek(0); f.truncate(); json.dump(data, f, indent=2)
-    return {"message": english, "translated": translated}
+async def create_apology(payload: ApologyInput, sid: str = Depends(current_session)):
+    english, translated = await generate_apology(payload.context, payload.tone, payload.type, payload.style, payload.language)
+    return await finish_apology(sid, english, translated)
+
+# ============ Batch Routes ============
+async def gather_bounded(calls, limit):
+    """Runs zero-arg coroutine functions concurrently, at most `limit` at a time, keeping order."""
+    semaphore = asyncio.Semaphore(limit)
+    async def run(call):
+        async with semaphore:
+            return await call()
+    return await asyncio.gather(*(run(call) for call in calls))
+
+def check_batch_size(items):
+    if not items:
+        raise HTTPException(status_code=400, detail="Batch is empty")
+    if len(items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batch too large (max {BATCH_MAX_ITEMS} items)")
+
+@app.post("/api/excuse/batch")
+async def generate_excuse_batch(payload: ExcuseBatchInput, sid: str = Depends(current_session)):
+    check_batch_size(payload.items)
+    generated = await gather_bounded([
+        lambda item=item: generate_excuse(item.scenario, item.urgency, item.language, item.style, excuse_priority(item.urgency), fresh=True)
+        for item in payload.items
+    ], BATCH_CONCURRENCY)
+    results = [(english, translated, item.urgency) for (english, translated), item in zip(generated, payload.items)]
+    return {"results": await finish_excuses(sid, results)}
+
+@app.post("/api/apology/batch")
+async def create_apology_batch(payload: ApologyBatchInput, sid: str = Depends(current_session)):
+    check_batch_size(payload.items)
+    generated = await gather_bounded([
+        lambda item=item: generate_apology(item.context, item.tone, item.type, item.style, item.language, fresh=True)
+        for item in payload.items
+    ], BATCH_CONCURRENCY)
+    return {"results": await finish_apologies(sid, generated)}
+
+# ============ Streaming (SSE) Routes ============
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def sse_generation(prompt, finalize, priority=INTERACTIVE):
+    """Streams 'token' events as the model writes, then one 'done' event with finalize(answer), where
+    answer is the cleaned text (postprocess of the full response, worked out as it streamed)."""
+    cleaner = OutputCleaner()
+    started = False
+    try:
+        async for delta in stream_completion([{"role": "user", "content": prompt}], priority=priority, cleaner=cleaner):
+            if not started:
+                delta = delta.lstrip()
+                if not delta: continue
+                started = True
+            yield sse_event("token", {"text": delta})
+        yield sse_event("done", await finalize(cleaner.cleaned()))
+    except UpstreamBusy as e:
+        yield sse_event("error", {"error": str(e), "retry_after": e.retry_after})
+    except Exception as e:
+        print("❌ Stream error:", e)
+        yield sse_event("error", {"error": str(e)})
+
+def sse_response(generator, response: Response | None = None):
+    """An event stream; pass the route's Response to keep the session header/cookie set by current_session."""
+    streaming = StreamingResponse(generator, media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    if response is not None:
+        # FastAPI only merges these into responses it builds itself, not into a returned Response
+        streaming.headers.raw.extend(response.headers.raw)
+    return streaming
+
+async def translate_or_fail(english, language):
+    if language == "en": return english
+    try:
+        return await translate(english, language)
+    except Exception as e:
+        print("❌ Translation error:", e)
+        return "Translation failed."
+
+@app.post("/api/excuse/stream")
+async def stream_excuse(payload: ExcuseInput, response: Response, sid: str = Depends(current_session)):
+    async def finalize(english):
+        translated = await translate_or_fail(english, payload.language)
+        return await finish_excuse(sid, english, translated, payload.urgency)
+    prompt = excuse_prompt(payload.scenario, payload.urgency, payload.style)
+    return sse_response(sse_generation(prompt, finalize, excuse_priority(payload.urgency)), response)
+
+@app.post("/api/apology/stream")
+async def stream_apology(payload: ApologyInput, response: Response, sid: str = Depends(current_session)):
+    async def finalize(english):
+        translated = await translate_or_fail(english, payload.language)
+        return await finish_apology(sid, english, translated)
+    prompt = apology_prompt(payload.context, payload.tone, payload.type, payload.style)
+    return sse_response(sse_generation(prompt, finalize), response)
 
 @app.get("/api/history")
-def api_excuse_history():
-    return {"history": excuse_history}
+def api_excuse_history(sid: str = Depends(current_session)):
+    return {"history": list(sessions.get(sid).excuse_history)}
 
 @app.get("/api/calendar")
 def api_excuse_calendar():
     try:
-        with open(EXCUSE_CAL_FILE, encoding="utf-8") as fh:
-            return json.load(fh)
+        return storage.calendar_entries("excuse")
     except Exception:
         return []
 
@@ -288,69 +454,159 @@ def download_screenshot():
     return FileResponse(path=file_path, media_type="image/png", filename="excuse.png", headers={"Access-Control-Allow-Origin": "*"})
 
 @app.get("/api/favorites")
-def api_excuse_favorites():
-    return {"favorites": favorite_excuses}
+def api_excuse_favorites(sid: str = Depends(current_session)):
+    return {"favorites": list(sessions.get(sid).favorite_excuses)}
 
 @app.post("/api/favorite")
-def api_add_excuse_fav():
-    global latest_text, latest_label
-    if not latest_text or latest_label != "Excuse": return {"action": "error", "message": "⚠️ No excuse to save."}
-    
-    if latest_text in favorite_excuses:
-        favorite_excuses.remove(latest_text)
-        try:
-            with open(EXCUSE_SCORE_FILE, "r+", encoding="utf-8") as fh:
-                scores = json.load(fh)
-                if latest_text in scores:
-                    scores[latest_text]["favorited"] = False
-                fh.seek(0); fh.truncate(); json.dump(scores, fh, indent=2)
+def api_add_excuse_fav(sid: str = Depends(current_session)):
+    with sessions.edit(sid) as session:
+        latest_text = session.latest_text
+        if not latest_text or session.latest_label != "Excuse": return {"action": "error", "message": "⚠️ No excuse to save."}
+        removed = latest_text in session.favorite_excuses
+        if removed: session.favorite_excuses.remove(latest_text)
+        else: session.favorite_excuses.append(latest_text)
+
+    if removed:
+        try: storage.set_favorited("excuse", latest_text, False)
         except Exception: pass
         return {"action": "removed", "message": "🗑️ Unfavorited!"}
         
-    favorite_excuses.append(latest_text)
     try:
-        with open(EXCUSE_SCORE_FILE, "r+", encoding="utf-8") as fh:
-            try: scores = json.load(fh)
-            except: scores = {}
-            scores.setdefault(latest_text, {"count": 0, "urgency_score": 0})
-            scores[latest_text]["favorited"] = True
-            fh.seek(0); fh.truncate(); json.dump(scores, fh, indent=2)
+        storage.set_favorited("excuse", latest_text, True)
     except Exception:
         pass
     return {"action": "added", "message": "✅ Saved!"}
 
 @app.delete("/api/favorite")
-def api_remove_excuse_fav(payload: DeleteFavoritePayload):
+def api_remove_excuse_fav(payload: DeleteFavoritePayload, sid: str = Depends(current_session)):
     text = payload.text
-    if text in favorite_excuses:
-        favorite_excuses.remove(text)
+    with sessions.edit(sid) as session:
+        found = text in session.favorite_excuses
+        if found: session.favorite_excuses.remove(text)
+    if found:
         try:
-            with open(EXCUSE_SCORE_FILE, "r+", encoding="utf-8") as fh:
-                scores = json.load(fh)
-                if text in scores:
-                    scores[text]["favorited"] = False
-                fh.seek(0); fh.truncate(); json.dump(scores, fh, indent=2)
+            storage.set_favorited("excuse", text, False)
         except Exception:
             pass
         return {"message": "🗑️ Removed from favorites"}
     return {"message": "Item not found in favorites."}
 
 @app.post("/api/clear-favorites")
-def api_clear_favorites():
-    favorite_excuses.clear()
-    try:
-        with open(EXCUSE_SCORE_FILE, "r+", encoding="utf-8") as fh:
-            scores = json.load(fh)
-            for k in scores: scores[k]["favorited"] = False
-            fh.seek(0); fh.truncate(); json.dump(scores, fh, indent=2)
-    except Exception: pass
+def api_clear_favorites(sid: str = Depends(current_session)):
+    with sessions.edit(sid) as session:
+        cleared = list(session.favorite_excuses)
+        session.favorite_excuses.clear()
+    # Only this session's favorites lose their flag; other sessions keep their ranking bonus
+    for text in cleared:
+        try: storage.set_favorited("excuse", text, False)
+        except Exception: pass
     return {"status": "cleared"}
 
-def trigger_emergency_internal(recipient_override: dict | None = None, screenshot_url: str | None = None):
-    excuse  = open("latest_excuse.txt", "r", encoding="utf-8").read().strip() if os.path.exists("latest_excuse.txt") else "No excuse."
-    apology = open("latest_apology.txt", "r", encoding="utf-8").read().strip() if os.path.exists("latest_apology.txt") else "No apology."
+# ============ Emergency Jobs ============
+# Each emergency is split into independent jobs on the persistent queue (utils/jobs.py).
+def send_emergency_email(job):
+    excuse, apology, recipients = job["excuse"], job["apology"], job["recipients"]
+    screenshot_url = job.get("screenshot_url")
+    EMAIL_SENDER     = os.getenv("EMAIL_USERNAME")
+    uid   = uuid.uuid4().hex[:8]
+    stamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    img_data = None
+    # Dynamically generate screenshot proof instead of relying on frontend cached files
+    try:
+        import requests
+        
+        # If the frontend explicitly provided the screenshot URL they just generated, use exactly that one!
+        if screenshot_url:
+            try:
+                img_data = requests.get(screenshot_url, timeout=10).content
+            except Exception as e:
+                print("⚠️ Failed to download frontend screenshot URL, falling back to autonomous generation:", e)
+        
+        # If no URL was provided from the frontend, securely rebuild it autonomously
+        if not img_data:
+            # Intelligently decide whether to screenshot the Excuse, the Apology, or both
+            has_excuse = excuse and excuse != "No excuse."
+            has_apology = apology and apology != "No apology."
+            
+            proof_text = excuse if has_excuse else apology
+            proof_title = "Excuse" if has_excuse else "Apology"
+            if has_excuse and has_apology:
+                proof_text = f"{excuse}\n\n{apology}"
+                proof_title = "Excuse & Apology"
+            
+            # Same cached render pipeline as the screenshot endpoints
+            img_data = load_image_bytes(render_card_sync(proof_text, proof_title, "light"))
+        
+    except Exception as e:
+        print("⚠️ Could not dynamically generate emergency screenshot:", e)
+        
+    # One message per recipient, all sent over the shared mail session
+    def build_message(to):
+        msg = EmailMessage()
+        msg["Subject"] = f"🚨 Emergency Alert [{stamp}] – ID:{uid}"
+        msg["From"] = EMAIL_SENDER
+        msg["To"] = to
+        msg.set_content(f"📝 Excuse:\n{excuse}\n\n🙏 Apology:\n{apology}")
+        if img_data:
+            msg.add_attachment(img_data, maintype="image", subtype="png", filename="proof.png")
+        return msg
+
+    try:
+        failed = mailer.send_batch([build_message(to) for to in recipients])
+    except Exception as e:
+        err = str(e)
+        if "Network is unreachable" in err or "101" in err:
+            print("⚠️ Email skipped: Network blocks standard SMTP outgoing ports on this host.")
+            print("💡 Hint: Generate a token.json using auth_gmail.py to bypass this firewall!")
+        else:
+            print("❌ Email error:", e)
+        # Let the job queue retry with backoff
+        raise
+    if failed:
+        # Only the recipients that failed are retried (the queue saves the updated payload)
+        job["recipients"] = [msg["To"] for msg, _ in failed]
+        raise RuntimeError(f"Email failed for {', '.join(job['recipients'])}: {failed[0][1]}")
+    print(f"✅ Emergency email sent to {len(recipients)} recipient(s) via {'Gmail REST API' if mailer.uses_gmail_api() else 'SMTP'}!")
+        
+def play_siren(job):
+    import platform
+    if platform.system() == "Linux" or os.environ.get('DISABLE_AUDIO'):
+        print("⚠️ Audio disabled on Linux server to prevent libgthread warnings.")
+        return
+
+    try:
+        import pygame
+        # Suppress prompt output by capturing it
+        pygame.mixer.init()
+        # Path must be relative or absolute. static/alert.mp3 needs to exist in repo
+        if os.path.exists("static/alert.mp3"):
+            pygame.mixer.music.load("static/alert.mp3")
+            pygame.mixer.music.set_volume(1.0)
+            pygame.mixer.music.play()
+    except ImportError:
+        print("⚠️ pygame not installed. Siren disabled.")
+    except Exception as e:
+        print("❌ Sound error:", e)
+        
+def log_event(job):
+    entry = {"timestamp": job["timestamp"], "excuse": job["excuse"], "apology": job["apology"], "recipients": job["recipients"]}
+    try:
+        emergency_log.append(entry)
+    except Exception as e:
+        print("❌ Logging error:", e)
+        raise
+
+job_queue.register("emergency_email", send_emergency_email, max_attempts=int(os.getenv("EMAIL_MAX_ATTEMPTS", "5")))
+job_queue.register("emergency_siren", play_siren, max_attempts=1)
+job_queue.register("emergency_log", log_event, max_attempts=3)
+
+def trigger_emergency_internal(recipient_override: dict | None = None, screenshot_url: str | None = None,
+                               excuse: str | None = None, apology: str | None = None):
+    """Queues the email, siren and log jobs for one emergency; raises QueueFull under backpressure.
+    The excuse/apology come from the caller's session (captured at scheduling time for scheduled runs)."""
+    excuse = excuse or "No excuse."
+    apology = apology or "No apology."
     EMAIL_SENDER     = os.getenv("EMAIL_USERNAME")
-    EMAIL_PASSWORD   = os.getenv("EMAIL_PASSWORD")
     default_list = [r.strip() for r in os.getenv("EMAIL_RECIPIENTS", "").split(",") if r.strip()]
     input_list = []
     if recipient_override and recipient_override.get("email"):
@@ -359,423 +615,276 @@ def trigger_emergency_internal(recipient_override: dict | None = None, screensho
     recipients = input_list if input_list else default_list
     if not recipients: recipients = [EMAIL_SENDER]
     
-    def send_email():
-        uid   = uuid.uuid4().hex[:8]
-        stamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        msg = EmailMessage()
-        msg["Subject"] = f"🚨 Emergency Alert [{stamp}] – ID:{uid}"
-        msg["From"] = EMAIL_SENDER
-        msg["To"] = ", ".join(recipients)
-        msg.set_content(f"📝 Excuse:\n{excuse}\n\n🙏 Apology:\n{apology}")
-        # Dynamically generate screenshot proof instead of relying on frontend cached files
-        try:
-            import requests
-            
-            img_data = None
-            
-            # If the frontend explicitly provided the screenshot URL they just generated, use exactly that one!
-            if screenshot_url:
-                try:
-                    img_data = requests.get(screenshot_url, timeout=10).content
-                except Exception as e:
-                    print("⚠️ Failed to download frontend screenshot URL, falling back to autonomous generation:", e)
-            
-            # If no URL was provided from the frontend, securely rebuild it autonomously
-            if not img_data:
-                # Intelligently decide whether to screenshot the Excuse, the Apology, or both
-                has_excuse = excuse and excuse != "No excuse."
-                has_apology = apology and apology != "No apology."
-                
-                proof_text = excuse if has_excuse else apology
-                proof_title = "Excuse" if has_excuse else "Apology"
-                if has_excuse and has_apology:
-                    proof_text = f"{excuse}\n\n{apology}"
-                    proof_title = "Excuse & Apology"
-                
-                html = render_screenshot_html(proof_text, proof_title, "light")
-                res = requests.post(
-                    "https://hcti.io/v1/image", 
-                    data={'html': html, 'css': '', 'google_fonts': 'Inter:700;Rajdhani:700'}, 
-                    auth=(HCTI_API_USER, HCTI_API_KEY),
-                    timeout=10
-                )
-                img_url = res.json().get("url")
-                if img_url:
-                    img_data = requests.get(img_url, timeout=10).content
-            
-            if img_data:
-                msg.add_attachment(img_data, maintype="image", subtype="png", filename="proof.png")
-                
-        except Exception as e:
-            print("⚠️ Could not dynamically generate emergency screenshot:", e)
-            
-        try:
-            # Check for Gmail API Tokens to bypass HF SMTP Blocks (Port 465/587)
-            if os.path.exists("token.json") or TOKEN_JSON_CONTENT:
-                from google.oauth2.credentials import Credentials
-                from googleapiclient.discovery import build
-                from googleapiclient.errors import HttpError
-                import base64
-                import json
-                
-                scopes = ["https://www.googleapis.com/auth/gmail.send"]
-                if TOKEN_JSON_CONTENT:
-                    creds_data = json.loads(TOKEN_JSON_CONTENT)
-                    creds = Credentials.from_authorized_user_info(creds_data, scopes)
-                else:
-                    creds = Credentials.from_authorized_user_file("token.json", scopes)
-                service = build("gmail", "v1", credentials=creds)
-                
-                # Gmail API requires the standard email message to be url-safe base64 encoded
-                raw_msg = base64.urlsafe_b64encode(msg.as_bytes()).decode()
-                create_message = {"raw": raw_msg}
-                
-                service.users().messages().send(userId="me", body=create_message).execute()
-                print("✅ Email sent successfully via Gmail REST API!")
-                return
-                
-            # Fallback to standard SMTP if tokens are missing
-            import smtplib
-            try:
-                with smtplib.SMTP_SSL("smtp.gmail.com", 465, timeout=5) as smtp:
-                    smtp.login(EMAIL_SENDER, EMAIL_PASSWORD)
-                    smtp.send_message(msg)
-            except OSError:
-                with smtplib.SMTP("smtp.gmail.com", 587, timeout=5) as smtp:
-                    smtp.starttls()
-                    smtp.login(EMAIL_SENDER, EMAIL_PASSWORD)
-                    smtp.send_message(msg)
-                    
-        except Exception as e:
-            err = str(e)
-            if "Network is unreachable" in err or "101" in err:
-                print("⚠️ Email skipped: Network blocks standard SMTP outgoing ports on this host.")
-                print("💡 Hint: Generate a token.json using auth_gmail.py to bypass this firewall!")
-            else:
-                print("❌ Email error:", e)
-            
-    def play_siren():
-        import platform
-        if platform.system() == "Linux" or os.environ.get('DISABLE_AUDIO'):
-            print("⚠️ Audio disabled on Linux server to prevent libgthread warnings.")
-            return
-
-        try:
-            import pygame
-            # Suppress prompt output by capturing it
-            pygame.mixer.init()
-            # Path must be relative or absolute. static/alert.mp3 needs to exist in repo
-            if os.path.exists("static/alert.mp3"):
-                pygame.mixer.music.load("static/alert.mp3")
-                pygame.mixer.music.set_volume(1.0)
-                pygame.mixer.music.play()
-        except ImportError:
-            print("⚠️ pygame not installed. Siren disabled.")
-        except Exception as e:
-            print("❌ Sound error:", e)
-            
-    def log_event():
-        entry = {"timestamp": str(datetime.now()), "excuse": excuse, "apology": apology, "recipients": recipients}
-        try:
-            logf = "emergency_log.json"
-            data = json.load(open(logf, "r", encoding="utf-8")) if os.path.exists(logf) else []
-            data.append(entry)
-            json.dump(data, open(logf, "w", encoding="utf-8"), indent=2, ensure_ascii=False)
-        except Exception as e:
-            print("❌ Logging error:", e)
-            
-    import threading
-    threading.Thread(target=send_email).start()
-    threading.Thread(target=play_siren).start()
-    threading.Thread(target=log_event).start()
+    job = {
+        "excuse": excuse, "apology": apology, "recipients": recipients,
+        "screenshot_url": screenshot_url, "timestamp": str(datetime.now()),
+    }
+    # All three or none: a full queue must not leave half an emergency behind
+    email, siren, log = job_queue.enqueue_many([("emergency_email", job), ("emergency_siren", job), ("emergency_log", job)])
+    return {"email": email, "siren": siren, "log": log}
 
 @app.post("/api/emergency")
-def api_trigger_emergency(payload: EmergencyInput):
-    trigger_emergency_internal(payload.model_dump(), screenshot_url=payload.screenshot_url)
-    return {"status": "ok"}
+def api_trigger_emergency(payload: EmergencyInput, sid: str = Depends(current_session)):
+    session = sessions.get(sid)
+    # Only this client's own results: the latest_*.txt fallback holds whatever any user generated last
+    if not session.latest_excuse and not session.latest_apology:
+        raise HTTPException(status_code=400, detail="Generate an excuse or apology first.")
+    try:
+        jobs = trigger_emergency_internal(payload.model_dump(), screenshot_url=payload.screenshot_url,
+                                          excuse=session.latest_excuse or "No excuse.",
+                                          apology=session.latest_apology or "No apology.")
+    except QueueFull:
+        raise HTTPException(status_code=503, detail="Emergency queue is full, try again shortly.", headers={"Retry-After": "30"})
+    return {"status": "ok", "jobs": jobs}
+
+@app.get("/api/jobs")
+def api_job_stats():
+    return job_queue.stats()
+
+@app.get("/api/jobs/{job_id}")
+def api_job_status(job_id: str):
+    job = job_queue.get(job_id)
+    if not job: raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 @app.get("/api/apology-history")
-def api_apology_history():
-    return {"history": apology_history}
+def api_apology_history(sid: str = Depends(current_session)):
+    return {"history": list(sessions.get(sid).apology_history)}
 
 @app.post("/api/save-apology-history")
-def save_apology_history(payload: SaveApologyText):
-    global latest_text, latest_label
-    latest_text = payload.text
-    latest_label = "Apology"
+def save_apology_history(payload: SaveApologyText, sid: str = Depends(current_session)):
     now = datetime.now().strftime("%Y-%m-%d %H:%M")
-    if not any(i["text"] == payload.text for i in apology_history):
-        apology_history.append({"text": payload.text, "time": now})
-    cal_entry = {"text": payload.text, "date": datetime.now().strftime("%Y-%m-%d"), "time": datetime.now().strftime("%I:%M %p")}
-    with open(APOLOGY_CAL_FILE, "r+", encoding="utf-8") as f:
-        try:
-            data = json.load(f)
-        except:
-            data = []
-        data.append(cal_entry)
-        f.seek(0); f.truncate(); json.dump(data, f, indent=2)
+    with sessions.edit(sid) as session:
+        session.latest_text = payload.text
+        session.latest_label = "Apology"
+        if not any(i["text"] == payload.text for i in session.apology_history):
+            session.apology_history.append({"text": payload.text, "time": now})
+    storage.add_calendar("apology", payload.text, datetime.now().strftime("%Y-%m-%d"), datetime.now().strftime("%I:%M %p"))
     return {"message": "✅ Apology saved to history and calendar."}
 
 @app.get("/api/apology-calendar")
 def api_apology_calendar():
     try:
-        with open(APOLOGY_CAL_FILE, encoding="utf-8") as fh:
-            return json.load(fh)
+        return storage.calendar_entries("apology")
     except Exception:
         return []
 
 @app.post("/api/apology-favorite")
-def api_save_apology_fav():
-    global latest_text, latest_label
-    if not latest_text or latest_label != "Apology": return {"action": "error", "message": "⚠️ No apology to save."}
-    
-    if latest_text in favorite_apologies:
-        favorite_apologies.remove(latest_text)
-        try:
-            with open(APOLOGY_SCORE_FILE, "r+", encoding="utf-8") as fh:
-                scores = json.load(fh)
-                if latest_text in scores: scores[latest_text]["favorited"] = False
-                fh.seek(0); fh.truncate(); json.dump(scores, fh, indent=2)
+def api_save_apology_fav(sid: str = Depends(current_session)):
+    with sessions.edit(sid) as session:
+        latest_text = session.latest_text
+        if not latest_text or session.latest_label != "Apology": return {"action": "error", "message": "⚠️ No apology to save."}
+        removed = latest_text in session.favorite_apologies
+        if removed: session.favorite_apologies.remove(latest_text)
+        else: session.favorite_apologies.append(latest_text)
+
+    if removed:
+        try: storage.set_favorited("apology", latest_text, False)
         except Exception: pass
         return {"action": "removed", "message": "🗑️ Unfavorited!"}
         
-    favorite_apologies.append(latest_text)
     try:
-        with open(APOLOGY_SCORE_FILE, "r+", encoding="utf-8") as fh:
-            try: scores = json.load(fh)
-            except: scores = {}
-            scores.setdefault(latest_text, {"count": 0, "favorited": False})
-            scores[latest_text]["favorited"] = True
-            fh.seek(0); fh.truncate(); json.dump(scores, fh, indent=2)
+        storage.set_favorited("apology", latest_text, True)
     except Exception as e:
         pass
     return {"action": "added", "message": "✅ Saved!"}
 
 @app.delete("/api/apology-favorite")
-def api_remove_apology_fav(payload: DeleteFavoritePayload):
+def api_remove_apology_fav(payload: DeleteFavoritePayload, sid: str = Depends(current_session)):
     text = payload.text
-    if text in favorite_apologies:
-        favorite_apologies.remove(text)
+    with sessions.edit(sid) as session:
+        found = text in session.favorite_apologies
+        if found: session.favorite_apologies.remove(text)
+    if found:
         try:
-            with open(APOLOGY_SCORE_FILE, "r+", encoding="utf-8") as fh:
-                scores = json.load(fh)
-                if text in scores:
-                    scores[text]["favorited"] = False
-                fh.seek(0); fh.truncate(); json.dump(scores, fh, indent=2)
+            storage.set_favorited("apology", text, False)
         except Exception:
             pass
         return {"message": "🗑️ Removed from favorites"}
     return {"message": "Item not found in favorites."}
 
 @app.post("/api/clear-apology-favorites")
-def api_clear_apology_favorites():
-    favorite_apologies.clear()
-    try:
-        with open(APOLOGY_SCORE_FILE, "r+", encoding="utf-8") as fh:
-            scores = json.load(fh)
-            for k in scores: scores[k]["favorited"] = False
-            fh.seek(0); fh.truncate(); json.dump(scores, fh, indent=2)
-    except Exception: pass
+def api_clear_apology_favorites(sid: str = Depends(current_session)):
+    with sessions.edit(sid) as session:
+        cleared = list(session.favorite_apologies)
+        session.favorite_apologies.clear()
+    for text in cleared:
+        try: storage.set_favorited("apology", text, False)
+        except Exception: pass
     return {"status": "cleared"}
 
 @app.get("/api/apology-favorites")
-def api_get_apology_favorites():
-    return {"favorites": favorite_apologies}
+def api_get_apology_favorites(sid: str = Depends(current_session)):
+    return {"favorites": list(sessions.get(sid).favorite_apologies)}
 
 @app.get("/api/top-apologies")
-def api_top_apologies():
+def api_top_apologies(limit: int = 10, offset: int = 0):
+    # Scores are precomputed at write time; this is just a page off the ranking index
+    limit, offset = min(max(limit, 1), 100), max(offset, 0)
     try:
-        data = json.load(open(APOLOGY_SCORE_FILE, encoding="utf-8"))
+        rows = storage.top_scores("apology", limit, offset)
     except Exception:
-        data = {}
-    ranked = []
-    for txt, meta in data.items():
-        usage_count = meta.get("count", 0)
-        tone_bonus = 0
-        text_lower = txt.lower()
-        if any(word in text_lower for word in ["deeply", "sincerely", "truly", "heartfelt"]): tone_bonus += 2
-        if any(word in text_lower for word in ["sorry", "apologize", "regret", "mistake"]): tone_bonus += 1
-        length_bonus = min(len(txt) // 100, 3)
-        favorite_bonus = 2 if meta.get("favorited", False) else 0
-        recency_bonus = 1 if usage_count > 0 else 0
-        final_score = usage_count + tone_bonus + length_bonus + favorite_bonus + recency_bonus
-        ranked.append({
-            "text": txt, "score": final_score, "count": usage_count,
-            "favorited": meta.get("favorited", False),
-            "breakdown": {"usage": usage_count, "tone": tone_bonus, "length": length_bonus, "favorite": favorite_bonus, "recency": recency_bonus}
-        })
-    ranked.sort(key=lambda x: (x["score"], x["count"]), reverse=True)
-    return ranked
+        rows = []
+    return [
+        {
+            "text": r["text"], "score": r["score"], "count": r["count"],
+            "favorited": bool(r["favorited"]),
+            "breakdown": apology_breakdown(r["count"], r["tone_bonus"], r["length_bonus"], r["favorited"])
+        }
+        for r in rows
+    ]
 
 @app.post("/api/clear-apology-rankings")
 def api_clear_apology_rankings():
-    json.dump({}, open(APOLOGY_SCORE_FILE, "w", encoding="utf-8"))
+    storage.clear_scores("apology")
     return {"message": "Top apologies cleared."}
 
 @app.get("/api/rankings")
-def api_excuse_rankings():
+def api_excuse_rankings(limit: int = 10, offset: int = 0):
+    limit, offset = min(max(limit, 1), 100), max(offset, 0)
     try:
-        data = json.load(open(EXCUSE_SCORE_FILE, encoding="utf-8"))
+        rows = storage.top_scores("excuse", limit, offset)
     except Exception:
         return []
-    ranked = [
-        {"text": txt, "score": info.get("count", 0) + info.get("urgency_score", 0) + (3 if info.get("favorited") else 0), "count": info.get("count", 0)}
-        for txt, info in data.items()
-    ]
-    ranked.sort(key=lambda x: x["score"], reverse=True)
-    return ranked
+    return [{"text": r["text"], "score": r["score"], "count": r["count"]} for r in rows]
 
 @app.post("/api/clear-rankings")
 def api_clear_excuse_rankings():
-    json.dump({}, open(EXCUSE_SCORE_FILE, "w", encoding="utf-8"))
+    storage.clear_scores("excuse")
     return {"message": "Smart rankings cleared."}
 
+def public_image_url(request: Request, result: dict):
+    # Local renders are served by this backend; hosted (HCTI) renders already have a URL
+    if result.get("path"):
+        return str(request.url_for("get_rendered_image", name=os.path.basename(result["path"])))
+    return result.get("url", "")
+
 @app.post("/api/screenshot-excuse")
-def screenshot_excuse(payload: dict = Body(None)):
+async def screenshot_excuse(request: Request, payload: dict = Body(None), sid: str = Depends(current_session)):
     try:
+        latest_excuse = (await run_in_threadpool(sessions.get, sid)).latest_excuse
         if not latest_excuse: return {"error": "No excuse available to screenshot."}
         theme = payload.get("theme", "light") if payload else "light"
-        html = render_screenshot_html(latest_excuse, "Excuse", theme)
-        res = requests.post("https://hcti.io/v1/image", data={'html': html, 'css': '', 'google_fonts': 'Inter:700;Rajdhani:700'}, auth=(HCTI_API_USER, HCTI_API_KEY))
-        link = res.json().get("url", "")
-        return {"url": link}
+        return {"url": public_image_url(request, await render_card(latest_excuse, "Excuse", theme))}
     except Exception as e:
         print("❌ Screenshot Excuse Error:", e)
         return {"error": str(e)}
 
 @app.post("/api/screenshot-apology")
-def screenshot_apology(payload: dict = Body(None)):
+async def screenshot_apology(request: Request, payload: dict = Body(None), sid: str = Depends(current_session)):
     try:
+        latest_apology = (await run_in_threadpool(sessions.get, sid)).latest_apology
         if not latest_apology: return {"error": "No apology available to screenshot."}
         theme = payload.get("theme", "light") if payload else "light"
-        html = render_screenshot_html(latest_apology, "Apology", theme)
-        res = requests.post("https://hcti.io/v1/image", data={'html': html, 'css': '', 'google_fonts': 'Inter:700;Rajdhani:700'}, auth=(HCTI_API_USER, HCTI_API_KEY))
-        link = res.json().get("url", "")
-        return {"url": link}
+        return {"url": public_image_url(request, await render_card(latest_apology, "Apology", theme))}
     except Exception as e:
         print("❌ Screenshot Apology Error:", e)
         return {"error": str(e)}
 
+@app.get("/api/render/{name}", name="get_rendered_image")
+def get_rendered_image(name: str):
+    path = local_render_path(name)
+    if not path: raise HTTPException(status_code=404, detail="Render not found")
+    return FileResponse(path=path, media_type="image/png", headers={"Access-Control-Allow-Origin": "*"})
+
 # ============ UPDATED OPENROUTER ENDPOINTS ============
 
 @app.post("/api/adjust-tone")
-def adjust_tone(payload: dict = Body(...)):
+async def adjust_tone(payload: dict = Body(...)):
     sentence = payload.get("sentence", "")
     tone = payload.get("tone", "formal")
     if not sentence: return {"error": "No sentence provided"}
     
-    prompt = f"Rephrase the following text in a {tone.lower()} tone:\n\n{sentence}\n\nDo not add any extra commentary, timestamps, or headings."
+    prompt = prompts.render("tone.rephrase", tone=tone.lower(), sentence=sentence)
     
     try:
-        # Import the secure client
+        # Import the shared async client
         import utils.openai_handler as openai_handler
-        client = openai_handler.client
-        MODEL_NAME = openai_handler.MODEL_NAME
         
         # Using OpenRouter + Nemotron with Reasoning
-        res = client.chat.completions.create(
-            model=MODEL_NAME,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7,
-            extra_body={"reasoning": {"enabled": True}}
-        )
+        content = await openai_handler.chat_completion([{"role": "user", "content": prompt}])
         return {
-            "adjusted": res.choices[0].message.content.strip(),
+            "adjusted": content.strip(),
             "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         }
+    except UpstreamBusy:
+        raise
     except Exception as e:
         return {"error": str(e)}
     
+def completion_prompt(start, tone):
+    return prompts.render("apology.complete", tone=tone.lower(), start=start)
+
+PUNCTUATION = re.compile(r'[^\w\s]')
+
+def merge_completion(start, continuation):
+    # Helper to avoid doubling up words
+    def normalize(text): return PUNCTUATION.sub('', text).lower().strip()
+    norm_start = normalize(start)
+    norm_cont = normalize(continuation)
+    
+    if norm_cont.startswith(norm_start):
+        lower_cont = continuation.lower()
+        lower_start = start.lower()
+        if lower_cont.startswith(lower_start):
+            trimmed = continuation[len(start):].lstrip(" ,.:;\n")
+            return f"{start} {trimmed}"
+        return continuation
+    return f"{continuation}"
+
 @app.post("/api/complete-apology")
-def complete_apology(payload: dict = Body(...)):
-    import re
+async def complete_apology(payload: dict = Body(...)):
     start = payload.get("start", "").strip()
     tone = payload.get("tone", "formal").strip()
     if not start: return {"error": "No start provided"}
     
-    prompt = f"Complete this sentence in a {tone.lower()} apology tone:\n\n{start}\n\nCRITICAL: Return ONLY the completion text itself. Do not include quotes, conversational filler, or explanations of why it works."
+    prompt = completion_prompt(start, tone)
     
     try:
-        # Import the secure client
+        # Import the shared async client
         import utils.openai_handler as openai_handler
-        client = openai_handler.client
-        MODEL_NAME = openai_handler.MODEL_NAME
         
         # Using OpenRouter + Nemotron with Reasoning
-        res = client.chat.completions.create(
-            model=MODEL_NAME,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7,
-            extra_body={"reasoning": {"enabled": True}}
-        )
-        # 1) Import strip_reasoning and clean_llm_text to clean the output BEFORE treating it as logic
-        strip_reasoning = openai_handler.strip_reasoning
-        clean_llm_text = openai_handler.clean_llm_text
-        continuation = clean_llm_text(strip_reasoning(res.choices[0].message.content))
-        
-        # Helper to avoid doubling up words
-        def normalize(text): return re.sub(r'[^\w\s]', '', text).lower().strip()
-        norm_start = normalize(start)
-        norm_cont = normalize(continuation)
-        
-        if norm_cont.startswith(norm_start):
-            lower_cont = continuation.lower()
-            lower_start = start.lower()
-            if lower_cont.startswith(lower_start):
-                trimmed = continuation[len(start):].lstrip(" ,.:;\n")
-                full_apology = f"{start} {trimmed}"
-            else:
-                full_apology = continuation
-        else:
-            full_apology = f"{continuation}"
-            
-        return {"completed": full_apology}
+        content = await openai_handler.chat_completion([{"role": "user", "content": prompt}])
+        # Clean the output BEFORE treating it as logic
+        continuation = postprocess(content)
+        return {"completed": merge_completion(start, continuation)}
+    except UpstreamBusy:
+        raise
     except Exception as e:
         return {"error": str(e)}
 
-guilt_cache = {}
+@app.post("/api/complete-apology/stream")
+async def stream_complete_apology(payload: dict = Body(...)):
+    start = payload.get("start", "").strip()
+    tone = payload.get("tone", "formal").strip()
+    if not start: return {"error": "No start provided"}
+    
+    async def finalize(continuation):
+        return {"completed": merge_completion(start, continuation)}
+    return sse_response(sse_generation(completion_prompt(start, tone), finalize))
+
+guilt_cache = shared_state.cache_or_local(
+    "guilt",
+    max_size=int(os.getenv("GUILT_CACHE_SIZE", "2048")),
+    ttl=float(os.getenv("GUILT_CACHE_TTL", "86400")),
+)
 
-@app.post("/api/guilt-score")
-def api_guilt_score(payload: dict = Body(...)):
-    text = payload.get("text", "")
-    if text in guilt_cache:
-        return {"feedback": guilt_cache[text]}
-        
-    rubric = (
-        "Calibrate on this rubric:\n"
-        "  1‑20  : clearly insincere / no guilt\n"
-        "  21‑40 : weak apology / low guilt\n"
-        "  41‑60 : neutral / average guilt\n"
-        "  61‑80 : sincere but not extreme\n"
-        "  81‑100: very strong guilt / deeply sorry\n\n"
-    )
-    prompt = (
-        f"{rubric}"
-        "You must answer in **exactly** this JSON format:\n"
-        '{ "score": <number>, "reason": "<≤25‑word explanation>" }\n\n'
-        "Apology text:\n"
-        f"{text}\n"
-        "----\nNow respond:"
-    )
+async def score_guilt(prompt, cache_key):
     try:
-        # Import the secure client
+        # Import the shared async client
         import utils.openai_handler as openai_handler
-        client = openai_handler.client
-        MODEL_NAME = openai_handler.MODEL_NAME
         
         # Using OpenRouter + Nemotron with Reasoning
-        res = client.chat.completions.create(
-            model=MODEL_NAME,
-            messages=[{"role": "user", "content": prompt}],
+        content = await openai_handler.chat_completion(
+            [{"role": "user", "content": prompt}],
             temperature=1.0,
             top_p=0.95,
-            extra_body={"reasoning": {"enabled": True}}
+            priority=BACKGROUND,
         )
-        # Import strip_reasoning to strip <think> tokens before doing regex or JSON parsing
-        strip_reasoning = openai_handler.strip_reasoning
-        raw = strip_reasoning(res.choices[0].message.content)
+        # Strip <think> tokens before doing regex or JSON parsing
+        raw = strip_reasoning(content)
         
-        import re
         try:
             data = json.loads(raw)
         except json.JSONDecodeError:
@@ -785,55 +894,118 @@ def api_guilt_score(payload: dict = Body(...)):
             data = {"score": int(m.group(1)), "reason": m.group(2)}
             
         feedback = f'{data["score"]}/100 – {data["reason"]}'
-        guilt_cache[text] = feedback
+        await guilt_cache.aput(cache_key, feedback)
         return {"feedback": feedback}
+    except UpstreamBusy:
+        raise
     except Exception as e:
         return {"error": str(e)}
 
+@app.post("/api/guilt-score")
+async def api_guilt_score(payload: dict = Body(...)):
+    text = payload.get("text", "")
+    prompt = prompts.render("guilt.score", text=text)
+    cache_key = make_key(prompt.id, MODEL_NAME, temperature=1.0, top_p=0.95)
+    cached = await guilt_cache.aget(cache_key)
+    if cached:
+        return {"feedback": cached}
+    # Identical texts scored concurrently share one upstream call
+    return await llm_flights.do(cache_key, score_guilt, prompt, cache_key)
+
+@app.get("/api/prompts")
+def api_prompts():
+    return {"templates": prompts.registry.catalog()}
+
+@app.get("/api/cache-stats")
+def api_cache_stats():
+    return {
+        "response_cache": {"enabled": RESPONSE_CACHE_ENABLED, **response_cache.stats()},
+        "guilt_cache": guilt_cache.stats(),
+        "translation_cache": translation_cache.stats(),
+        "single_flight": llm_flights.stats(),
+        "render_cache": render_cache.stats(),
+        "sessions": sessions.stats(),
+        "llm_limiter": limiter_stats(),
+        "llm_router": router.stats(),
+        "candidate_pool": candidate_pool.stats(),
+        "prewarm": pool_warmer.stats(),
+        "worker": {"pid": os.getpid(), "state_backend": "sqlite" if shared_state.ENABLED else "memory", "scheduler_leader": leader.is_leader or not shared_state.ENABLED},
+    }
+
 @app.get("/api/memory")
-def api_memory_lookup(q: str):
-    q = q.strip().lower()
-    hits = []
+def api_memory_lookup(q: str, limit: int = 5):
+    # Indexed search over every stored excuse/apology (see storage.search_texts)
     try:
-        with shelve.open("memory.db") as memory_db:
-            for kw, excuses in memory_db.items():
-                if q in kw: hits.extend(excuses)
+        matches = storage.search_texts(q, min(max(limit, 1), 50))
     except Exception as e:
         return {"error": f"Memory DB access failed: {str(e)}"}
-    return {"matches": list(dict.fromkeys(hits))[:5]}
+    return {"matches": matches}
 
 @app.post("/api/schedule")
-def schedule_emergency(input: ScheduleInput):
+def schedule_emergency(input: ScheduleInput, sid: str = Depends(current_session)):
+    from apscheduler.triggers.date import DateTrigger
+    # The alert sends what this client has now, not whatever anyone generated last by the time it fires
+    session = sessions.get(sid)
+    if not session.latest_excuse and not session.latest_apology:
+        raise HTTPException(status_code=400, detail="Generate an excuse or apology first.")
     try:
         dt = datetime.strptime(f"{input.date} {input.time}", "%Y-%m-%d %H:%M")
         if dt <= datetime.now(): raise ValueError("Scheduled time must be in the future")
         job_id = uuid.uuid4().hex[:8]
-        scheduler.add_job(
+        get_scheduler().add_job(
             func=trigger_emergency_internal,
             trigger=DateTrigger(run_date=dt),
-            args=[{"email": input.email} if input.email else None, input.screenshot_url],
+            args=[{"email": input.email} if input.email else None, input.screenshot_url,
+                  session.latest_excuse, session.latest_apology],
             id=job_id,
+            jobstore="emergencies",
             replace_existing=True
         )
-        return {"message": f"📅 Emergency scheduled for {dt.strftime('%Y-%m-%d %H:%M')}!"}
+        return {"message": f"📅 Emergency scheduled for {dt.strftime('%Y-%m-%d %H:%M')}!", "id": job_id}
     except Exception as e:
         return {"error": f"❌ Scheduling failed: {str(e)}"}
 
+@app.get("/api/schedule")
+def list_scheduled(limit: int = 50, offset: int = 0):
+    # Page straight off the job store's next_run_time index instead of loading every job
+    limit, offset = min(max(limit, 1), 500), max(offset, 0)
+    scheduler = get_scheduler()
+    conn = storage.connect()
+    total = conn.execute(f"SELECT COUNT(*) FROM {SCHEDULE_TABLE}").fetchone()[0]
+    rows = conn.execute(
+        f"SELECT id FROM {SCHEDULE_TABLE} ORDER BY next_run_time LIMIT ? OFFSET ?", (limit, offset)
+    ).fetchall()
+    jobs = []
+    for row in rows:
+        job = scheduler.get_job(row["id"], jobstore="emergencies")
+        if job is None: continue
+        override, screenshot_url = (list(job.args) + [None, None])[:2]
+        jobs.append({
+            "id": job.id,
+            "run_at": job.next_run_time.strftime("%Y-%m-%d %H:%M") if job.next_run_time else None,
+            "email": (override or {}).get("email"),
+            "screenshot_url": screenshot_url,
+        })
+    return {"total": total, "jobs": jobs}
+
+@app.delete("/api/schedule/{job_id}")
+def cancel_scheduled(job_id: str):
+    from apscheduler.jobstores.base import JobLookupError
+    try:
+        get_scheduler().remove_job(job_id, jobstore="emergencies")
+    except JobLookupError:
+        raise HTTPException(status_code=404, detail="Scheduled emergency not found")
+    return {"status": "cancelled", "id": job_id}
+
+FALLBACK_SYNC_MINUTES = 30
+
 def fallback_calendar_sync():
-    global latest_text, latest_label
-    if not latest_text: return
-    target = EXCUSE_CAL_FILE if latest_label == "Excuse" else APOLOGY_CAL_FILE
+    # Every session that was active since the last run gets its latest result onto the calendar
     now = datetime.now()
-    entry = {"text": latest_text, "date": now.strftime("%Y-%m-%d"), "time": now.strftime("%I:%M %p")}
-    if not os.path.exists(target):
-        json.dump([entry], open(target, "w", encoding="utf-8"), indent=2)
-        return
-    data = json.load(open(target, encoding="utf-8"))
-    if all(e["text"] != latest_text for e in data):
-        data.append(entry)
-        json.dump(data, open(target, "w", encoding="utf-8"), indent=2)
-
-scheduler.add_job(fallback_calendar_sync, "interval", minutes=30, id="fallback", replace_existing=True)
+    for session in sessions.active_since(time.time() - FALLBACK_SYNC_MINUTES * 60):
+        if not session.latest_text: continue
+        kind = "excuse" if session.latest_label == "Excuse" else "apology"
+        storage.add_calendar_if_missing(kind, session.latest_text, now.strftime("%Y-%m-%d"), now.strftime("%I:%M %p"))
 
 security = HTTPBasic()
 def verify_admin(credentials: HTTPBasicCredentials = Depends(security)):
@@ -842,33 +1014,94 @@ def verify_admin(credentials: HTTPBasicCredentials = Depends(security)):
     return credentials.username
 
 @app.get("/admin", response_class=JSONResponse)
-def admin_panel(request: Request):
-    logs = json.load(open("emergency_log.json", encoding="utf-8")) if os.path.exists("emergency_log.json") else []
-    return {"logs": logs}
+def admin_panel(request: Request, limit: int = 50, offset: int = 0, since: Optional[str] = None, until: Optional[str] = None):
+    # Newest first, read backwards from the end of the log
+    limit, offset = min(max(limit, 1), 500), max(offset, 0)
+    logs, has_more = emergency_log.page(limit, offset, since, until)
+    return {"logs": logs, "next_offset": offset + limit if has_more else None}
+
+@app.get("/admin/tail")
+def admin_tail(n: int = 20):
+    return {"logs": emergency_log.tail(min(max(n, 1), 500))}
+
+@app.get("/admin/export")
+def admin_export(since: Optional[str] = None, until: Optional[str] = None):
+    # Streams the filtered log as JSON lines (oldest first) without holding it in memory
+    lines = (json.dumps(e, ensure_ascii=False) + "\n" for e in emergency_log.iter_entries(since, until, newest_first=False))
+    return StreamingResponse(lines, media_type="application/x-ndjson")
 
 @app.post("/api/update-latest-apology")
-def update_latest_apology(payload: dict = Body(...)):
-    global latest_text, latest_label
+def update_latest_apology(payload: dict = Body(...), sid: str = Depends(current_session)):
     apology_text = payload.get("text", "")
     if apology_text:
-        latest_text = apology_text
-        latest_label = "Apology"
+        with sessions.edit(sid) as session:
+            session.latest_text = apology_text
+            session.latest_label = "Apology"
         now = datetime.now()
-        cal_entry = {"text": apology_text, "date": now.strftime("%Y-%m-%d"), "time": now.strftime("%I:%M %p")}
-        try:
-            with open(APOLOGY_CAL_FILE, "r+", encoding="utf-8") as f:
-                data = json.load(f)
-                data.append(cal_entry)
-                f.seek(0); f.truncate(); json.dump(data, f, indent=2)
-        except Exception:
-            with open(APOLOGY_CAL_FILE, "w", encoding="utf-8") as f:
-                json.dump([cal_entry], f, indent=2)
+        storage.add_calendar("apology", apology_text, now.strftime("%Y-%m-%d"), now.strftime("%I:%M %p"))
     return {"message": "Latest apology updated successfully"}
 
+@app.get("/metrics")
+def prometheus_metrics():
+    return Response(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+@metrics.registry.collector
+def runtime_samples():
+    samples = []
+    for name, cache in (("response", response_cache), ("guilt", guilt_cache), ("translation", translation_cache), ("render", render_cache), ("candidates", candidate_pool)):
+        samples.extend(metrics.cache_samples(name, cache.stats()))
+    flights = llm_flights.stats()
+    samples += [
+        ("singleflight_in_flight", "gauge", "Distinct LLM calls in flight", {}, flights["in_flight"]),
+        ("singleflight_upstream_calls_total", "counter", "LLM calls made by the single-flight layer", {}, flights["upstream_calls"]),
+        ("singleflight_coalesced_total", "counter", "Requests that joined an in-flight call", {}, flights["coalesced"]),
+    ]
+    for key, value in sessions.stats().items():
+        if key in ("sessions", "approx_bytes"):
+            samples.append((f"session_store_{key}", "gauge", "Session store size", {}, value))
+        elif key in ("created", "evicted", "expired"):
+            samples.append((f"session_store_{key}_total", "counter", f"Sessions {key}", {}, value))
+    for source, hits in candidate_pool.stats()["hits_by_source"].items():
+        samples.append(("candidate_pool_hits_by_source_total", "counter", "Candidate pool hits by how the candidate was made", {"source": source}, hits))
+    warmer = pool_warmer.stats()
+    samples += [
+        ("prewarm_generated_total", "counter", "Candidates generated ahead of demand", {}, warmer["generated"]),
+        ("prewarm_tokens_total", "counter", "Tokens spent on pre-generation", {}, warmer["tokens_total"]),
+        ("prewarm_budget_left", "gauge", "Pre-generation tokens left in the current hour", {}, warmer["budget_left"]),
+    ]
+    for status, count in job_queue.stats().items():
+        if status not in ("workers", "max_pending"):
+            samples.append(("job_queue_jobs", "gauge", "Emergency jobs by status", {"status": status}, count))
+    return samples
+
+# Per-endpoint LLM latency budgets in seconds, e.g. LLM_LATENCY_BUDGETS="/api/excuse=8,/api/apology=8";
+# LLM_LATENCY_BUDGET applies to every other endpoint (0 = no budget)
+LATENCY_BUDGETS = parse_budgets(os.getenv("LLM_LATENCY_BUDGETS", ""))
+DEFAULT_LATENCY_BUDGET = float(os.getenv("LLM_LATENCY_BUDGET", "0"))
+
+@app.middleware("http")
+async def latency_budget(request: Request, call_next):
+    budget = LATENCY_BUDGETS.get(request.url.path, DEFAULT_LATENCY_BUDGET)
+    if budget > 0:
+        start_budget(request.url.path, budget)
+    return await call_next(request)
+
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
     print(f"👉 {request.method} {request.url.path}")
-    return await call_next(request)
+    metrics.http_in_flight.inc()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Label by route template (not raw path) to keep the series count bounded
+        route = request.scope.get("route")
+        metrics.http_in_flight.dec()
+        metrics.http_request_seconds.observe(
+            request.method, route.path if route else "unmatched", status, value=time.perf_counter() - start)
 
 """
 MIT License
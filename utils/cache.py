@@ -0,0 +1,89 @@
+import time
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+def make_key(prompt: str, model: str, **params) -> str:
+    """Content hash of a whitespace-normalized prompt + model + sampling parameters."""
+    normalized = " ".join(prompt.split())
+    blob = json.dumps({"prompt": normalized, "model": model, "params": params}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Bounded LRU cache with a TTL per key.
+
+    With variety > 1 every key keeps up to N distinct candidates: lookups count as
+    misses until the key has N of them, then rotate through the stored candidates.
+    """
+
+    def __init__(self, max_size=1024, ttl=3600, variety=1):
+        self.max_size = max(1, int(max_size))
+        self.ttl = float(ttl)
+        self.variety = max(1, int(variety))
+        self._entries = OrderedDict()  # key -> {"expires": float, "candidates": list, "next": int}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry["expires"] <= now:
+                del self._entries[key]
+                entry = None
+            if entry is None or len(entry["candidates"]) < self.variety:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            candidates = entry["candidates"]
+            value = candidates[entry["next"] % len(candidates)]
+            entry["next"] += 1
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry["expires"] <= now:
+                entry = {"expires": now + self.ttl, "candidates": [], "next": 0}
+                self._entries[key] = entry
+            if value not in entry["candidates"]:
+                entry["candidates"].append(value)
+                if len(entry["candidates"]) > self.variety:
+                    entry["candidates"].pop(0)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    # Same interface as SharedCache, whose lookups hit SQLite and so run off the event loop
+    async def aget(self, key):
+        return self.get(key)
+
+    async def aput(self, key, value):
+        self.put(key, value)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "variety": self.variety,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,128 @@
+import time
+import threading
+from collections import OrderedDict
+
+# Best-of-N generation: one request produces several candidates, the best is returned and the rest
+# wait here, so the next "regenerate" for the same scenario is answered without an upstream call.
+# The pre-warmer (utils/prewarm.py) fills the same pool for popular requests ahead of demand.
+
+
+class CandidatePool:
+    """Per-key queues of spare candidates, best first. Keys are LRU-bounded and expire after `ttl`."""
+
+    def __init__(self, max_keys=512, ttl=1800, per_key=8):
+        self.max_keys = max(1, int(max_keys))
+        self.ttl = float(ttl)
+        self.per_key = max(1, int(per_key))
+        self._pools = OrderedDict()  # key -> {"expires": float, "items": [(score, value, source), ...]}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.added = 0
+        self.hits_by_source = {}
+
+    def pop(self, key):
+        """Best remaining candidate for key, or None."""
+        now = time.monotonic()
+        with self._lock:
+            pool = self._pools.get(key)
+            if pool is not None and (pool["expires"] <= now or not pool["items"]):
+                del self._pools[key]
+                pool = None
+            if pool is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            _, value, source = pool["items"].pop(0)
+            self.hits_by_source[source] = self.hits_by_source.get(source, 0) + 1
+            if not pool["items"]:
+                del self._pools[key]
+            return value
+
+    def extend(self, key, scored, source="best_of"):
+        """Adds [(score, value), ...]; values already waiting are skipped."""
+        if not scored:
+            return
+        now = time.monotonic()
+        with self._lock:
+            pool = self._pools.get(key)
+            if pool is None or pool["expires"] <= now:
+                # An expired pool starts over: its candidates are stale and its clock has run out
+                pool = self._pools[key] = {"expires": now + self.ttl, "items": []}
+            known = {value for _, value, _ in pool["items"]}
+            for score, value in scored:
+                if value not in known:
+                    pool["items"].append((score, value, source))
+                    known.add(value)
+                    self.added += 1
+            pool["items"].sort(key=lambda item: item[0], reverse=True)
+            del pool["items"][self.per_key:]
+            self._pools.move_to_end(key)
+            while len(self._pools) > self.max_keys:
+                self._pools.popitem(last=False)
+                self.evictions += 1
+
+    def available(self, key) -> int:
+        with self._lock:
+            pool = self._pools.get(key)
+            return len(pool["items"]) if pool and pool["expires"] > time.monotonic() else 0
+
+    def __len__(self):
+        return sum(len(pool["items"]) for pool in self._pools.values())
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self),
+            "keys": len(self._pools),
+            "max_keys": self.max_keys,
+            "ttl": self.ttl,
+            "added": self.added,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "hits_by_source": dict(self.hits_by_source),
+        }
+
+
+class DemandTracker:
+    """Exponentially decayed request counts per (kind, params), so recent demand outweighs old."""
+
+    def __init__(self, half_life=3600, max_keys=2000):
+        self.half_life = float(half_life)
+        self.max_keys = max(1, int(max_keys))
+        self._counts = {}  # (kind, params) -> (score, stamp)
+        self._lock = threading.Lock()
+
+    def _decayed(self, score, stamp, now):
+        return score * 0.5 ** ((now - stamp) / self.half_life)
+
+    def record(self, kind, params: tuple):
+        now = time.monotonic()
+        with self._lock:
+            score, stamp = self._counts.get((kind, params), (0.0, now))
+            self._counts[(kind, params)] = (self._decayed(score, stamp, now) + 1, now)
+            if len(self._counts) > self.max_keys:
+                # Drop the coldest tenth in one go rather than one key per request
+                ranked = sorted(self._counts.items(), key=lambda item: self._decayed(*item[1], now))
+                for key, _ in ranked[:max(1, self.max_keys // 10)]:
+                    del self._counts[key]
+
+    def top(self, n, min_score=1.0) -> list:
+        """[(score, kind, params), ...] for the n hottest requests scoring at least min_score."""
+        now = time.monotonic()
+        with self._lock:
+            scored = [(self._decayed(score, stamp, now), kind, params) for (kind, params), (score, stamp) in self._counts.items()]
+        return sorted((item for item in scored if item[0] >= min_score), key=lambda item: item[0], reverse=True)[:n]
+
+    def __len__(self):
+        return len(self._counts)
+
+
+def pick_best(scored):
+    """Splits [(score, value), ...] into (best value, the rest), keeping generation order on ties."""
+    ranked = sorted(enumerate(scored), key=lambda item: (-item[1][0], item[0]))
+    best = ranked[0][1][1]
+    return best, [pair for _, pair in ranked[1:]]
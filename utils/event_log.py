@@ -0,0 +1,162 @@
+import os
+import json
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, the thread lock still applies
+    fcntl = None
+
+LOG_PATH = os.getenv("EMERGENCY_LOG_PATH", "emergency_log.jsonl")
+LEGACY_LOG_PATH = "emergency_log.json"
+
+
+class EventLog:
+    """Append-only JSON-lines log with size-based rotation (path, path.1 ... path.N, newest first).
+    Readers walk the files backwards in blocks, so paging recent entries never loads the whole log.
+
+    Entries are written when their log job runs, so a queued or retried job lands after newer ones:
+    time-bounded reads keep going for `out_of_order` entries past the first one out of range."""
+
+    def __init__(self, path=LOG_PATH, max_bytes=5 * 1024 * 1024, backups=5, legacy_path=LEGACY_LOG_PATH, out_of_order=200):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.legacy_path = legacy_path
+        self.out_of_order = out_of_order
+        self._lock = threading.Lock()
+        self._migrated = False
+
+    @contextmanager
+    def _locked(self):
+        """Thread lock plus an flock on path.lock, so workers in other processes don't rotate at once."""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            fd = os.open(f"{self.path}.lock", os.O_WRONLY | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                yield
+            finally:
+                os.close(fd)  # releases the flock
+
+    def _files(self):
+        """Existing log files, newest first."""
+        names = [self.path] + [f"{self.path}.{i}" for i in range(1, self.backups + 1)]
+        return [name for name in names if os.path.exists(name)]
+
+    def _migrate_legacy(self):
+        # One-shot import of the old whole-file JSON array
+        self._migrated = True
+        if self._files() or not os.path.exists(self.legacy_path):
+            return
+        try:
+            with open(self.legacy_path, encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return
+        if entries:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.writelines(json.dumps(e, ensure_ascii=False) + "\n" for e in entries)
+
+    def _rotate(self):
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+    def append(self, entry: dict):
+        line = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._locked():
+            if not self._migrated:
+                self._migrate_legacy()
+            if os.path.exists(self.path) and os.path.getsize(self.path) + len(line) > self.max_bytes:
+                self._rotate()
+            # O_APPEND + a single write keeps concurrent appends from interleaving
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line)
+            finally:
+                os.close(fd)
+
+    # ============ Readers ============
+    @staticmethod
+    def _reverse_lines(path, block_size=64 * 1024):
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            pos = f.tell()
+            rest = b""
+            while pos > 0:
+                step = min(block_size, pos)
+                pos -= step
+                f.seek(pos)
+                lines = (f.read(step) + rest).split(b"\n")
+                rest = lines.pop(0)
+                for line in reversed(lines):
+                    if line.strip():
+                        yield line
+            if rest.strip():
+                yield rest
+
+    @staticmethod
+    def _forward_lines(path):
+        with open(path, "rb") as f:
+            for line in f:
+                if line.strip():
+                    yield line
+
+    def _entries(self, newest_first):
+        if not self._migrated:
+            with self._locked():
+                self._migrate_legacy()
+        files = self._files()
+        if not newest_first:
+            files.reverse()
+        for path in files:
+            lines = self._reverse_lines(path) if newest_first else self._forward_lines(path)
+            for line in lines:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue  # torn line from a crash mid-write
+
+    def iter_entries(self, since=None, until=None, newest_first=True):
+        """Yields entries whose timestamp is within [since, until]; bounds are ISO-like date/time strings."""
+        since = since.replace("T", " ") if since else None
+        until = until.replace("T", " ") if until else None
+        past_end = 0  # entries seen beyond the far bound, in the direction of reading
+        for entry in self._entries(newest_first):
+            ts = str(entry.get("timestamp", ""))
+            # Timestamps are "YYYY-MM-DD HH:MM:SS[.ffffff]", so string order is time order
+            before = since and ts < since
+            after = until and ts[:len(until)] > until
+            if before or after:
+                beyond = before if newest_first else after
+                if beyond:
+                    # Nearly sorted: a late-written entry may still follow, but not far behind
+                    past_end += 1
+                    if past_end > self.out_of_order:
+                        return
+                continue
+            yield entry
+
+    def page(self, limit=50, offset=0, since=None, until=None):
+        entries = []
+        for i, entry in enumerate(self.iter_entries(since, until)):
+            if i >= offset + limit + 1:
+                break
+            if i >= offset:
+                entries.append(entry)
+        return entries[:limit], len(entries) > limit
+
+    def tail(self, n=20):
+        """Last `n` entries, oldest first, read from the end of the file."""
+        return list(reversed(self.page(limit=n)[0]))
+
+
+emergency_log = EventLog(
+    max_bytes=int(os.getenv("EMERGENCY_LOG_MAX_BYTES", str(5 * 1024 * 1024))),
+    backups=int(os.getenv("EMERGENCY_LOG_BACKUPS", "5")),
+)
@@ -0,0 +1,211 @@
+import os
+import json
+import time
+import uuid
+import threading
+from utils import storage, shared_state
+
+# Persistent job queue (same SQLite file as the rest of the store) + bounded worker pool
+JOB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id           TEXT PRIMARY KEY,
+    kind         TEXT NOT NULL,
+    payload      TEXT NOT NULL,
+    status       TEXT NOT NULL,
+    attempts     INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    next_run_at  REAL NOT NULL,
+    last_error   TEXT,
+    created_at   REAL NOT NULL,
+    updated_at   REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_due ON jobs(status, next_run_at);
+"""
+
+PENDING = ("queued", "running")
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobQueue:
+    """Jobs survive restarts, failed jobs retry with exponential backoff, and enqueue raises
+    QueueFull once `max_pending` jobs are waiting."""
+
+    def __init__(self, workers=4, max_pending=1000, base_delay=2.0, max_delay=300.0, keep_finished_days=7, stale_after=0.0):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.keep_finished_days = keep_finished_days
+        self.stale_after = stale_after
+        self._handlers = {}
+        self._wake = threading.Condition()
+        self._threads = []
+        self._stopping = False
+        self._schema_ready = False
+
+    def _ensure_schema(self):
+        if not self._schema_ready:
+            storage.init_db()
+            storage.connect().executescript(JOB_SCHEMA)
+            self._schema_ready = True
+
+    def register(self, kind, handler, max_attempts=5):
+        self._handlers[kind] = (handler, max_attempts)
+
+    def enqueue(self, kind, payload: dict) -> str:
+        return self.enqueue_many([(kind, payload)])[0]
+
+    def enqueue_many(self, jobs) -> list:
+        """Queues [(kind, payload), ...] all together or not at all: QueueFull unless there is room
+        for every one of them."""
+        for kind, _ in jobs:
+            if kind not in self._handlers:
+                raise ValueError(f"No handler registered for job kind '{kind}'")
+        self._ensure_schema()
+        job_ids = [uuid.uuid4().hex[:12] for _ in jobs]
+        now = time.time()
+        with storage.transaction() as conn:
+            pending = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)", PENDING
+            ).fetchone()[0]
+            if pending + len(jobs) > self.max_pending:
+                raise QueueFull(f"{pending} jobs already pending")
+            conn.executemany(
+                """
+                INSERT INTO jobs (id, kind, payload, status, max_attempts, next_run_at, created_at, updated_at)
+                VALUES (?, ?, ?, 'queued', ?, ?, ?, ?)
+                """,
+                [
+                    (job_id, kind, json.dumps(payload, ensure_ascii=False), self._handlers[kind][1], now, now, now)
+                    for job_id, (kind, payload) in zip(job_ids, jobs)
+                ],
+            )
+        with self._wake:
+            self._wake.notify(len(jobs))
+        return job_ids
+
+    def get(self, job_id):
+        self._ensure_schema()
+        row = storage.connect().execute(
+            "SELECT id, kind, status, attempts, max_attempts, next_run_at, last_error, created_at, updated_at FROM jobs WHERE id = ?",
+            (job_id,),
+        ).fetchone()
+        return dict(row) if row else None
+
+    def stats(self) -> dict:
+        self._ensure_schema()
+        rows = storage.connect().execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status")
+        counts = {r["status"]: r["n"] for r in rows}
+        return {"workers": self.workers, "max_pending": self.max_pending, **counts}
+
+    # ============ Worker Pool ============
+    def requeue_stale(self) -> int:
+        """Jobs that were mid-run when their process died go back on the queue. With several worker
+        processes sharing the table, only those running longer than stale_after are orphans."""
+        self._ensure_schema()
+        now = time.time()
+        return storage.connect().execute(
+            "UPDATE jobs SET status = 'queued', updated_at = ? WHERE status = 'running' AND updated_at <= ?",
+            (now, now - self.stale_after),
+        ).rowcount
+
+    def start(self):
+        self.requeue_stale()
+        conn = storage.connect()
+        conn.execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?",
+            (time.time() - self.keep_finished_days * 86400,),
+        )
+        self._stopping = False
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self, timeout=5.0):
+        self._stopping = True
+        with self._wake:
+            self._wake.notify_all()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def _claim(self):
+        now = time.time()
+        with storage.transaction() as conn:
+            row = conn.execute(
+                """
+                SELECT id, kind, payload, attempts, max_attempts FROM jobs
+                WHERE status = 'queued' AND next_run_at <= ?
+                ORDER BY next_run_at LIMIT 1
+                """,
+                (now,),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (now, row["id"]),
+            )
+            return dict(row)
+
+    def _seconds_until_next(self):
+        row = storage.connect().execute(
+            "SELECT MIN(next_run_at) FROM jobs WHERE status = 'queued'"
+        ).fetchone()
+        if row[0] is None:
+            return 5.0
+        return min(max(row[0] - time.time(), 0.05), 5.0)
+
+    def _worker(self):
+        while not self._stopping:
+            try:
+                job = self._claim()
+            except Exception as e:
+                print("❌ Job queue error:", e)
+                time.sleep(1)
+                continue
+            if job is None:
+                with self._wake:
+                    self._wake.wait(timeout=self._seconds_until_next())
+                continue
+            self._run(job)
+
+    def _run(self, job):
+        attempts = job["attempts"] + 1
+        handler, _ = self._handlers.get(job["kind"], (None, 0))
+        payload = json.loads(job["payload"])
+        try:
+            if handler is None:
+                raise RuntimeError(f"No handler registered for job kind '{job['kind']}'")
+            # Handlers may narrow the payload (e.g. drop delivered recipients); it is saved for the retry
+            handler(payload)
+        except Exception as e:
+            if attempts >= job["max_attempts"]:
+                status, next_run = "failed", time.time()
+                print(f"❌ Job {job['id']} ({job['kind']}) failed after {attempts} attempts:", e)
+            else:
+                delay = min(self.base_delay * 2 ** (attempts - 1), self.max_delay)
+                status, next_run = "queued", time.time() + delay
+                print(f"⚠️ Job {job['id']} ({job['kind']}) attempt {attempts} failed, retrying in {delay:.0f}s:", e)
+            storage.connect().execute(
+                "UPDATE jobs SET status = ?, payload = ?, next_run_at = ?, last_error = ?, updated_at = ? WHERE id = ?",
+                (status, json.dumps(payload, ensure_ascii=False), next_run, str(e)[:500], time.time(), job["id"]),
+            )
+            return
+        storage.connect().execute(
+            "UPDATE jobs SET status = 'done', last_error = NULL, updated_at = ? WHERE id = ?",
+            (time.time(), job["id"]),
+        )
+
+
+job_queue = JobQueue(
+    workers=int(os.getenv("JOB_WORKERS", "4")),
+    max_pending=int(os.getenv("JOB_QUEUE_MAX", "1000")),
+    base_delay=float(os.getenv("JOB_RETRY_BASE_DELAY", "2")),
+    max_delay=float(os.getenv("JOB_RETRY_MAX_DELAY", "300")),
+    stale_after=float(os.getenv("JOB_STALE_AFTER", "300" if shared_state.ENABLED else "0")),
+)
@@ -0,0 +1,129 @@
+import os
+import json
+import base64
+import smtplib
+import threading
+
+GMAIL_SCOPES = ["https://www.googleapis.com/auth/gmail.send"]
+SMTP_HOST = "smtp.gmail.com"
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "5"))
+
+
+class MailTransport:
+    """Long-lived mail sender: the Gmail service (or the SMTP connection for the fallback) is set up
+    once and reused, so an emergency no longer pays for discovery or an SSL handshake + login."""
+
+    def __init__(self, token_file="token.json"):
+        self.token_file = token_file
+        self._lock = threading.Lock()
+        self._creds = None
+        self._service = None
+        self._smtp = None
+
+    def uses_gmail_api(self):
+        return bool(os.getenv("TOKEN_JSON_CONTENT")) or os.path.exists(self.token_file)
+
+    # ============ Gmail API ============
+    def _gmail(self):
+        from google.auth.transport.requests import Request
+
+        if self._service is None:
+            from google.oauth2.credentials import Credentials
+            from googleapiclient.discovery import build
+
+            token_json = os.getenv("TOKEN_JSON_CONTENT")
+            if token_json:
+                self._creds = Credentials.from_authorized_user_info(json.loads(token_json), GMAIL_SCOPES)
+            else:
+                self._creds = Credentials.from_authorized_user_file(self.token_file, GMAIL_SCOPES)
+            self._service = build("gmail", "v1", credentials=self._creds, cache_discovery=False)
+        # Refresh the access token only once it has actually expired
+        if not self._creds.valid and self._creds.refresh_token:
+            self._creds.refresh(Request())
+        return self._service
+
+    def _send_gmail(self, messages):
+        service = self._gmail()
+        failed = []
+        for msg in messages:
+            raw = base64.urlsafe_b64encode(msg.as_bytes()).decode()
+            try:
+                service.users().messages().send(userId="me", body={"raw": raw}).execute()
+            except Exception as e:
+                failed.append((msg, e))
+        return failed
+
+    # ============ SMTP fallback ============
+    def _connect_smtp(self):
+        sender, password = os.getenv("EMAIL_USERNAME"), os.getenv("EMAIL_PASSWORD")
+        try:
+            smtp = smtplib.SMTP_SSL(SMTP_HOST, 465, timeout=SMTP_TIMEOUT)
+        except OSError:
+            smtp = smtplib.SMTP(SMTP_HOST, 587, timeout=SMTP_TIMEOUT)
+            smtp.starttls()
+        smtp.login(sender, password)
+        return smtp
+
+    def _smtp_session(self):
+        if self._smtp is not None:
+            try:
+                # Idle connections get dropped by the server; one NOOP per batch tells us before we send
+                if self._smtp.noop()[0] == 250:
+                    return self._smtp
+            except OSError:
+                pass
+            self._close_smtp()
+        self._smtp = self._connect_smtp()
+        return self._smtp
+
+    def _send_smtp(self, messages):
+        # Connection/auth errors here are raised: nothing has been sent yet, so the batch can be retried
+        smtp = self._smtp_session()
+        failed = []
+        for msg in messages:
+            try:
+                smtp.send_message(msg)
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                # Dropped mid-batch: reconnect once for this message. Errors from here on are per
+                # message, since raising would resend the ones already delivered.
+                self._close_smtp()
+                try:
+                    smtp = self._smtp_session()
+                    smtp.send_message(msg)
+                except (smtplib.SMTPException, OSError) as e:
+                    failed.append((msg, e))
+            except (smtplib.SMTPException, OSError) as e:
+                failed.append((msg, e))
+        return failed
+
+    def _close_smtp(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                pass
+            self._smtp = None
+
+    # ============ Public API ============
+    def send_batch(self, messages):
+        """Sends every message over one session; returns [(message, error)] for the ones that failed.
+        Connection and auth errors before the first message are raised so the caller can retry the
+        whole batch; once sending has started every error is reported per message."""
+        with self._lock:
+            if self.uses_gmail_api():
+                return self._send_gmail(messages)
+            return self._send_smtp(messages)
+
+    def send(self, msg):
+        failed = self.send_batch([msg])
+        if failed:
+            raise failed[0][1]
+
+    def close(self):
+        with self._lock:
+            self._close_smtp()
+            self._service = None
+            self._creds = None
+
+
+mailer = MailTransport()
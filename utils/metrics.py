@@ -0,0 +1,218 @@
+import time
+import threading
+from functools import wraps
+
+# Minimal in-process Prometheus metrics (text exposition format 0.0.4). Updates are a dict lookup
+# plus a few additions under a lock; formatting only happens when /metrics is scraped.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+FAST_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self):
+        lines = self._header()
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, *labels, amount=1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def dec(self, *labels, amount=1.0):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels, value):
+        with self._lock:
+            self._values[labels] = value
+
+    render = Counter.render
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, *labels, value):
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * len(self.buckets), 0.0, 0]
+            counts = state[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def time(self, *labels):
+        return _Timer(self, labels)
+
+    def render(self):
+        lines = self._header()
+        with self._lock:
+            items = sorted((labels, (list(s[0]), s[1], s[2])) for labels, s in self._values.items())
+        for labels, (counts, total, n) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {n}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {n}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(*self.labels, value=time.perf_counter() - self.start)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=()):
+        return self._add(Gauge(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, fn):
+        """Registers fn() -> [(name, type, help, {labels}, value), ...], evaluated at scrape time."""
+        self._collectors.append(fn)
+        return fn
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        # Samples of one metric must be contiguous, so group across collectors first
+        families = {}
+        for fn in self._collectors:
+            try:
+                samples = fn()
+            except Exception as e:
+                print("⚠️ Metrics collector failed:", e)
+                continue
+            for name, kind, help, labels, value in samples:
+                family = families.setdefault(name, [f"# HELP {name} {help}", f"# TYPE {name} {kind}"])
+                family.append(f"{name}{_labels(labels.keys(), labels.values())} {value}")
+        for family in families.values():
+            lines.extend(family)
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# ============ Shared metrics ============
+http_request_seconds = registry.histogram(
+    "http_request_duration_seconds", "HTTP request duration by route (until response headers)", ("method", "route", "status"))
+http_in_flight = registry.gauge("http_requests_in_flight", "HTTP requests currently being handled")
+
+llm_queue_seconds = registry.histogram(
+    "llm_queue_seconds", "Time an LLM call waited for admission (rate limit, concurrency, Retry-After)", ("model", "priority"))
+llm_queue_depth = registry.gauge("llm_queue_depth", "LLM calls waiting for admission", ("model", "priority"))
+llm_concurrency_limit = registry.gauge("llm_concurrency_limit", "Current adaptive (AIMD) concurrency limit", ("model",))
+llm_throttled = registry.counter("llm_throttled_total", "Upstream 429 responses", ("model",))
+llm_rejected = registry.counter("llm_rejected_total", "LLM calls rejected locally (queue full or wait too long)", ("model", "priority"))
+llm_upstream_seconds = registry.histogram(
+    "llm_upstream_seconds", "Upstream LLM call duration (streams: until the last chunk)", ("model", "outcome"))
+llm_in_flight = registry.gauge("llm_requests_in_flight", "LLM calls currently waiting on the upstream", ("model",))
+llm_breaker_state = registry.gauge("llm_breaker_state", "Circuit breaker state per model (0 closed, 1 half-open, 2 open)", ("model",))
+llm_hedges = registry.counter("llm_hedges_total", "Hedged calls sent to a model because the previous one was slow", ("model",))
+llm_failovers = registry.counter("llm_failovers_total", "Calls that failed on a model and moved to the next one", ("model",))
+llm_budget_exceeded = registry.counter("llm_budget_exceeded_total", "Requests that ran out of their LLM latency budget", ("endpoint",))
+llm_postprocess_seconds = registry.histogram(
+    "llm_postprocess_seconds", "Post-processing time of LLM output", ("step",), buckets=FAST_BUCKETS)
+
+storage_seconds = registry.histogram(
+    "storage_operation_seconds", "SQLite storage operation duration", ("op",), buckets=FAST_BUCKETS + (1.0, 5.0))
+
+
+def timed(histogram, *labels):
+    """Decorator observing the wrapped function's duration."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                histogram.observe(*labels, value=time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def cache_samples(name, stats: dict):
+    """Collector samples for a ResponseCache.stats() dict."""
+    labels = {"cache": name}
+    return [
+        ("cache_hits_total", "counter", "Cache hits", labels, stats["hits"]),
+        ("cache_misses_total", "counter", "Cache misses", labels, stats["misses"]),
+        ("cache_evictions_total", "counter", "Cache evictions", labels, stats["evictions"]),
+        ("cache_entries", "gauge", "Entries currently cached", labels, stats["size"]),
+        ("cache_hit_ratio", "gauge", "Cache hit ratio since start", labels, stats["hit_rate"]),
+    ]
@@ -1,172 +1,586 @@
 import os
-import re
-from openai import OpenAI
+import json
+import time
+import asyncio
+import functools
+import threading
+import contextvars
+import httpx
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
+from utils.cache import make_key
+from utils.singleflight import SingleFlight
+from utils import prompts, metrics, shared_state, rankings
+from utils.candidates import CandidatePool, DemandTracker, pick_best
+from utils.postprocess import strip_reasoning, clean_llm_text, postprocess, OutputCleaner
+from utils.ratelimit import UpstreamLimiter, UpstreamBusy, AdmissionRejected, INTERACTIVE, BACKGROUND, retry_after_seconds
+from utils.routing import ModelRouter, mark_dispatched
 
 load_dotenv()
 
-# Configure OpenRouter Client
-client = OpenAI(
-    base_url="https://openrouter.ai/api/v1",
-    api_key=os.getenv("OPENROUTER_API_KEY", "dummy-key-for-local-testing"),
+# Models in order of preference (LLM_MODELS, comma-separated). The first is the primary: it names
+# cache keys and takes every call while its circuit breaker is closed; the rest are for failover and
+# hedging (see utils/routing.py).
+MODELS = [m.strip() for m in os.getenv("LLM_MODELS", "nvidia/nemotron-nano-12b-v2-vl:free").split(",") if m.strip()]
+MODEL_NAME = MODELS[0]
+
+# Connection pool shared by every generation path
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "200"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "50"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+
+def _parse_concurrency(raw: str) -> dict:
+    """Parses LLM_MODEL_CONCURRENCY, e.g. "model-a=32,model-b=8"."""
+    limits = {}
+    for item in raw.split(","):
+        model, _, limit = item.strip().rpartition("=")
+        if model and limit.isdigit():
+            limits[model] = int(limit)
+    return limits
+
+# Max in-flight calls per upstream model (models not listed use the default). The adaptive limiter
+# starts here and backs off towards LLM_MIN_CONCURRENCY while the provider throttles.
+DEFAULT_MODEL_CONCURRENCY = int(os.getenv("LLM_DEFAULT_CONCURRENCY", "64"))
+MODEL_CONCURRENCY = _parse_concurrency(os.getenv("LLM_MODEL_CONCURRENCY", ""))
+MIN_MODEL_CONCURRENCY = int(os.getenv("LLM_MIN_CONCURRENCY", "1"))
+
+# Requests/second across the deployment (0 = no rate cap); each worker process takes its share
+LLM_RATE_LIMIT = float(os.getenv("LLM_RATE_LIMIT", "0")) / shared_state.WORKERS
+LLM_RATE_BURST = int(os.getenv("LLM_RATE_BURST", "5"))
+LLM_QUEUE_MAX = int(os.getenv("LLM_QUEUE_MAX", "256"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))
+# Throttled / 5xx / timed-out calls are retried through the limiter, honoring Retry-After
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "2"))
+LLM_MAX_RETRY_AFTER = float(os.getenv("LLM_MAX_RETRY_AFTER", "60"))
+
+# OpenRouter client (async, pooled). SDK retries are off so 429s reach the limiter. It is built on
+# first use: importing the openai package is the slowest part of starting the app.
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from openai import AsyncOpenAI
+                _client = AsyncOpenAI(
+                    base_url=os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1"),
+                    api_key=os.getenv("OPENROUTER_API_KEY", "dummy-key-for-local-testing"),
+                    max_retries=0,
+                    http_client=httpx.AsyncClient(
+                        limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_KEEPALIVE),
+                        timeout=LLM_TIMEOUT,
+                    ),
+                )
+    return _client
+
+_limiters = {}
+
+def limiter(model: str) -> UpstreamLimiter:
+    gate = _limiters.get(model)
+    if gate is None:
+        gate = _limiters[model] = UpstreamLimiter(
+            model,
+            rate=LLM_RATE_LIMIT,
+            burst=LLM_RATE_BURST,
+            min_limit=MIN_MODEL_CONCURRENCY,
+            max_limit=MODEL_CONCURRENCY.get(model, DEFAULT_MODEL_CONCURRENCY),
+            max_queue=LLM_QUEUE_MAX,
+            max_wait=LLM_QUEUE_TIMEOUT,
+            max_retry_after=LLM_MAX_RETRY_AFTER,
+        )
+    return gate
+
+def limiter_stats() -> dict:
+    return {model: gate.stats() for model, gate in _limiters.items()}
+
+def _model_failure(error) -> bool:
+    """Errors that say the model is in trouble (429, 5xx, connection errors, timeouts) rather than
+    that the request was bad (4xx). Only these count towards a breaker or move on to the next model."""
+    if isinstance(error, (UpstreamBusy, asyncio.TimeoutError)):
+        return True
+    import openai
+    return isinstance(error, openai.APIError) and _outcome(error) != "error"
+
+# Per-model circuit breakers open on error rate or slow-call rate; interactive calls slower than the
+# model's p95 are hedged with the next model in MODELS
+router = ModelRouter(
+    MODELS,
+    breaker_options={
+        "window": int(os.getenv("LLM_BREAKER_WINDOW", "20")),
+        "min_calls": int(os.getenv("LLM_BREAKER_MIN_CALLS", "5")),
+        "error_rate": float(os.getenv("LLM_BREAKER_ERROR_RATE", "0.5")),
+        "slow_seconds": float(os.getenv("LLM_BREAKER_SLOW_SECONDS", "20")),
+        "slow_rate": float(os.getenv("LLM_BREAKER_SLOW_RATE", "0.8")),
+        "open_seconds": float(os.getenv("LLM_BREAKER_OPEN_SECONDS", "30")),
+    },
+    hedge=os.getenv("LLM_HEDGE", "1") == "1",
+    hedge_quantile=float(os.getenv("LLM_HEDGE_QUANTILE", "0.95")),
+    hedge_min_delay=float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.5")),
+    hedge_default_delay=float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "5")),
+    is_failure=_model_failure,
+)
+
+def _outcome(error) -> str:
+    import openai
+    if isinstance(error, openai.RateLimitError):
+        return "throttled"
+    if isinstance(error, openai.APIConnectionError):
+        return "overloaded"
+    if isinstance(error, openai.APIStatusError) and error.status_code >= 500:
+        return "overloaded"
+    return "error"
+
+@asynccontextmanager
+async def _upstream(model, priority):
+    """Holds an admitted slot for one upstream call and reports its outcome to the limiter."""
+    gate = limiter(model)
+    await gate.acquire(priority)
+    mark_dispatched()
+    started = time.perf_counter()
+    metrics.llm_in_flight.inc(model)
+    outcome, retry_after = "error", None
+    try:
+        yield
+        outcome = "ok"
+    except asyncio.CancelledError:
+        outcome = "cancelled"
+        raise
+    except Exception as e:
+        outcome = _outcome(e)
+        if outcome == "throttled":
+            retry_after = retry_after_seconds(e.response.headers)
+        raise
+    finally:
+        metrics.llm_in_flight.dec(model)
+        metrics.llm_upstream_seconds.observe(model, outcome, value=time.perf_counter() - started)
+        gate.release(outcome, retry_after)
+
+def _busy(model, error):
+    import openai
+    if isinstance(error, openai.RateLimitError):
+        message = "The AI model is rate limited right now, please try again shortly."
+    else:
+        message = "The AI model is unavailable right now, please try again shortly."
+    return UpstreamBusy(message, limiter(model).retry_after())
+
+# Token usage of every call made in the current context is appended here when set (see pregenerate)
+_usage_sink = contextvars.ContextVar("usage_sink", default=None)
+
+def _record_usage(response, params):
+    sink = _usage_sink.get()
+    if sink is None:
+        return
+    usage = getattr(response, "usage", None)
+    if usage is not None and usage.total_tokens:
+        sink.append(usage.total_tokens)
+    else:
+        # Rough estimate (~4 characters per token) when the provider reports no usage
+        text = "".join(m["content"] for m in params.get("messages", [])) + "".join(c.message.content or "" for c in response.choices)
+        sink.append(len(text) // 4)
+
+async def _complete(model, priority, **params):
+    """One chat.completions call through the limiter, retried while the upstream throttles."""
+    client = get_client()
+    import openai
+    for attempt in range(LLM_RETRIES + 1):
+        try:
+            async with _upstream(model, priority):
+                response = await client.chat.completions.create(
+                    model=model,
+                    extra_body={"reasoning": {"enabled": True}},
+                    **params
+                )
+            _record_usage(response, params)
+            return response
+        except openai.APIError as e:
+            if _outcome(e) == "error":
+                raise
+            if attempt == LLM_RETRIES:
+                raise _busy(model, e) from e
+
+async def _routed(model, priority, **params):
+    """_complete on the given model, or routed across MODELS when none is given."""
+    if model:
+        return await _complete(model, priority, **params)
+    return await router.run(lambda target: _complete(target, priority, **params), priority)
+
+async def chat_completion(messages, model=None, temperature=0.7, priority=INTERACTIVE, **kwargs) -> str:
+    """Runs one reasoning-enabled chat completion and returns the raw message content."""
+    response = await _routed(model, priority, messages=messages, temperature=temperature, **kwargs)
+    return response.choices[0].message.content
+
+async def chat_choices(messages, n, model=None, temperature=0.7, priority=INTERACTIVE, **kwargs) -> list:
+    """Asks for n choices in one call; providers that ignore `n` return fewer."""
+    response = await _routed(model, priority, messages=messages, temperature=temperature, n=n, **kwargs)
+    return [choice.message.content for choice in response.choices if choice.message.content]
+
+async def close_client():
+    if _client is not None:
+        await _client.close()
+
+# Opt-in response cache for excuse/apology generation
+RESPONSE_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "0") == "1"
+response_cache = shared_state.cache_or_local(
+    "response",
+    max_size=int(os.getenv("LLM_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("LLM_CACHE_TTL", "3600")),
+    variety=int(os.getenv("LLM_CACHE_VARIETY", "1")),
+)
+
+# Concurrent identical generations share one upstream call
+llm_flights = SingleFlight()
+
+# Non-English requests ask for English + translation in one JSON response
+COMBINED_TRANSLATION = os.getenv("LLM_COMBINED_TRANSLATION", "1") == "1"
+
+# English text -> translation, per language, so nothing is translated twice
+translation_cache = shared_state.cache_or_local(
+    "translation",
+    max_size=int(os.getenv("TRANSLATION_CACHE_SIZE", "4096")),
+    ttl=float(os.getenv("TRANSLATION_CACHE_TTL", "86400")),
 )
 
-# Define the model variable
-MODEL_NAME = "nvidia/nemotron-nano-12b-v2-vl:free"
-
-def strip_reasoning(text: str) -> str:
-    """Strips <think> or <thought> blocks from the model's output."""
-    if not text:
-        return text
-    cleaned = re.sub(r'<(think|thought)>.*?</\1>', '', text, flags=re.DOTALL)
-    cleaned = re.sub(r'<(think|thought)>.*', '', cleaned, flags=re.DOTALL)
-    return cleaned.strip()
-
-def clean_llm_text(text: str) -> str:
-    """Forcefully extracts the actual text if the LLM includes conversational filler."""
-    text = text.strip()
-    # If the LLM quoted the actual output, extract it
-    match = re.search(r'"([^"]{10,})"', text)
-    if match:
-        return match.group(1).strip()
-    
-    # Otherwise strip typical annoying prefixes
-    text = re.sub(r'^(Here is.*?:\s*)', '', text, flags=re.IGNORECASE)
-    # If there are newlines, it often puts the excuse on the first line and explains it on the next
-    lines = [L for L in text.split('\n') if L.strip()]
-    if len(lines) > 1 and len(lines[0]) > 10:
-        return lines[0].strip().replace('"', '')
-        
-    return text.replace('"', '').strip()
-
-def generate_excuse(scenario, urgency, language="en", style="professional"):
-    # 1. Preserve original Prompt Branching
-    if style == "professional":
-        prompt = f"""
-You are a professional excuse generator. Generate a realistic and responsible excuse.
-
-Scenario: {scenario}
-Urgency: {urgency}
-
-Rules:
-- Be practical and believable.
-- Avoid anything imaginary or exaggerated.
-- Keep it short and polite.
-- One or two sentences only.
-- CRITICAL: Return ONLY the excuse text itself. Do not include quotes, conversational filler, or explanations of why it works.
-"""
+async def _stream_model(model, priority, reasoning, params):
+    """Streams one model, retrying while nothing has streamed yet. Yields the visible part of every
+    content delta, which is empty while the model is reasoning, and None each time a request is
+    dispatched (after the limiter admitted it)."""
+    client = get_client()
+    import openai
+    for attempt in range(LLM_RETRIES + 1):
+        streamed = False
+        try:
+            async with _upstream(model, priority):
+                yield None
+                stream = await client.chat.completions.create(
+                    model=model,
+                    stream=True,
+                    extra_body={"reasoning": {"enabled": True}},
+                    **params
+                )
+                async for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        streamed = True
+                        yield reasoning.feed(delta)
+            return
+        except openai.APIError as e:
+            # Only a call that failed before any output can be retried
+            if streamed or _outcome(e) == "error":
+                raise
+            if attempt == LLM_RETRIES:
+                raise _busy(model, e) from e
+
+async def stream_completion(messages, model=None, temperature=0.7, priority=INTERACTIVE, cleaner=None, **kwargs):
+    """Streams a reasoning-enabled completion, yielding visible text deltas as they arrive. Pass an
+    OutputCleaner to read the cleaned answer from it once the stream ends. Without a model, a model
+    that fails before its first token is skipped for the next one in MODELS (streams are not hedged)."""
+    reasoning = cleaner or OutputCleaner()
+    params = dict(messages=messages, temperature=temperature, **kwargs)
+    if model:
+        async for visible in _stream_model(model, priority, reasoning, params):
+            if visible:
+                yield visible
     else:
-        prompt = f"""
-You are a creative excuse generator. Generate a fun, clever, or imaginative excuse.
+        import openai
+        tried, error = [], None
+        while True:
+            target = router.next_model(tried)
+            if target is None:
+                raise error
+            if tried:
+                router.failed_over(tried[-1])
+            tried.append(target)
+            # The clock starts at dispatch: queueing in our own limiter is not the model's latency
+            breaker, started, first = router.breakers[target], None, True
+            try:
+                async for visible in _stream_model(target, priority, reasoning, params):
+                    if visible is None:
+                        started = time.monotonic()
+                        continue
+                    if first:
+                        # Judged on time to first token; stream durations say little about health
+                        breaker.record(False, time.monotonic() - started)
+                        first = False
+                    if visible:
+                        yield visible
+            except (openai.APIError, UpstreamBusy) as e:
+                if not first:
+                    raise
+                if started is None and isinstance(e, AdmissionRejected):
+                    # Turned away by our own limiter; try the next model without blaming this one
+                    breaker.release()
+                elif router.is_failure(e):
+                    breaker.record(True, time.monotonic() - started if started is not None else 0.0)
+                else:
+                    # A bad request fails the same way on every model
+                    breaker.release()
+                    raise
+                error = e
+                continue
+            except BaseException:
+                # Cancelled or closed before the first token (client gone): the model was not at
+                # fault, but a half-open probe must be handed back
+                if first:
+                    if started is None:
+                        breaker.release()
+                    else:
+                        breaker.cancelled(time.monotonic() - started)
+                raise
+            if first:
+                breaker.record(False, time.monotonic() - started)
+            break
+    tail = reasoning.flush()
+    if tail:
+        yield tail
 
-Scenario: {scenario}
-Urgency: {urgency}
+def _parse_combined(raw: str):
+    """Returns (english, translated) from a combined JSON response, or None if it doesn't parse."""
+    start, end = raw.find("{"), raw.rfind("}")
+    if start == -1 or end <= start:
+        return None
+    try:
+        data = json.loads(raw[start:end + 1])
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    english, translated = data.get("english"), data.get("translated")
+    if not isinstance(english, str) or not isinstance(translated, str) or not english.strip() or not translated.strip():
+        return None
+    return clean_llm_text(english), translated.strip()
 
-Rules:
-- Be witty, dramatic or unusual, but still make some sense.
-- Can include exaggeration or humor.
-- One or two sentences only.
-- CRITICAL: Return ONLY the excuse text itself. Do not include quotes, conversational filler, or explanations of why it works.
-"""
+async def translate(text, language, priority=INTERACTIVE):
+    """Translates English text, reusing earlier translations of the same text."""
+    key = make_key(text, MODEL_NAME, language=language)
+    cached = await translation_cache.aget(key)
+    if cached:
+        return cached
+    translation_prompt = prompts.render("translate", language=language, text=text)
+    trans_content = await chat_completion([{"role": "user", "content": translation_prompt}], priority=priority)
+    translated = strip_reasoning(trans_content)
+    await translation_cache.aput(key, translated)
+    return translated
 
+async def _generate_and_translate(prompt, language, fallback, error_label, priority=INTERACTIVE):
+    """Returns (english, translated, failed) for a generation prompt. UpstreamBusy propagates so the
+    caller can answer 503 + Retry-After instead of the fallback text."""
+    # Single round-trip: English + translation as JSON
+    if language != "en" and COMBINED_TRANSLATION:
+        try:
+            content = await chat_completion([{"role": "user", "content": prompt + prompts.render("translate.combined_suffix", language=language)}], priority=priority)
+        except UpstreamBusy:
+            raise
+        except Exception as e:
+            print(error_label, e)
+            return fallback, "Translation failed.", True
+        parsed = _parse_combined(strip_reasoning(content) or "")
+        if parsed:
+            english, translated = parsed
+            await translation_cache.aput(make_key(english, MODEL_NAME, language=language), translated)
+            return english, translated, False
+        print("⚠️ Combined translation response unparseable, falling back to two-step path")
+
+    failed = False
     try:
-        # 2. Update to OpenRouter + Nemotron + Reasoning
-        response = client.chat.completions.create(
-            model=MODEL_NAME,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7,
-            extra_body={"reasoning": {"enabled": True}}
-        )
-        base_text = clean_llm_text(strip_reasoning(response.choices[0].message.content))
+        # OpenRouter + Nemotron + Reasoning via the shared async client
+        content = await chat_completion([{"role": "user", "content": prompt}], priority=priority)
+        base_text = postprocess(content)
+    except UpstreamBusy:
+        raise
     except Exception as e:
-        print("❌ Error generating excuse:", e)
-        base_text = "Something went wrong while generating your excuse."
+        print(error_label, e)
+        base_text = fallback
+        failed = True
 
-    # 3. Preserve Translation Logic
     if language != "en":
         try:
-            translation_prompt = f"Translate this to {language}:\n{base_text}"
-            trans_response = client.chat.completions.create(
-                model=MODEL_NAME,
-                messages=[{"role": "user", "content": translation_prompt}],
-                temperature=0.7,
-                extra_body={"reasoning": {"enabled": True}}
-            )
-            translated = trans_response.choices[0].message.content.strip()
+            translated = await translate(base_text, language, priority)
         except Exception as e:
             print("❌ Translation error:", e)
             translated = "Translation failed."
+            failed = True
     else:
         translated = base_text
+    return base_text, translated, failed
 
-    return base_text, translated
+def excuse_prompt(scenario, urgency, style="professional"):
+    # Preserve original Prompt Branching
+    name = "excuse.professional" if style == "professional" else "excuse.creative"
+    return prompts.render(name, scenario=scenario, urgency=urgency)
 
+def apology_prompt(context, tone, type, style):
+    return prompts.render("apology", type=type.lower(), tone=tone.lower(), style=style.lower(), context=context)
 
-def generate_apology(context, tone, type, style, language="en"):
-    prompt = f"Write a {type.lower()} apology in a {tone.lower()} tone and {style.lower()} style. Context: {context}. CRITICAL: Return ONLY the apology text itself. Do not include quotes, conversational filler, or any introductory/concluding explanations."
+# Best-of-N: each generation asks for BEST_OF_N candidates, returns the best by the ranking
+# heuristics (utils/rankings.py) and pools the rest per prompt for the next regenerate
+BEST_OF_N = max(1, int(os.getenv("BEST_OF_N", "1")))
+BEST_OF_N_PARAM = os.getenv("BEST_OF_N_PARAM", "0") == "1"
+candidate_pool = CandidatePool(
+    max_keys=int(os.getenv("BEST_OF_POOL_KEYS", "512")),
+    ttl=float(os.getenv("BEST_OF_POOL_TTL", "1800")),
+    per_key=int(os.getenv("BEST_OF_POOL_PER_KEY", str(max(4, BEST_OF_N - 1)))),
+)
+# Recent excuse/apology requests, which the pre-warmer (utils/prewarm.py) keeps stocked
+demand = DemandTracker(half_life=float(os.getenv("PREWARM_DEMAND_HALF_LIFE", "3600")))
 
-    try:
-        response = client.chat.completions.create(
-            model=MODEL_NAME,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7,
-            extra_body={"reasoning": {"enabled": True}}
-        )
-        base_message = clean_llm_text(strip_reasoning(response.choices[0].message.content))
-    except Exception as e:
-        print("❌ OpenAI error during apology:", e)
-        base_message = "Sorry, something went wrong generating the apology."
+async def _english_choices(prompt, priority):
+    """BEST_OF_N English candidates from one call using the `n` parameter."""
+    contents = await chat_choices([{"role": "user", "content": prompt}], BEST_OF_N, priority=priority)
+    texts = [text for text in (postprocess(c) for c in contents) if text]
+    if not texts:
+        raise RuntimeError("Empty completion")
+    return [(text, text, False) for text in texts]
 
-    # Preserve Translation Logic here as well
-    if language != "en":
+async def _generate_best(pool_key, urgency, prompt, language, fallback, error_label, priority=INTERACTIVE):
+    """Returns (english, translated, failed) like _generate_and_translate, for the best of BEST_OF_N."""
+    if BEST_OF_N <= 1:
+        return await _generate_and_translate(prompt, language, fallback, error_label, priority)
+
+    if BEST_OF_N_PARAM and language == "en":
         try:
-            translation_prompt = f"Translate this to {language}:\n{base_message}"
-            trans_response = client.chat.completions.create(
-                model=MODEL_NAME,
-                messages=[{"role": "user", "content": translation_prompt}],
-                temperature=0.7,
-                extra_body={"reasoning": {"enabled": True}}
-            )
-            translated = strip_reasoning(trans_response.choices[0].message.content)
+            outcomes = await _english_choices(prompt, priority)
+        except UpstreamBusy:
+            raise
         except Exception as e:
-            print("❌ Translation error:", e)
-            translated = "Translation failed."
+            print(error_label, e)
+            outcomes = [(fallback, fallback, True)]
     else:
-        translated = base_message
+        outcomes = await asyncio.gather(*(
+            _generate_and_translate(prompt, language, fallback, error_label, priority) for _ in range(BEST_OF_N)
+        ), return_exceptions=True)
+
+    good = list(dict.fromkeys(
+        (english, translated) for english, translated, failed in (o for o in outcomes if not isinstance(o, BaseException)) if not failed
+    ))
+    if not good:
+        errors = [o for o in outcomes if isinstance(o, BaseException)]
+        if errors:
+            raise errors[0]
+        return outcomes[0]
+    best, rest = pick_best([(rankings.candidate_score(english, urgency), (english, translated)) for english, translated in good])
+    candidate_pool.extend(pool_key, rest)
+    return (*best, False)
 
+async def generate_excuse(scenario, urgency, language="en", style="professional", priority=INTERACTIVE, fresh=False):
+    """(english, translated). fresh=True always generates a new excuse: no pooled or cached answer and
+    no sharing with identical requests in flight (batch items that repeat must still differ)."""
+    # 1. Build the prompt for the requested style
+    prompt = excuse_prompt(scenario, urgency, style)
+
+    cache_key = make_key(prompt.id, MODEL_NAME, temperature=0.7, language=language)
+    demand.record("excuse", (scenario, urgency, style, language))
+    generate = functools.partial(
+        _generate_best, cache_key, urgency, prompt, language,
+        fallback="Something went wrong while generating your excuse.",
+        error_label="❌ Error generating excuse:",
+        priority=priority,
+    )
+    if fresh:
+        base_text, translated, _ = await generate()
+        return base_text, translated
+    # A regenerate (or a pre-warmed popular request) takes the next best spare candidate
+    pooled = candidate_pool.pop(cache_key)
+    if pooled:
+        return pooled
+    if RESPONSE_CACHE_ENABLED:
+        cached = await response_cache.aget(cache_key)
+        if cached:
+            return cached
+
+    # 2. Generate (and translate, in one call when possible); identical in-flight requests are coalesced
+    base_text, translated, failed = await llm_flights.do(cache_key, generate)
+
+    if RESPONSE_CACHE_ENABLED and not failed:
+        await response_cache.aput(cache_key, (base_text, translated))
+    return base_text, translated
+
+
+async def generate_apology(context, tone, type, style, language="en", priority=INTERACTIVE, fresh=False):
+    """(english, translated); fresh as for generate_excuse."""
+    prompt = apology_prompt(context, tone, type, style)
+
+    cache_key = make_key(prompt.id, MODEL_NAME, temperature=0.7, language=language)
+    demand.record("apology", (context, tone, type, style, language))
+    generate = functools.partial(
+        _generate_best, cache_key, None, prompt, language,
+        fallback="Sorry, something went wrong generating the apology.",
+        error_label="❌ OpenAI error during apology:",
+        priority=priority,
+    )
+    if fresh:
+        base_message, translated, _ = await generate()
+        return base_message, translated
+    pooled = candidate_pool.pop(cache_key)
+    if pooled:
+        return pooled
+    if RESPONSE_CACHE_ENABLED:
+        cached = await response_cache.aget(cache_key)
+        if cached:
+            return cached
+
+    base_message, translated, failed = await llm_flights.do(cache_key, generate)
+
+    if RESPONSE_CACHE_ENABLED and not failed:
+        await response_cache.aput(cache_key, (base_message, translated))
     return base_message, translated
 
 
-def adjust_tone(text, tone):
-    prompt = f"Change the tone of the following excuse to {tone}:\n\n{text}"
+def _pooled_request(kind, params):
+    """(prompt, urgency, language, pool key) for a request recorded by `demand`."""
+    if kind == "excuse":
+        scenario, urgency, style, language = params
+        prompt = excuse_prompt(scenario, urgency, style)
+    else:
+        context, tone, type, style, language = params
+        urgency, prompt = None, apology_prompt(context, tone, type, style)
+    return prompt, urgency, language, make_key(prompt.id, MODEL_NAME, temperature=0.7, language=language)
+
+def pool_available(kind, params) -> int:
+    return candidate_pool.available(_pooled_request(kind, params)[3])
+
+async def pregenerate(kind, params, count):
+    """Generates `count` candidates for a popular request at background priority and pools all of
+    them. Returns (candidates pooled, tokens used)."""
+    prompt, urgency, language, key = _pooled_request(kind, params)
+    tokens = []
+    _usage_sink.set(tokens)
+    outcomes = await asyncio.gather(*(
+        _generate_and_translate(prompt, language, "", "❌ Pre-generation error:", BACKGROUND) for _ in range(count)
+    ), return_exceptions=True)
+    good = list(dict.fromkeys(
+        (english, translated) for english, translated, failed in (o for o in outcomes if not isinstance(o, BaseException)) if not failed
+    ))
+    candidate_pool.extend(key, [(rankings.candidate_score(english, urgency), (english, translated)) for english, translated in good], source="prewarm")
+    busy = next((o for o in outcomes if isinstance(o, UpstreamBusy)), None)
+    if busy and not good:
+        raise busy
+    return len(good), sum(tokens)
+
+
+async def adjust_tone(text, tone):
+    prompt = prompts.render("tone.adjust", tone=tone, text=text)
 
     try:
-        response = client.chat.completions.create(
-            model=MODEL_NAME,
-            messages=[
-                {"role": "system", "content": "You are a professional tone adjuster."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            extra_body={"reasoning": {"enabled": True}}
-        )
-        return strip_reasoning(response.choices[0].message.content)
+        content = await chat_completion([
+            {"role": "system", "content": "You are a professional tone adjuster."},
+            {"role": "user", "content": prompt}
+        ])
+        return strip_reasoning(content)
     except Exception as e:
         print("❌ Tone Adjust Error:", e)
         return "Failed to adjust tone."
 
 
-def autocomplete_text(prompt):
+async def autocomplete_text(prompt):
     try:
-        response = client.chat.completions.create(
-            model=MODEL_NAME,
-            messages=[
-                {"role": "user", "content": f"Continue this excuse:\n{prompt}"}
-            ],
-            temperature=0.7,
-            extra_body={"reasoning": {"enabled": True}}
-        )
-        return strip_reasoning(response.choices[0].message.content)
+        content = await chat_completion([
+            {"role": "user", "content": prompts.render("excuse.continue", text=prompt)}
+        ])
+        return strip_reasoning(content)
     except Exception as e:
         print("❌ AutoComplete Error:", e)
         return "Failed to complete text."
\ No newline at end of file
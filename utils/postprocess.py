@@ -0,0 +1,191 @@
+import re
+from utils import metrics
+
+# Post-processing of model output: reasoning blocks are dropped, then the answer is pulled out of any
+# conversational filler. Every step is a precompiled pattern or a str.find scan, and OutputCleaner
+# does the same work incrementally while a response streams in.
+
+# A closed <think>/<thought> block, or an unclosed one running to the end of the text
+_REASONING = re.compile(r'<(think|thought)>(?:.*?</\1>|.*)', re.DOTALL)
+# "Here is your excuse:" and similar lead-ins, up to the first colon on the first line
+_PREFIX = re.compile(r'Here is.*?:\s*', re.IGNORECASE)
+# A quoted answer needs at least this many characters between the quotes
+QUOTE_MIN = 10
+
+
+def _strip_reasoning(text):
+    if not text:
+        return text
+    if "<" not in text:
+        return text.strip()
+    return _REASONING.sub("", text).strip()
+
+
+@metrics.timed(metrics.llm_postprocess_seconds, "strip_reasoning")
+def strip_reasoning(text: str) -> str:
+    """Strips <think> or <thought> blocks from the model's output.
+
+    Tags are only recognised as written by the model: removing a block never joins the text around
+    it into a new tag (the same behaviour as OutputCleaner on a stream)."""
+    return _strip_reasoning(text)
+
+
+def _find_quoted(text):
+    """(start, end) of the first quoted run of QUOTE_MIN+ characters, like re.search(r'"([^"]{10,})"')."""
+    last = text.find('"')
+    while last != -1:
+        nxt = text.find('"', last + 1)
+        if nxt == -1:
+            return None
+        if nxt - last > QUOTE_MIN:
+            return last + 1, nxt
+        last = nxt
+    return None
+
+
+def _first_line(text):
+    """The first non-blank line, if another non-blank line follows it and it is longer than 10 characters."""
+    first = None
+    pos, end = 0, len(text)
+    while pos <= end:
+        nl = text.find("\n", pos)
+        if nl == -1:
+            nl = end
+        line = text[pos:nl]
+        if line.strip():
+            if first is not None:
+                return first
+            if len(line) <= 10:
+                return None
+            first = line
+        pos = nl + 1
+    return None
+
+
+def _unquoted(text):
+    # Otherwise strip typical annoying prefixes
+    prefix = _PREFIX.match(text)
+    if prefix:
+        text = text[prefix.end():]
+    # If there are newlines, it often puts the excuse on the first line and explains it on the next
+    line = _first_line(text) if "\n" in text else None
+    if line is not None:
+        return line.strip().replace('"', '')
+    return text.replace('"', '').strip()
+
+
+def _clean_llm_text(text):
+    text = text.strip()
+    # If the LLM quoted the actual output, extract it
+    quoted = _find_quoted(text)
+    if quoted:
+        return text[quoted[0]:quoted[1]].strip()
+    return _unquoted(text)
+
+
+@metrics.timed(metrics.llm_postprocess_seconds, "clean_llm_text")
+def clean_llm_text(text: str) -> str:
+    """Forcefully extracts the actual text if the LLM includes conversational filler."""
+    return _clean_llm_text(text)
+
+
+@metrics.timed(metrics.llm_postprocess_seconds, "postprocess")
+def postprocess(text: str) -> str:
+    """clean_llm_text(strip_reasoning(text)): the answer in a raw excuse/apology response."""
+    return _clean_llm_text(_strip_reasoning(text))
+
+
+class OutputCleaner:
+    """Incremental postprocess: feed streamed chunks and get back only the visible text (reasoning
+    blocks removed). The quoted answer is looked for as the text streams past, so cleaned() at the
+    end of the stream equals postprocess(full_text) without another scan."""
+
+    OPEN_TAGS = ("<think>", "<thought>")
+
+    def __init__(self):
+        self._buffer = ""
+        self._closing = None  # closing tag we are waiting for while inside a block
+        self._parts = []
+        self._length = 0
+        self._quote = None    # offset of the last unmatched '"' in the visible text
+        self._quoted = None   # (start, end) of the first quoted answer, once seen
+
+    def feed(self, chunk: str) -> str:
+        buffer = self._buffer + chunk if self._buffer else chunk
+        if self._closing and buffer.find(self._closing) == -1:
+            # Still inside a reasoning block; keep just enough to recognise a closing tag split across chunks
+            self._buffer = buffer[-(len(self._closing) - 1):]
+            return ""
+        if not self._closing and "<" not in buffer:
+            # Plain answer text, the common case
+            self._buffer = ""
+            visible = buffer
+        else:
+            visible = self._scan(buffer)
+        if visible:
+            self._track(visible)
+        return visible
+
+    def _scan(self, buffer):
+        visible = []
+        while buffer:
+            if self._closing:
+                idx = buffer.find(self._closing)
+                if idx == -1:
+                    buffer = buffer[-(len(self._closing) - 1):]
+                    break
+                buffer = buffer[idx + len(self._closing):]
+                self._closing = None
+                continue
+            idx = buffer.find("<")
+            if idx == -1:
+                visible.append(buffer)
+                buffer = ""
+                break
+            visible.append(buffer[:idx])
+            rest = buffer[idx:]
+            tag = next((t for t in self.OPEN_TAGS if rest.startswith(t)), None)
+            if tag:
+                self._closing = "</" + tag[1:]
+                buffer = rest[len(tag):]
+            elif any(t.startswith(rest) for t in self.OPEN_TAGS):
+                # Possibly the start of an opening tag; wait for more input
+                buffer = rest
+                break
+            else:
+                visible.append("<")
+                buffer = rest[1:]
+        self._buffer = buffer
+        return "".join(visible)
+
+    def flush(self) -> str:
+        # An unclosed reasoning block is dropped, same as strip_reasoning
+        tail = "" if self._closing else self._buffer
+        self._buffer = ""
+        if tail:
+            self._track(tail)
+        return tail
+
+    def _track(self, visible):
+        if self._quoted is None and '"' in visible:
+            idx = visible.find('"')
+            while idx != -1:
+                pos = self._length + idx
+                if self._quote is not None and pos - self._quote > QUOTE_MIN:
+                    self._quoted = (self._quote + 1, pos)
+                    break
+                self._quote = pos
+                idx = visible.find('"', idx + 1)
+        self._parts.append(visible)
+        self._length += len(visible)
+
+    @property
+    def text(self) -> str:
+        """Visible text so far (reasoning removed, not cleaned)."""
+        return "".join(self._parts)
+
+    def cleaned(self) -> str:
+        text = self.text
+        if self._quoted:
+            return text[self._quoted[0]:self._quoted[1]].strip()
+        return _unquoted(text.strip())
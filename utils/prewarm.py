@@ -0,0 +1,112 @@
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+from utils.openai_handler import MODEL_NAME, demand, candidate_pool, limiter, pregenerate, pool_available
+from utils.ratelimit import UpstreamBusy
+
+# Keeps spare candidates in the candidate pool for the most requested scenario/urgency/style/language
+# combinations, so popular requests are served without waiting on the model. Runs as a scheduler job
+# and only while the upstream is idle, within an hourly token budget.
+
+
+class PoolWarmer:
+    def __init__(self, top_n=10, target=3, token_budget=0, idle_in_flight=1, min_demand=2.0, timeout=120.0):
+        self.top_n = top_n
+        self.target = min(target, candidate_pool.per_key)
+        self.token_budget = token_budget
+        self.idle_in_flight = idle_in_flight
+        self.min_demand = min_demand
+        self.timeout = timeout
+        self._spent = deque()  # (monotonic time, tokens) over the last hour
+        self._loop = None
+        self._running = threading.Lock()
+        self.runs = 0
+        self.refills = 0
+        self.generated = 0
+        self.tokens = 0
+        self.skipped_busy = 0
+        self.budget_exhausted = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.token_budget > 0
+
+    def attach(self, loop):
+        """The app's event loop; generation runs there so it shares the client and the limiter."""
+        self._loop = loop
+
+    def budget_left(self) -> int:
+        cutoff = time.monotonic() - 3600
+        while self._spent and self._spent[0][0] < cutoff:
+            self._spent.popleft()
+        return self.token_budget - sum(tokens for _, tokens in self._spent)
+
+    def idle(self) -> bool:
+        gate = limiter(MODEL_NAME).stats()
+        return gate["queued"] == 0 and gate["in_flight"] <= self.idle_in_flight and gate["paused_for"] == 0
+
+    def run(self):
+        """Scheduler job: tops up the hottest requests until the pool is full, the budget is spent or
+        real traffic shows up."""
+        if not self.enabled or self._loop is None or not self._running.acquire(blocking=False):
+            return
+        try:
+            self.runs += 1
+            for _, kind, params in demand.top(self.top_n, self.min_demand):
+                missing = self.target - pool_available(kind, params)
+                if missing <= 0:
+                    continue
+                if self.budget_left() <= 0:
+                    self.budget_exhausted += 1
+                    return
+                if not self.idle():
+                    self.skipped_busy += 1
+                    return
+                future = asyncio.run_coroutine_threadsafe(pregenerate(kind, params, missing), self._loop)
+                try:
+                    added, tokens = future.result(self.timeout)
+                except UpstreamBusy:
+                    self.skipped_busy += 1
+                    return
+                except Exception as e:
+                    future.cancel()
+                    print("⚠️ Pool pre-warm failed:", e)
+                    return
+                self._spent.append((time.monotonic(), tokens))
+                self.refills += 1
+                self.generated += added
+                self.tokens += tokens
+        finally:
+            self._running.release()
+
+    def stats(self) -> dict:
+        pool = candidate_pool.stats()
+        lookups = pool["hits"] + pool["misses"]
+        warm_hits = pool["hits_by_source"].get("prewarm", 0)
+        return {
+            "enabled": self.enabled,
+            "runs": self.runs,
+            "refills": self.refills,
+            "generated": self.generated,
+            "tokens_total": self.tokens,
+            "token_budget_per_hour": self.token_budget,
+            "budget_left": self.budget_left(),
+            "skipped_busy": self.skipped_busy,
+            "budget_exhausted": self.budget_exhausted,
+            "tracked_requests": len(demand),
+            "pool_hit_rate": pool["hit_rate"],
+            "prewarm_hit_rate": round(warm_hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+PREWARM_INTERVAL = float(os.getenv("PREWARM_INTERVAL", "60"))
+
+pool_warmer = PoolWarmer(
+    top_n=int(os.getenv("PREWARM_TOP", "10")),
+    target=int(os.getenv("PREWARM_TARGET", "3")),
+    token_budget=int(os.getenv("PREWARM_TOKEN_BUDGET", "0")),
+    idle_in_flight=int(os.getenv("PREWARM_IDLE_IN_FLIGHT", "1")),
+    min_demand=float(os.getenv("PREWARM_MIN_DEMAND", "2")),
+)
@@ -0,0 +1,188 @@
+import os
+import json
+import hashlib
+from string import Formatter
+
+# Central prompt registry. Templates are parsed once at import and every version stays registered.
+# Version 1 is active unless PROMPT_VERSIONS opts a template into a newer one
+# (PROMPT_VERSIONS="excuse.professional=2,..."). Newer versions put the static instructions first
+# and the per-request fields last, so the shared prefix can be cached upstream.
+
+
+class Prompt(str):
+    """Rendered prompt text that also carries its template ID and a stable hash of the render."""
+
+    def __new__(cls, text, template_id, fields):
+        prompt = super().__new__(cls, text)
+        prompt.template_id = template_id
+        # Whitespace-normalized like make_key, so "late  for work" and "late for work" share cache entries
+        normalized = {field: " ".join(value.split()) for field, value in fields.items()}
+        payload = json.dumps([template_id, normalized], sort_keys=True, ensure_ascii=False)
+        prompt.id = f"{template_id}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]}"
+        return prompt
+
+
+class PromptTemplate:
+    def __init__(self, name, version, template):
+        self.name = name
+        self.version = version
+        self.template = template
+        # Precompiled: [(literal, field or None), ...]
+        self._parts = [(literal, field) for literal, field, _, _ in Formatter().parse(template)]
+        self.fields = list(dict.fromkeys(field for _, field in self._parts if field))
+        digest = hashlib.sha256(template.encode("utf-8")).hexdigest()[:8]
+        self.id = f"{name}@v{version}#{digest}"
+        # Text before the first field is identical for every render
+        self.static_prefix = ""
+        for literal, field in self._parts:
+            self.static_prefix += literal
+            if field:
+                break
+
+    def render(self, **values) -> Prompt:
+        missing = [field for field in self.fields if field not in values]
+        if missing:
+            raise KeyError(f"Prompt '{self.id}' is missing fields: {', '.join(missing)}")
+        out = []
+        for literal, field in self._parts:
+            out.append(literal)
+            if field:
+                out.append(str(values[field]))
+        return Prompt("".join(out), self.id, {field: str(values[field]) for field in self.fields})
+
+    def describe(self) -> dict:
+        return {"id": self.id, "name": self.name, "version": self.version, "fields": self.fields, "static_prefix_chars": len(self.static_prefix)}
+
+
+class PromptRegistry:
+    def __init__(self, pinned=None):
+        self._templates = {}
+        self.pinned = pinned or {}
+
+    def register(self, name, version, template):
+        self._templates.setdefault(name, {})[version] = PromptTemplate(name, version, template)
+
+    def get(self, name, version=None) -> PromptTemplate:
+        versions = self._templates[name]
+        version = version or self.pinned.get(name) or min(versions)
+        return versions[version]
+
+    def render(self, name, version=None, **values) -> Prompt:
+        return self.get(name, version).render(**values)
+
+    def catalog(self) -> list:
+        return [
+            {**template.describe(), "active": template is self.get(name)}
+            for name, versions in sorted(self._templates.items())
+            for template in versions.values()
+        ]
+
+
+def _parse_pins(raw: str) -> dict:
+    pins = {}
+    for part in raw.split(","):
+        name, _, version = part.partition("=")
+        if name.strip() and version.strip().isdigit():
+            pins[name.strip()] = int(version)
+    return pins
+
+registry = PromptRegistry(pinned=_parse_pins(os.getenv("PROMPT_VERSIONS", "")))
+render = registry.render
+
+# ============ Excuses ============
+registry.register("excuse.professional", 1, """
+You are a professional excuse generator. Generate a realistic and responsible excuse.
+
+Scenario: {scenario}
+Urgency: {urgency}
+
+Rules:
+- Be practical and believable.
+- Avoid anything imaginary or exaggerated.
+- Keep it short and polite.
+- One or two sentences only.
+- CRITICAL: Return ONLY the excuse text itself. Do not include quotes, conversational filler, or explanations of why it works.
+""")
+registry.register("excuse.professional", 2, """
+You are a professional excuse generator. Generate a realistic and responsible excuse.
+
+Rules:
+- Be practical and believable.
+- Avoid anything imaginary or exaggerated.
+- Keep it short and polite.
+- One or two sentences only.
+- CRITICAL: Return ONLY the excuse text itself. Do not include quotes, conversational filler, or explanations of why it works.
+
+Scenario: {scenario}
+Urgency: {urgency}
+""")
+registry.register("excuse.creative", 1, """
+You are a creative excuse generator. Generate a fun, clever, or imaginative excuse.
+
+Scenario: {scenario}
+Urgency: {urgency}
+
+Rules:
+- Be witty, dramatic or unusual, but still make some sense.
+- Can include exaggeration or humor.
+- One or two sentences only.
+- CRITICAL: Return ONLY the excuse text itself. Do not include quotes, conversational filler, or explanations of why it works.
+""")
+registry.register("excuse.creative", 2, """
+You are a creative excuse generator. Generate a fun, clever, or imaginative excuse.
+
+Rules:
+- Be witty, dramatic or unusual, but still make some sense.
+- Can include exaggeration or humor.
+- One or two sentences only.
+- CRITICAL: Return ONLY the excuse text itself. Do not include quotes, conversational filler, or explanations of why it works.
+
+Scenario: {scenario}
+Urgency: {urgency}
+""")
+
+# ============ Apologies ============
+registry.register("apology", 1,
+    "Write a {type} apology in a {tone} tone and {style} style. Context: {context}. CRITICAL: Return ONLY the apology text itself. "
+    "Do not include quotes, conversational filler, or any introductory/concluding explanations.")
+registry.register("apology", 2,
+    "Write an apology. CRITICAL: Return ONLY the apology text itself. "
+    "Do not include quotes, conversational filler, or any introductory/concluding explanations.\n\n"
+    "Type: {type}\nTone: {tone}\nStyle: {style}\nContext: {context}")
+
+registry.register("apology.complete", 1,
+    "Complete this sentence in a {tone} apology tone:\n\n{start}\n\n"
+    "CRITICAL: Return ONLY the completion text itself. Do not include quotes, conversational filler, or explanations of why it works.")
+registry.register("apology.complete", 2,
+    "Complete the sentence below as an apology. "
+    "CRITICAL: Return ONLY the completion text itself. Do not include quotes, conversational filler, or explanations of why it works.\n\n"
+    "Tone: {tone}\n\nSentence:\n{start}")
+
+registry.register("guilt.score", 1,
+    "Calibrate on this rubric:\n"
+    "  1‑20  : clearly insincere / no guilt\n"
+    "  21‑40 : weak apology / low guilt\n"
+    "  41‑60 : neutral / average guilt\n"
+    "  61‑80 : sincere but not extreme\n"
+    "  81‑100: very strong guilt / deeply sorry\n\n"
+    "You must answer in **exactly** this JSON format:\n"
+    '{{ "score": <number>, "reason": "<≤25‑word explanation>" }}\n\n'
+    "Apology text:\n"
+    "{text}\n"
+    "----\nNow respond:")
+
+# ============ Rewriting ============
+registry.register("tone.rephrase", 1,
+    "Rephrase the following text in a {tone} tone:\n\n{sentence}\n\nDo not add any extra commentary, timestamps, or headings.")
+registry.register("tone.rephrase", 2,
+    "Rephrase the text below in the requested tone. Do not add any extra commentary, timestamps, or headings.\n\n"
+    "Tone: {tone}\n\nText:\n{sentence}")
+
+registry.register("tone.adjust", 1, "Change the tone of the following excuse to {tone}:\n\n{text}")
+registry.register("excuse.continue", 1, "Continue this excuse:\n{text}")
+
+# ============ Translation ============
+registry.register("translate", 1, "Translate this to {language}:\n{text}")
+registry.register("translate.combined_suffix", 1,
+    "\nAlso translate it to {language}. Respond ONLY with JSON in exactly this format:\n"
+    '{{"english": "<the text in English>", "translated": "<the same text in {language}>"}}')
@@ -0,0 +1,44 @@
+# Scoring heuristics shared by the ranking endpoints (computed once at write time)
+STRONG_TONE_WORDS = ["deeply", "sincerely", "truly", "heartfelt"]
+APOLOGY_WORDS = ["sorry", "apologize", "regret", "mistake"]
+URGENCY_WORDS = ["urgent", "emergency", "immediately", "right away", "asap", "sudden", "unexpected", "critical"]
+URGENCY_POINTS = {"medium": 1, "high": 2, "critical": 4}
+
+def tone_bonus(text: str) -> int:
+    text_lower = text.lower()
+    bonus = 0
+    if any(word in text_lower for word in STRONG_TONE_WORDS): bonus += 2
+    if any(word in text_lower for word in APOLOGY_WORDS): bonus += 1
+    return bonus
+
+def length_bonus(text: str) -> int:
+    return min(len(text) // 100, 3)
+
+def urgency_bonus(text: str, urgency) -> int:
+    # A candidate that actually conveys the urgency earns that urgency's points
+    text_lower = text.lower()
+    return URGENCY_POINTS.get(urgency, 0) if any(word in text_lower for word in URGENCY_WORDS) else 0
+
+def candidate_score(text: str, urgency=None) -> int:
+    """Ranks freshly generated candidates before any usage data exists."""
+    return tone_bonus(text) + length_bonus(text) + urgency_bonus(text, urgency)
+
+def excuse_score(count, urgency_score, favorited) -> int:
+    return count + urgency_score + (3 if favorited else 0)
+
+def apology_breakdown(count, tone, length, favorited) -> dict:
+    return {
+        "usage": count,
+        "tone": tone,
+        "length": length,
+        "favorite": 2 if favorited else 0,
+        "recency": 1 if count > 0 else 0,
+    }
+
+def apology_score(count, tone, length, favorited) -> int:
+    return sum(apology_breakdown(count, tone, length, favorited).values())
+
+def score_row(kind, count, urgency_score, tone, length, favorited) -> int:
+    if kind == "excuse":
+        return excuse_score(count, urgency_score, favorited)
+    return apology_score(count, tone, length, favorited)
@@ -0,0 +1,210 @@
+import time
+import heapq
+import asyncio
+import itertools
+from email.utils import parsedate_to_datetime
+from utils import metrics
+
+# Admission control in front of the upstream LLM: a token bucket caps the request rate, an AIMD
+# limiter adapts the number of in-flight calls to how hard the provider is throttling, and callers
+# that cannot go yet wait in a priority queue.
+
+# Priority classes, lowest value dispatched first
+EMERGENCY = 0
+INTERACTIVE = 1
+BACKGROUND = 2
+PRIORITY_NAMES = {EMERGENCY: "emergency", INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+
+class UpstreamBusy(Exception):
+    """The upstream is throttling or the local queue is full; retry after `retry_after` seconds."""
+
+    def __init__(self, message, retry_after=1.0):
+        super().__init__(message)
+        self.retry_after = max(1, int(round(retry_after)))
+
+
+class AdmissionRejected(UpstreamBusy):
+    """Rejected by the local limiter (queue full or waited too long); the upstream was never called."""
+
+
+class TokenBucket:
+    """`rate` tokens per second, holding at most `burst`. A rate of 0 disables the bucket."""
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self._tokens = self.burst
+        self._stamp = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+    def wait_time(self) -> float:
+        """Seconds until a token is available (0 if one is available now)."""
+        if self.rate <= 0:
+            return 0.0
+        self._refill()
+        return 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+
+    def take(self):
+        if self.rate > 0:
+            self._tokens -= 1
+
+
+def retry_after_seconds(headers, default=None):
+    """Reads Retry-After (seconds or an HTTP date), retry-after-ms, or OpenRouter's
+    X-RateLimit-Reset (epoch milliseconds) from response headers."""
+    if not headers:
+        return default
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value:
+        try:
+            return float(value)
+        except ValueError:
+            try:
+                return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+            except (TypeError, ValueError):
+                pass
+    value = headers.get("x-ratelimit-reset")
+    if value:
+        try:
+            return max(float(value) / 1000 - time.time(), 0.0)
+        except ValueError:
+            pass
+    return default
+
+
+class UpstreamLimiter:
+    """Per-model gate: rate (token bucket) x concurrency (AIMD) x priority queue.
+
+    The concurrency limit grows by 1/limit per successful call (about +1 per round trip) and is
+    multiplied by `backoff` when the upstream throttles or overloads, at most once per `cooldown`
+    seconds so a burst of 429s from one window only counts once. A Retry-After pauses dispatch.
+    """
+
+    def __init__(self, name, rate=0.0, burst=1, min_limit=1, max_limit=64, backoff=0.5, cooldown=1.0,
+                 max_queue=256, max_wait=30.0, max_retry_after=60.0):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(self.max_limit)
+        self.backoff = backoff
+        self.cooldown = cooldown
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.max_retry_after = max_retry_after
+        self.in_flight = 0
+        self.throttled = 0
+        self.rejected = 0
+        self._waiters = []  # heap of [priority, seq, future]
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._consecutive_throttles = 0
+        self._timer = None
+        metrics.llm_concurrency_limit.set(name, value=self.limit)
+
+    # ============ Admission ============
+    def retry_after(self) -> float:
+        """Rough wait before a new request would be admitted."""
+        queued = len(self._waiters) + 1
+        per_slot = 1 / self.bucket.rate if self.bucket.rate > 0 else 1.0
+        return max(self._paused_until - time.monotonic(), 0.0) + queued * per_slot / max(int(self.limit), 1)
+
+    async def acquire(self, priority=INTERACTIVE):
+        label = PRIORITY_NAMES.get(priority, str(priority))
+        paused = self._paused_until - time.monotonic()
+        if len(self._waiters) >= self.max_queue or paused > self.max_wait:
+            self.rejected += 1
+            metrics.llm_rejected.inc(self.name, label)
+            raise AdmissionRejected("The AI model is busy right now, please try again shortly.", self.retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        entry = [priority, next(self._seq), future]
+        heapq.heappush(self._waiters, entry)
+        metrics.llm_queue_depth.inc(self.name, label)
+        queued = time.perf_counter()
+        self._dispatch()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.max_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # Granted just as we gave up: hand the slot straight back
+                self.release("cancelled")
+            else:
+                future.cancel()
+                self._remove(entry)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self.rejected += 1
+            metrics.llm_rejected.inc(self.name, label)
+            raise AdmissionRejected("The AI model is busy right now, please try again shortly.", self.retry_after()) from None
+        finally:
+            metrics.llm_queue_depth.dec(self.name, label)
+            metrics.llm_queue_seconds.observe(self.name, label, value=time.perf_counter() - queued)
+
+    def _remove(self, entry):
+        try:
+            self._waiters.remove(entry)
+            heapq.heapify(self._waiters)
+        except ValueError:
+            pass
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._waiters and self.in_flight < int(self.limit):
+            wait = max(self._paused_until - time.monotonic(), self.bucket.wait_time())
+            if wait > 0:
+                self._timer = asyncio.get_running_loop().call_later(wait, self._dispatch)
+                return
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            self.bucket.take()
+            self.in_flight += 1
+            future.set_result(None)
+
+    # ============ Feedback ============
+    def release(self, outcome="ok", retry_after=None):
+        """outcome: ok | throttled (429) | overloaded (5xx, timeout) | error | cancelled."""
+        self.in_flight -= 1
+        now = time.monotonic()
+        if outcome == "ok":
+            self._consecutive_throttles = 0
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        elif outcome in ("throttled", "overloaded"):
+            if outcome == "throttled":
+                self.throttled += 1
+                self._consecutive_throttles += 1
+                metrics.llm_throttled.inc(self.name)
+                # Without a Retry-After, back off exponentially on repeated 429s
+                delay = retry_after if retry_after is not None else min(2 ** (self._consecutive_throttles - 1), self.max_retry_after)
+                self._paused_until = max(self._paused_until, now + min(delay, self.max_retry_after))
+            if now - self._last_decrease >= self.cooldown:
+                self._last_decrease = now
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+        metrics.llm_concurrency_limit.set(self.name, value=self.limit)
+        self._dispatch()
+
+    def stats(self) -> dict:
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "queued": len(self._waiters),
+            "paused_for": round(max(self._paused_until - time.monotonic(), 0.0), 2),
+            "rate": self.bucket.rate,
+            "throttled": self.throttled,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,199 @@
+import os
+import re
+import zlib
+import struct
+import asyncio
+import httpx
+from datetime import datetime
+from utils.cache import ResponseCache, make_key
+from utils.singleflight import SingleFlight
+
+HCTI_URL = "https://hcti.io/v1/image"
+SCREENSHOT_TIMEOUT = float(os.getenv("SCREENSHOT_TIMEOUT", "15"))
+RENDER_DIR = os.getenv("RENDER_DIR", os.path.join("static", "renders"))
+RENDER_NAME = re.compile(r"^[0-9a-f]{64}\.png$")
+
+THEME_GRADIENTS = {
+    "light": ("#fefcea", "#f1da36"),
+    "dark": ("#1b263b", "#415a77"),
+}
+
+def render_screenshot_html(main_text, label, theme):
+    logo_url = "https://aarushch.github.io/Intelligent-Excuse-Generator/static/images/logo.png"
+
+    top, bottom = THEME_GRADIENTS.get(theme, THEME_GRADIENTS["light"])
+    bg_gradient = f"linear-gradient(135deg, {top} 0%, {bottom} 100%)"
+    text_color = "#fff" if theme == "dark" else "#222"
+
+    html = f"""
+    <div style='
+        width: 600px; padding: 48px 36px; border-radius: 0; font-family: Inter, Rajdhani, Arial, sans-serif;
+        background: {bg_gradient}; box-shadow: 0 10px 40px rgba(0,0,0,0.15); color: {text_color}; position: relative;
+    '>
+        <div style='font-size: 14px; font-weight: bold; color: {text_color}; margin-bottom: 8px; opacity: 0.8;'>{label} – Intelligent Excuse Generator</div>
+        <div style='font-size: 24px; font-weight: 700; line-height: 1.4;'>{main_text}</div>
+        <img src="{logo_url}" style="position:absolute;bottom:20px;left:20px;width:50px;opacity:0.85;" />
+        <div style='position: absolute; bottom: 18px; right: 24px; font-size: 12px; opacity: 0.6;'>Generated on {datetime.now().strftime('%Y-%m-%d')}</div>
+    </div>
+    """
+    return html
+
+# ============ Backends ============
+# Each backend returns {"url": ...} for a hosted image or {"path": ...} for a local PNG file.
+class HctiRenderer:
+    name = "hcti"
+
+    def __init__(self, user, key, timeout=SCREENSHOT_TIMEOUT):
+        self.auth = (user, key)
+        self.timeout = timeout
+        self._client = None
+
+    def _form(self, html):
+        return {"html": html, "css": "", "google_fonts": "Inter:700;Rajdhani:700"}
+
+    def _url(self, res):
+        url = res.json().get("url")
+        if not url:
+            raise RuntimeError(f"HCTI returned no image URL (HTTP {res.status_code})")
+        return {"url": url}
+
+    async def render(self, html, key, theme):
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout)
+        res = await self._client.post(HCTI_URL, data=self._form(html), auth=self.auth)
+        return self._url(res)
+
+    def render_sync(self, html, key, theme):
+        with httpx.Client(timeout=self.timeout) as client:
+            return self._url(client.post(HCTI_URL, data=self._form(html), auth=self.auth))
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class LocalRenderer:
+    """Offline stand-in for HCTI: writes a themed gradient card PNG without any external service."""
+
+    name = "local"
+
+    def __init__(self, out_dir=RENDER_DIR):
+        self.out_dir = out_dir
+
+    def render_sync(self, html, key, theme):
+        os.makedirs(self.out_dir, exist_ok=True)
+        path = os.path.join(self.out_dir, f"{key}.png")
+        if not os.path.exists(path):
+            top, bottom = THEME_GRADIENTS.get(theme, THEME_GRADIENTS["light"])
+            # Card grows with the amount of text, like the HTML version
+            text_len = len(re.sub(r"<[^>]+>", "", html))
+            height = min(200 + 12 * (text_len // 40), 1200)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(_gradient_png(600, height, _hex_rgb(top), _hex_rgb(bottom)))
+            os.replace(tmp, path)
+        return {"path": path}
+
+    async def render(self, html, key, theme):
+        return await asyncio.to_thread(self.render_sync, html, key, theme)
+
+    async def aclose(self):
+        pass
+
+
+class NoRenderer:
+    """Used without HCTI credentials: no image, as before the local backend existed."""
+
+    name = "none"
+
+    def render_sync(self, html, key, theme):
+        return {}
+
+    async def render(self, html, key, theme):
+        return {}
+
+    async def aclose(self):
+        pass
+
+
+def _hex_rgb(color):
+    color = color.lstrip("#")
+    return tuple(int(color[i:i + 2], 16) for i in (0, 2, 4))
+
+def _gradient_png(width, height, top, bottom) -> bytes:
+    rows = []
+    for y in range(height):
+        t = y / max(height - 1, 1)
+        pixel = bytes(round(a + (b - a) * t) for a, b in zip(top, bottom))
+        rows.append(b"\x00" + pixel * width)
+
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(b"".join(rows), 6)) + chunk(b"IEND", b"")
+
+def _default_backend():
+    # The local stand-in is opt-in: without HCTI credentials there are no screenshots
+    if os.getenv("SCREENSHOT_BACKEND", "hcti") == "local":
+        return LocalRenderer()
+    user, key = os.getenv("HCTI_API_USER"), os.getenv("HCTI_API_KEY")
+    if not (user and key):
+        print("⚠️ HCTI_API_USER/HCTI_API_KEY not set: screenshots are disabled (SCREENSHOT_BACKEND=local renders them offline).")
+        return NoRenderer()
+    return HctiRenderer(user, key)
+
+backend = _default_backend()
+
+# ============ Pipeline ============
+render_cache = ResponseCache(
+    max_size=int(os.getenv("RENDER_CACHE_SIZE", "512")),
+    ttl=float(os.getenv("RENDER_CACHE_TTL", "86400")),
+)
+_render_flights = SingleFlight()
+
+def render_key(text, label, theme):
+    today = datetime.now().strftime("%Y-%m-%d")
+    return make_key(text, backend.name, label=label, theme=theme, date=today)
+
+async def render_card(text, label, theme="light") -> dict:
+    """Renders (or reuses) the screenshot card for text+label+theme on today's date."""
+    key = render_key(text, label, theme)
+    cached = render_cache.get(key)
+    if cached:
+        return cached
+
+    async def render():
+        result = await backend.render(render_screenshot_html(text, label, theme), key, theme)
+        render_cache.put(key, result)
+        return result
+    return await _render_flights.do(key, render)
+
+def render_card_sync(text, label, theme="light") -> dict:
+    """Blocking variant for worker threads (e.g. emergency emails)."""
+    key = render_key(text, label, theme)
+    cached = render_cache.get(key)
+    if cached:
+        return cached
+    result = backend.render_sync(render_screenshot_html(text, label, theme), key, theme)
+    render_cache.put(key, result)
+    return result
+
+def load_image_bytes(result, timeout=SCREENSHOT_TIMEOUT):
+    if result.get("path"):
+        with open(result["path"], "rb") as f:
+            return f.read()
+    if result.get("url"):
+        return httpx.get(result["url"], timeout=timeout).content
+    return None
+
+def local_render_path(name):
+    """File path of a locally rendered PNG, or None for an unknown or invalid name."""
+    if not RENDER_NAME.match(name):
+        return None
+    path = os.path.join(RENDER_DIR, name)
+    return path if os.path.exists(path) else None
+
+async def close_renderer():
+    await backend.aclose()
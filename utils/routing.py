@@ -0,0 +1,335 @@
+import time
+import asyncio
+import contextvars
+from collections import deque
+from utils import metrics
+from utils.ratelimit import UpstreamBusy, AdmissionRejected, BACKGROUND
+
+# Routing across an ordered list of upstream models. Each model has a circuit breaker that opens on
+# a high error or slow-call rate, so a model that is down is skipped instead of timing out every
+# request. A call slower than the model's usual p95 is hedged with the next model and the first
+# answer wins. An optional per-endpoint latency budget bounds all of it.
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitBreaker:
+    """Looks at the last `window` calls. Once at least `min_calls` are in, the breaker opens when the
+    error rate reaches `error_rate` or the share of calls slower than `slow_seconds` reaches
+    `slow_rate`. After `open_seconds` one probe call is let through (half-open): if it succeeds in
+    time the breaker closes, otherwise it opens again."""
+
+    def __init__(self, name, window=20, min_calls=5, error_rate=0.5, slow_seconds=10.0, slow_rate=0.8, open_seconds=30.0):
+        self.name = name
+        self.min_calls = max(1, min_calls)
+        self.error_rate = error_rate
+        self.slow_seconds = slow_seconds
+        self.slow_rate = slow_rate
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self.opened = 0
+        self._calls = deque(maxlen=max(window, self.min_calls))  # (failed, slow)
+        self._opened_at = 0.0
+        self._probing = False
+        metrics.llm_breaker_state.set(name, value=STATE_VALUES[CLOSED])
+
+    def allow(self) -> bool:
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            if time.monotonic() - self._opened_at < self.open_seconds:
+                return False
+            self._set(HALF_OPEN)
+        if self._probing:
+            return False
+        self._probing = True
+        return True
+
+    def record(self, failed: bool, seconds: float):
+        slow = seconds >= self.slow_seconds
+        if self.state == HALF_OPEN:
+            self._probing = False
+            if failed or slow:
+                self._open()
+            else:
+                self._set(CLOSED)
+            return
+        self._calls.append((failed, slow))
+        if self.state == CLOSED and len(self._calls) >= self.min_calls:
+            calls = len(self._calls)
+            errors = sum(1 for failed, _ in self._calls if failed)
+            slow_calls = sum(1 for _, slow in self._calls if slow)
+            if errors / calls >= self.error_rate or slow_calls / calls >= self.slow_rate:
+                self._open()
+
+    def release(self):
+        """A call that never reached the model: hands back a half-open probe without judging the model."""
+        if self.state == HALF_OPEN:
+            self._probing = False
+
+    def cancelled(self, seconds: float, lost=False):
+        """A call given up on: it lost a hedge race (counted as slow) or ran out of budget."""
+        if lost:
+            self.record(False, max(seconds, self.slow_seconds))
+        elif self.state == HALF_OPEN:
+            self._probing = False
+        elif seconds >= self.slow_seconds:
+            self.record(False, seconds)
+
+    def retry_after(self) -> float:
+        return max(self.open_seconds - (time.monotonic() - self._opened_at), 1.0)
+
+    def _open(self):
+        self._opened_at = time.monotonic()
+        self.opened += 1
+        self._calls.clear()
+        self._set(OPEN)
+
+    def _set(self, state):
+        self.state = state
+        if state == CLOSED:
+            self._calls.clear()
+        metrics.llm_breaker_state.set(self.name, value=STATE_VALUES[state])
+
+    def stats(self) -> dict:
+        calls = len(self._calls)
+        return {
+            "state": self.state,
+            "opened": self.opened,
+            "window_calls": calls,
+            "error_rate": round(sum(1 for failed, _ in self._calls if failed) / calls, 3) if calls else 0.0,
+            "slow_rate": round(sum(1 for _, slow in self._calls if slow) / calls, 3) if calls else 0.0,
+        }
+
+
+class LatencyWindow:
+    """The last `size` successful call durations of one model."""
+
+    def __init__(self, size=200):
+        self._samples = deque(maxlen=size)
+
+    def add(self, seconds):
+        self._samples.append(seconds)
+
+    def quantile(self, q) -> float:
+        ordered = sorted(self._samples)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)] if ordered else 0.0
+
+    def __len__(self):
+        return len(self._samples)
+
+
+# ============ Dispatch time ============
+# Set per routed attempt; the transport marks when the request actually leaves, so time spent in the
+# local limiter queue or a Retry-After pause is not held against the model
+_dispatched = contextvars.ContextVar("llm_dispatched", default=None)
+
+
+def mark_dispatched():
+    """Called by the transport once the upstream request is sent (after local admission)."""
+    holder = _dispatched.get()
+    if holder is not None:
+        holder[0] = time.monotonic()
+
+
+# ============ Latency budgets ============
+# (endpoint, monotonic deadline) for the request being handled; set by the app's middleware
+_deadline = contextvars.ContextVar("llm_deadline", default=None)
+
+
+def parse_budgets(raw: str) -> dict:
+    """Parses LLM_LATENCY_BUDGETS, e.g. "/api/excuse=8,/api/score-apology=15" (seconds)."""
+    budgets = {}
+    for item in raw.split(","):
+        path, _, seconds = item.strip().rpartition("=")
+        try:
+            if path:
+                budgets[path] = float(seconds)
+        except ValueError:
+            pass
+    return budgets
+
+
+def start_budget(endpoint, seconds):
+    """Every routed LLM call in the current context must finish within `seconds` from now."""
+    return _deadline.set((endpoint, time.monotonic() + seconds))
+
+
+def budget_remaining():
+    """(endpoint, seconds left) of the current latency budget, or None without one."""
+    current = _deadline.get()
+    if current is None:
+        return None
+    endpoint, deadline = current
+    return endpoint, deadline - time.monotonic()
+
+
+class ModelRouter:
+    """Runs a call on the first model whose breaker allows it and fails over down the list on errors.
+    Interactive calls still running after the model's p95 latency are hedged with the next model.
+
+    `is_failure(error)` tells model trouble (throttling, overload, timeouts) from errors that are the
+    request's own fault, such as a bad prompt: those are raised as they are, without touching the
+    breaker or trying another model."""
+
+    def __init__(self, models, breaker_options=None, hedge=True, hedge_quantile=0.95, hedge_min_delay=0.5,
+                 hedge_default_delay=2.0, hedge_min_samples=20, is_failure=None):
+        self.models = list(dict.fromkeys(models))
+        self.is_failure = is_failure or (lambda error: True)
+        self.breakers = {model: CircuitBreaker(model, **(breaker_options or {})) for model in self.models}
+        self.latency = {model: LatencyWindow() for model in self.models}
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_default_delay = hedge_default_delay
+        self.hedge_min_samples = hedge_min_samples
+        self.wins = {model: 0 for model in self.models}
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+        self.budget_exceeded = 0
+        self.forced = 0
+
+    @property
+    def primary(self) -> str:
+        return self.models[0]
+
+    def hedge_delay(self, model) -> float:
+        """How long to wait on `model` before hedging: its recent p95, or a default until enough samples."""
+        window = self.latency[model]
+        if len(window) < self.hedge_min_samples:
+            return self.hedge_default_delay
+        return max(self.hedge_min_delay, window.quantile(self.hedge_quantile))
+
+    def next_model(self, tried):
+        """The first untried model whose breaker lets a call through, or None. A request is never
+        turned away untried: with every breaker open it still goes to the last model in the list."""
+        for model in self.models:
+            if model not in tried and self.breakers[model].allow():
+                return model
+        if not tried:
+            self.forced += 1
+            return self.models[-1]
+        return None
+
+    def fails_over(self, error) -> bool:
+        """Whether `error` is worth another model: model trouble, or our own limiter turning the call away."""
+        return isinstance(error, UpstreamBusy) or self.is_failure(error)
+
+    def record(self, model, failed, seconds):
+        self.breakers[model].record(failed, seconds)
+        if not failed:
+            self.latency[model].add(seconds)
+
+    def failed_over(self, model):
+        self.failovers += 1
+        metrics.llm_failovers.inc(model)
+
+    def over_budget(self, endpoint) -> UpstreamBusy:
+        self.budget_exceeded += 1
+        metrics.llm_budget_exceeded.inc(endpoint)
+        return UpstreamBusy("The AI model is taking too long, please try again shortly.", 1.0)
+
+    async def run(self, call, priority):
+        """Awaits call(model) under the routing rules and returns the first successful result."""
+        budget = budget_remaining()
+        if budget is None:
+            return await self._race(call, self.hedge and priority != BACKGROUND)
+        endpoint, remaining = budget
+        if remaining <= 0:
+            raise self.over_budget(endpoint)
+        try:
+            return await asyncio.wait_for(self._race(call, self.hedge and priority != BACKGROUND), remaining)
+        except asyncio.TimeoutError:
+            raise self.over_budget(endpoint) from None
+
+    async def _attempt(self, model, call, race):
+        # Runs in its own task, so the dispatch holder is private to this attempt. Calls that never
+        # mark a dispatch are timed from the start.
+        sent, started = [None], time.monotonic()
+        _dispatched.set(sent)
+        breaker = self.breakers[model]
+        try:
+            result = await call(model)
+        except asyncio.CancelledError:
+            if sent[0] is None and not race["won"]:
+                breaker.release()
+            else:
+                breaker.cancelled(time.monotonic() - (sent[0] or started), lost=race["won"])
+            raise
+        except Exception as e:
+            if sent[0] is None and isinstance(e, AdmissionRejected):
+                # Turned away by our own limiter; the model was never asked
+                breaker.release()
+            elif self.is_failure(e):
+                self.record(model, True, time.monotonic() - (sent[0] or started))
+            else:
+                # The request's own fault (e.g. a 400): says nothing about the model
+                breaker.release()
+            raise
+        self.record(model, False, time.monotonic() - (sent[0] or started))
+        return result
+
+    async def _race(self, call, hedging):
+        tried, tasks, race = [], {}, {"won": False}
+
+        def launch(hedged):
+            model = self.next_model(tried)
+            if model is None:
+                return False
+            tried.append(model)
+            task = asyncio.ensure_future(self._attempt(model, call, race))
+            # Losers are cancelled; make sure a late exception is still retrieved
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            tasks[task] = (model, hedged)
+            return True
+
+        launch(False)
+        error = None
+        try:
+            while tasks:
+                delay = self.hedge_delay(tried[-1]) if hedging else None
+                done, _ = await asyncio.wait(tasks, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Slower than usual: hedge with the next model and take whichever answers first
+                    if launch(True):
+                        self.hedges += 1
+                        metrics.llm_hedges.inc(tried[-1])
+                    else:
+                        hedging = False
+                    continue
+                for task in done:
+                    model, hedged = tasks.pop(task)
+                    if task.exception() is None:
+                        self.wins[model] += 1
+                        self.hedge_wins += hedged
+                        race["won"] = True
+                        return task.result()
+                    error = task.exception()
+                    if not self.fails_over(error):
+                        raise error
+                if not tasks and launch(False):
+                    self.failed_over(tried[-2])
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "models": {
+                model: {
+                    **self.breakers[model].stats(),
+                    "wins": self.wins[model],
+                    "p95_seconds": round(self.latency[model].quantile(0.95), 3),
+                    "hedge_delay": round(self.hedge_delay(model), 3),
+                }
+                for model in self.models
+            },
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "failovers": self.failovers,
+            "budget_exceeded": self.budget_exceeded,
+            "forced": self.forced,
+        }
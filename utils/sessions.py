@@ -0,0 +1,233 @@
+import os
+import re
+import json
+import time
+import uuid
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from utils import storage, shared_state
+
+# Per-client state (history, favorites, latest result) replacing the old module-level globals.
+# Sessions are kept in LRU order; idle ones expire and the least recently used are evicted
+# whenever the store exceeds its session count or memory budget.
+
+SESSION_HEADER = "X-Session-ID"
+SESSION_COOKIE = "session_id"
+_VALID_ID = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+
+
+class Session:
+    __slots__ = ("id", "excuse_history", "apology_history", "favorite_excuses", "favorite_apologies",
+                 "latest_text", "latest_label", "latest_excuse", "latest_apology", "last_seen", "size")
+
+    def __init__(self, sid, history_cap):
+        self.id = sid
+        self.excuse_history = deque(maxlen=history_cap)
+        self.apology_history = deque(maxlen=history_cap)
+        self.favorite_excuses = []
+        self.favorite_apologies = []
+        self.latest_text = ""
+        self.latest_label = ""
+        self.latest_excuse = None
+        self.latest_apology = None
+        self.last_seen = time.time()
+        self.size = 0
+
+    def estimate_size(self) -> int:
+        """Rough bytes held by this session (text payload plus per-item overhead)."""
+        total = 512
+        for history in (self.excuse_history, self.apology_history):
+            total += sum(len(item["text"]) + len(item.get("time", "")) + 120 for item in history)
+        for favorites in (self.favorite_excuses, self.favorite_apologies):
+            total += sum(len(text) + 60 for text in favorites)
+        for text in (self.latest_text, self.latest_excuse, self.latest_apology):
+            total += len(text or "")
+        return total
+
+    def to_dict(self) -> dict:
+        return {
+            "excuse_history": list(self.excuse_history),
+            "apology_history": list(self.apology_history),
+            "favorite_excuses": self.favorite_excuses,
+            "favorite_apologies": self.favorite_apologies,
+            "latest_text": self.latest_text,
+            "latest_label": self.latest_label,
+            "latest_excuse": self.latest_excuse,
+            "latest_apology": self.latest_apology,
+        }
+
+    @classmethod
+    def from_dict(cls, sid, history_cap, data, last_seen):
+        session = cls(sid, history_cap)
+        session.excuse_history.extend(data.get("excuse_history", []))
+        session.apology_history.extend(data.get("apology_history", []))
+        for name in ("favorite_excuses", "favorite_apologies", "latest_text", "latest_label", "latest_excuse", "latest_apology"):
+            if name in data:
+                setattr(session, name, data[name])
+        session.last_seen = last_seen
+        return session
+
+
+class SessionStore:
+    def __init__(self, max_sessions=10000, idle_ttl=6 * 3600, memory_budget=64 * 1024 * 1024,
+                 history_cap=50, favorites_cap=100):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.memory_budget = memory_budget
+        self.history_cap = history_cap
+        self.favorites_cap = favorites_cap
+        self._sessions = OrderedDict()
+        self._lock = threading.RLock()
+        self._bytes = 0
+        self.created = 0
+        self.evicted = 0
+        self.expired = 0
+
+    @staticmethod
+    def new_id() -> str:
+        return uuid.uuid4().hex
+
+    @staticmethod
+    def valid_id(sid) -> bool:
+        return bool(sid) and bool(_VALID_ID.match(sid))
+
+    def get(self, sid) -> Session:
+        with self._lock:
+            self._expire_idle()
+            session = self._sessions.get(sid)
+            if session is None:
+                session = self._sessions[sid] = Session(sid, self.history_cap)
+                self.created += 1
+                self._enforce_limits(keep=sid)
+            else:
+                self._sessions.move_to_end(sid)
+            session.last_seen = time.time()
+            return session
+
+    @contextmanager
+    def edit(self, sid):
+        """Yields the session for mutation, then re-measures it and enforces caps and the budget."""
+        with self._lock:
+            session = self.get(sid)
+            try:
+                yield session
+            finally:
+                self._trim(session)
+                size = session.estimate_size()
+                self._bytes += size - session.size
+                session.size = size
+                self._enforce_limits(keep=sid)
+
+    def _trim(self, session):
+        # Oldest favorites go first once a session hits its cap
+        for favorites in (session.favorite_excuses, session.favorite_apologies):
+            if len(favorites) > self.favorites_cap:
+                del favorites[:len(favorites) - self.favorites_cap]
+
+    def _drop(self, sid):
+        session = self._sessions.pop(sid)
+        self._bytes -= session.size
+
+    def _expire_idle(self):
+        cutoff = time.time() - self.idle_ttl
+        while self._sessions:
+            sid, oldest = next(iter(self._sessions.items()))
+            if oldest.last_seen >= cutoff:
+                break
+            self._drop(sid)
+            self.expired += 1
+
+    def _enforce_limits(self, keep=None):
+        while len(self._sessions) > self.max_sessions or (self._bytes > self.memory_budget and len(self._sessions) > 1):
+            sid = next(iter(self._sessions))
+            if sid == keep:
+                break
+            self._drop(sid)
+            self.evicted += 1
+
+    def active_since(self, since) -> list:
+        with self._lock:
+            return [s for s in self._sessions.values() if s.last_seen >= since]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "approx_bytes": self._bytes,
+                "memory_budget": self.memory_budget,
+                "created": self.created,
+                "evicted": self.evicted,
+                "expired": self.expired,
+            }
+
+
+class SharedSessionStore(SessionStore):
+    """SessionStore kept in the shared kv table so every uvicorn worker sees the same sessions.
+    Each session is one JSON row; edits run in a write transaction, and the leader worker prunes
+    idle and excess sessions (see prune())."""
+
+    NAMESPACE = "session"
+
+    def _load(self, sid, db=None):
+        row = (db or shared_state.conn()).execute(
+            "SELECT value, updated_at FROM kv WHERE namespace = ? AND key = ? AND expires_at > ?",
+            (self.NAMESPACE, sid, time.time()),
+        ).fetchone()
+        if row is None:
+            return None
+        return Session.from_dict(sid, self.history_cap, json.loads(row["value"]), row["updated_at"])
+
+    def get(self, sid) -> Session:
+        # Reads never write; a session only exists in the store once something is saved to it
+        return self._load(sid) or Session(sid, self.history_cap)
+
+    @contextmanager
+    def edit(self, sid):
+        shared_state.ensure_schema()
+        with storage.transaction() as db:
+            session = self._load(sid, db)
+            if session is None:
+                session = Session(sid, self.history_cap)
+                self.created += 1
+            yield session
+            self._trim(session)
+            shared_state.kv_put(self.NAMESPACE, sid, session.to_dict(), self.idle_ttl, db)
+
+    def prune(self):
+        """Drops expired sessions and the least recently edited beyond max_sessions."""
+        self.evicted += shared_state.kv_trim(self.NAMESPACE, self.max_sessions)
+
+    def active_since(self, since) -> list:
+        rows = shared_state.conn().execute(
+            "SELECT key, value, updated_at FROM kv WHERE namespace = ? AND updated_at >= ? AND expires_at > ?",
+            (self.NAMESPACE, since, time.time()),
+        ).fetchall()
+        return [Session.from_dict(r["key"], self.history_cap, json.loads(r["value"]), r["updated_at"]) for r in rows]
+
+    def stats(self) -> dict:
+        db = shared_state.conn()
+        count, size = db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM kv WHERE namespace = ? AND expires_at > ?",
+            (self.NAMESPACE, time.time()),
+        ).fetchone()
+        return {
+            "backend": "sqlite",
+            "sessions": count,
+            "max_sessions": self.max_sessions,
+            "approx_bytes": size,
+            "memory_budget": self.memory_budget,
+            "created": self.created,
+            "evicted": self.evicted,
+            "expired": self.expired,
+        }
+
+
+sessions = (SharedSessionStore if shared_state.ENABLED else SessionStore)(
+    max_sessions=int(os.getenv("SESSION_MAX", "10000")),
+    idle_ttl=float(os.getenv("SESSION_IDLE_TTL", str(6 * 3600))),
+    memory_budget=int(os.getenv("SESSION_MEMORY_BUDGET_MB", "64")) * 1024 * 1024,
+    history_cap=int(os.getenv("SESSION_HISTORY_CAP", "50")),
+    favorites_cap=int(os.getenv("SESSION_FAVORITES_CAP", "100")),
+)
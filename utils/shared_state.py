@@ -0,0 +1,280 @@
+import os
+import json
+import time
+import uuid
+import socket
+import asyncio
+import threading
+from utils import storage
+from utils.cache import ResponseCache
+
+# Shared state for `uvicorn main:app --workers N`: caches, sessions and a leader lease live in the
+# SQLite store, which every worker process opens. Single-process deployments keep the in-memory
+# versions. STATE_BACKEND=sqlite|memory overrides the choice made from WEB_CONCURRENCY.
+WORKERS = int(os.getenv("WEB_CONCURRENCY", "1"))
+ENABLED = os.getenv("STATE_BACKEND", "sqlite" if WORKERS > 1 else "memory") == "sqlite"
+# Seconds a worker keeps its own copy of a shared cache entry it has read or written (0 = off)
+LOCAL_CACHE_TTL = float(os.getenv("SHARED_CACHE_LOCAL_TTL", "60"))
+
+KV_SCHEMA = """
+CREATE TABLE IF NOT EXISTS kv (
+    namespace  TEXT NOT NULL,
+    key        TEXT NOT NULL,
+    value      TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS idx_kv_recent ON kv(namespace, updated_at);
+CREATE INDEX IF NOT EXISTS idx_kv_expiry ON kv(expires_at);
+
+CREATE TABLE IF NOT EXISTS leases (
+    name       TEXT PRIMARY KEY,
+    holder     TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+_schema_lock = threading.Lock()
+_schema_ready = False
+
+def ensure_schema():
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if not _schema_ready:
+            storage.init_db()
+            storage.connect().executescript(KV_SCHEMA)
+            _schema_ready = True
+
+def conn():
+    ensure_schema()
+    return storage.connect()
+
+# ============ Key-value ============
+def kv_get(namespace, key):
+    row = conn().execute(
+        "SELECT value FROM kv WHERE namespace = ? AND key = ? AND expires_at > ?", (namespace, key, time.time())
+    ).fetchone()
+    return json.loads(row["value"]) if row else None
+
+def kv_put(namespace, key, value, ttl, db=None):
+    now = time.time()
+    (db or conn()).execute(
+        """
+        INSERT INTO kv (namespace, key, value, expires_at, updated_at) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(namespace, key) DO UPDATE SET
+            value = excluded.value, expires_at = excluded.expires_at, updated_at = excluded.updated_at
+        """,
+        (namespace, key, json.dumps(value, ensure_ascii=False), now + ttl, now),
+    )
+
+def kv_count(namespace):
+    return conn().execute("SELECT COUNT(*) FROM kv WHERE namespace = ?", (namespace,)).fetchone()[0]
+
+def kv_trim(namespace, max_items):
+    """Drops expired entries and the least recently written ones beyond max_items; returns rows removed."""
+    db = conn()
+    removed = db.execute("DELETE FROM kv WHERE namespace = ? AND expires_at <= ?", (namespace, time.time())).rowcount
+    removed += db.execute(
+        """
+        DELETE FROM kv WHERE namespace = ? AND key IN (
+            SELECT key FROM kv WHERE namespace = ? ORDER BY updated_at DESC LIMIT -1 OFFSET ?
+        )
+        """,
+        (namespace, namespace, max_items),
+    ).rowcount
+    return removed
+
+
+class SharedCache:
+    """ResponseCache with the same get/put/stats interface, stored in the kv table so every worker
+    sees the same entries. Values must be JSON-serializable (tuples come back as lists).
+
+    With a single candidate per key, each worker also keeps recently used entries in memory for
+    LOCAL_CACHE_TTL seconds, so repeat hits skip SQLite. Rotating caches (variety > 1) always read
+    the shared row, since the rotation point is shared."""
+
+    def __init__(self, namespace, max_size=1024, ttl=3600, variety=1):
+        self.namespace = f"cache:{namespace}"
+        self.max_size = max(1, int(max_size))
+        self.ttl = float(ttl)
+        self.variety = max(1, int(variety))
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._puts = 0
+        self._local = None
+        if self.variety == 1 and LOCAL_CACHE_TTL > 0:
+            self._local = ResponseCache(max_size=self.max_size, ttl=min(LOCAL_CACHE_TTL, self.ttl))
+
+    def _local_get(self, key):
+        if self._local is None:
+            return None
+        value = self._local.get(key)
+        if value is not None:
+            self.hits += 1
+        return value
+
+    def get(self, key):
+        value = self._local_get(key)
+        if value is not None:
+            return value
+        entry = kv_get(self.namespace, key)
+        if entry is None or len(entry["candidates"]) < self.variety:
+            self.misses += 1
+            return None
+        self.hits += 1
+        candidates = entry["candidates"]
+        if len(candidates) == 1:
+            if self._local is not None:
+                self._local.put(key, candidates[0])
+            return candidates[0]
+        # Rotation point is shared too, so workers take turns through the candidates
+        with storage.transaction() as db:
+            row = db.execute("SELECT value FROM kv WHERE namespace = ? AND key = ?", (self.namespace, key)).fetchone()
+            if row is None:
+                return candidates[0]
+            entry = json.loads(row["value"])
+            value = entry["candidates"][entry["next"] % len(entry["candidates"])]
+            entry["next"] += 1
+            db.execute("UPDATE kv SET value = ? WHERE namespace = ? AND key = ?", (json.dumps(entry, ensure_ascii=False), self.namespace, key))
+        return value
+
+    def put(self, key, value):
+        value = json.loads(json.dumps(value, ensure_ascii=False))
+        if self._local is not None:
+            self._local.put(key, value)
+        ensure_schema()
+        with storage.transaction() as db:
+            row = db.execute(
+                "SELECT value FROM kv WHERE namespace = ? AND key = ? AND expires_at > ?", (self.namespace, key, time.time())
+            ).fetchone()
+            entry = json.loads(row["value"]) if row else {"candidates": [], "next": 0}
+            if value not in entry["candidates"]:
+                entry["candidates"].append(value)
+                entry["candidates"] = entry["candidates"][-self.variety:]
+            if row:
+                # Like ResponseCache, the TTL runs from the key's first write
+                db.execute(
+                    "UPDATE kv SET value = ?, updated_at = ? WHERE namespace = ? AND key = ?",
+                    (json.dumps(entry, ensure_ascii=False), time.time(), self.namespace, key),
+                )
+            else:
+                kv_put(self.namespace, key, entry, self.ttl, db)
+        # Bound the namespace every so often rather than on each write
+        self._puts += 1
+        if self._puts % 64 == 0:
+            self.evictions += kv_trim(self.namespace, self.max_size)
+
+    # Async code uses these: a write waits on SQLite's lock (busy_timeout), which must not stall the loop
+    async def aget(self, key):
+        value = self._local_get(key)
+        if value is not None:
+            return value
+        return await asyncio.to_thread(self.get, key)
+
+    async def aput(self, key, value):
+        await asyncio.to_thread(self.put, key, value)
+
+    def clear(self):
+        # Other workers' local copies age out within LOCAL_CACHE_TTL
+        if self._local is not None:
+            self._local.clear()
+        conn().execute("DELETE FROM kv WHERE namespace = ?", (self.namespace,))
+
+    def __len__(self):
+        return kv_count(self.namespace)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": "sqlite",
+            "size": len(self),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "variety": self.variety,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def cache_or_local(namespace, max_size=1024, ttl=3600, variety=1):
+    """SharedCache in multi-worker mode, otherwise the in-process ResponseCache."""
+    if ENABLED:
+        return SharedCache(namespace, max_size, ttl, variety)
+    return ResponseCache(max_size=max_size, ttl=ttl, variety=variety)
+
+# ============ Leader election ============
+class LeaderElector:
+    """Keeps a time-limited lease in the leases table; exactly one live process holds it.
+    Callbacks run on the elector thread: on_elected / on_demoted on changes, on_tick every renewal
+    while leading."""
+
+    def __init__(self, name, ttl=15.0, on_elected=None, on_demoted=None, on_tick=None):
+        self.name = name
+        self.ttl = ttl
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.on_tick = on_tick
+        self.is_leader = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def try_acquire(self) -> bool:
+        now = time.time()
+        with storage.transaction() as db:
+            db.execute(
+                """
+                INSERT INTO leases (name, holder, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at
+                WHERE leases.holder = excluded.holder OR leases.expires_at < ?
+                """,
+                (self.name, self.holder, now + self.ttl, now),
+            )
+            row = db.execute("SELECT holder FROM leases WHERE name = ?", (self.name,)).fetchone()
+        return row is not None and row["holder"] == self.holder
+
+    def release(self):
+        conn().execute("DELETE FROM leases WHERE name = ? AND holder = ?", (self.name, self.holder))
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                leading = self.try_acquire()
+            except Exception as e:
+                print("⚠️ Leader lease check failed:", e)
+                leading = False
+            if leading and not self.is_leader:
+                self.is_leader = True
+                print(f"👑 {self.holder} is now the {self.name} leader")
+                if self.on_elected: self.on_elected()
+            elif not leading and self.is_leader:
+                self.is_leader = False
+                if self.on_demoted: self.on_demoted()
+            if self.is_leader and self.on_tick:
+                try:
+                    self.on_tick()
+                except Exception as e:
+                    print("⚠️ Leader tick failed:", e)
+            self._stop.wait(self.ttl / 3)
+
+    def start(self):
+        ensure_schema()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"leader-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(self.ttl)
+        if self.is_leader:
+            self.is_leader = False
+            try: self.release()
+            except Exception: pass
+            if self.on_demoted: self.on_demoted()
@@ -0,0 +1,42 @@
+import asyncio
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key into one in-flight call."""
+
+    def __init__(self):
+        self._inflight = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key, fn, *args, **kwargs):
+        flight = self._inflight.get(key)
+        if flight is None:
+            self.calls += 1
+            # The shared call runs as its own task, so whoever started it can go away without taking
+            # the others down with it
+            flight = self._inflight[key] = [asyncio.ensure_future(fn(*args, **kwargs)), 0]
+            flight[0].add_done_callback(lambda task: self._done(key, flight))
+        else:
+            self.coalesced += 1
+        task = flight[0]
+        flight[1] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            flight[1] -= 1
+            if flight[1] == 0 and not task.done():
+                # Everyone waiting was cancelled; nobody wants the result any more
+                task.cancel()
+
+    def _done(self, key, flight):
+        if self._inflight.get(key) is flight:
+            del self._inflight[key]
+        if not flight[0].cancelled():
+            flight[0].exception()  # mark retrieved when nobody was left waiting
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._inflight),
+            "upstream_calls": self.calls,
+            "coalesced": self.coalesced,
+        }
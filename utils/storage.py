@@ -0,0 +1,343 @@
+import os
+import re
+import json
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+from utils import rankings, metrics
+
+# Embedded store for scores and calendars (replaces the JSON read-modify-write files)
+DB_PATH = os.getenv("EXCUSE_DB_PATH", "excuse_store.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scores (
+    kind          TEXT NOT NULL,
+    text_hash     TEXT NOT NULL,
+    text          TEXT NOT NULL,
+    count         INTEGER NOT NULL DEFAULT 0,
+    urgency_score INTEGER NOT NULL DEFAULT 0,
+    favorited     INTEGER NOT NULL DEFAULT 0,
+    tone_bonus    INTEGER NOT NULL DEFAULT 0,
+    length_bonus  INTEGER NOT NULL DEFAULT 0,
+    score         INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (kind, text_hash)
+);
+CREATE TABLE IF NOT EXISTS calendar (
+    id        INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind      TEXT NOT NULL,
+    text_hash TEXT NOT NULL,
+    text      TEXT NOT NULL,
+    date      TEXT NOT NULL,
+    time      TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_scores_rank ON scores(kind, score DESC, count DESC);
+CREATE INDEX IF NOT EXISTS idx_calendar_kind_date ON calendar(kind, date);
+CREATE INDEX IF NOT EXISTS idx_calendar_kind_hash ON calendar(kind, text_hash);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS search_docs (
+    id        INTEGER PRIMARY KEY,
+    kind      TEXT NOT NULL,
+    text_hash TEXT NOT NULL,
+    text      TEXT NOT NULL,
+    UNIQUE (kind, text_hash)
+);
+"""
+
+# Full-text index over search_docs, kept in sync by triggers
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5(
+    text, content='search_docs', content_rowid='id', tokenize='{tokenizer}'
+);
+CREATE TRIGGER IF NOT EXISTS search_docs_ai AFTER INSERT ON search_docs BEGIN
+    INSERT INTO search_fts(rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS search_docs_ad AFTER DELETE ON search_docs BEGIN
+    INSERT INTO search_fts(search_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+"""
+
+# "trigram" (substring matching), "unicode61" (word-prefix matching) or "like" when FTS5 is unavailable
+SEARCH_MODE = "like"
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = False
+
+def text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+def connect() -> sqlite3.Connection:
+    """One connection per thread; WAL lets readers run alongside the single writer."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        _local.conn = conn
+    return conn
+
+# Columns added after the first release of the store
+_LATE_SCORE_COLUMNS = ["tone_bonus", "length_bonus", "score"]
+
+def _upgrade_schema(conn):
+    existing = {r["name"] for r in conn.execute("PRAGMA table_info(scores)")}
+    missing = [c for c in _LATE_SCORE_COLUMNS if c not in existing]
+    for column in missing:
+        conn.execute(f"ALTER TABLE scores ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0")
+    return bool(missing)
+
+def init_db():
+    global _initialized
+    with _init_lock:
+        if not _initialized:
+            conn = connect()
+            upgraded = _upgrade_schema(conn) if conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'scores'"
+            ).fetchone() else False
+            conn.executescript(SCHEMA)
+            if upgraded:
+                rescore_all()
+            _init_search(conn)
+            _initialized = True
+
+def _init_search(conn):
+    global SEARCH_MODE
+    row = conn.execute("SELECT value FROM meta WHERE key = 'search_tokenizer'").fetchone()
+    if row:
+        SEARCH_MODE = row["value"]
+        return
+    SEARCH_MODE = "like"
+    for tokenizer in ("trigram", "unicode61"):
+        try:
+            conn.executescript(FTS_SCHEMA.format(tokenizer=tokenizer))
+            SEARCH_MODE = tokenizer
+            break
+        except sqlite3.OperationalError:
+            continue
+    # Backfill everything stored so far (the insert trigger indexes each new doc)
+    with transaction() as tx:
+        tx.execute("INSERT OR IGNORE INTO search_docs (kind, text_hash, text) SELECT kind, text_hash, text FROM scores")
+        tx.execute("INSERT OR IGNORE INTO search_docs (kind, text_hash, text) SELECT kind, text_hash, text FROM calendar ORDER BY id")
+        tx.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('search_tokenizer', ?)", (SEARCH_MODE,))
+
+@contextmanager
+def transaction():
+    conn = connect()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+# ============ Scores ============
+# Every write recomputes the row's ranking score, so reads are a plain index scan.
+def _rescore(conn, kind, h):
+    row = conn.execute(
+        "SELECT count, urgency_score, tone_bonus, length_bonus, favorited FROM scores WHERE kind = ? AND text_hash = ?",
+        (kind, h),
+    ).fetchone()
+    if row:
+        score = rankings.score_row(kind, row["count"], row["urgency_score"], row["tone_bonus"], row["length_bonus"], row["favorited"])
+        conn.execute("UPDATE scores SET score = ? WHERE kind = ? AND text_hash = ?", (score, kind, h))
+
+def _upsert_score(conn, kind, text, count_delta=0, urgency_points=0, favorited=None):
+    h = text_hash(text)
+    _index_text(conn, kind, text, h)
+    conn.execute(
+        """
+        INSERT INTO scores (kind, text_hash, text, count, urgency_score, favorited, tone_bonus, length_bonus)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(kind, text_hash) DO UPDATE SET
+            count = count + excluded.count,
+            urgency_score = urgency_score + excluded.urgency_score,
+            favorited = COALESCE(?, favorited)
+        """,
+        (kind, h, text, count_delta, urgency_points, int(bool(favorited)),
+         rankings.tone_bonus(text), rankings.length_bonus(text),
+         None if favorited is None else int(favorited)),
+    )
+    _rescore(conn, kind, h)
+
+def _bump_score(conn, kind, text, urgency_points=0):
+    _upsert_score(conn, kind, text, count_delta=1, urgency_points=urgency_points)
+
+@metrics.timed(metrics.storage_seconds, "set_favorited")
+def set_favorited(kind, text, favorited):
+    """Flags an entry as (un)favorited; favoriting creates the entry if it doesn't exist yet."""
+    with transaction() as conn:
+        if favorited:
+            _upsert_score(conn, kind, text, favorited=True)
+        else:
+            h = text_hash(text)
+            conn.execute("UPDATE scores SET favorited = 0 WHERE kind = ? AND text_hash = ?", (kind, h))
+            _rescore(conn, kind, h)
+
+@metrics.timed(metrics.storage_seconds, "rescore_all")
+def rescore_all():
+    with transaction() as conn:
+        rows = conn.execute("SELECT kind, text, text_hash FROM scores").fetchall()
+        for r in rows:
+            conn.execute(
+                "UPDATE scores SET tone_bonus = ?, length_bonus = ? WHERE kind = ? AND text_hash = ?",
+                (rankings.tone_bonus(r["text"]), rankings.length_bonus(r["text"]), r["kind"], r["text_hash"]),
+            )
+            _rescore(conn, r["kind"], r["text_hash"])
+
+@metrics.timed(metrics.storage_seconds, "clear_scores")
+def clear_scores(kind):
+    connect().execute("DELETE FROM scores WHERE kind = ?", (kind,))
+
+@metrics.timed(metrics.storage_seconds, "load_scores")
+def load_scores(kind) -> dict:
+    """Returns {text: {"count", "urgency_score", "favorited"}} like the old score files."""
+    rows = connect().execute("SELECT text, count, urgency_score, favorited FROM scores WHERE kind = ?", (kind,))
+    return {
+        r["text"]: {"count": r["count"], "urgency_score": r["urgency_score"], "favorited": bool(r["favorited"])}
+        for r in rows
+    }
+
+@metrics.timed(metrics.storage_seconds, "top_scores")
+def top_scores(kind, limit=None, offset=0) -> list:
+    """Highest-ranked entries first, read straight off the (kind, score, count) index."""
+    rows = connect().execute(
+        """
+        SELECT text, count, urgency_score, favorited, tone_bonus, length_bonus, score
+        FROM scores WHERE kind = ?
+        ORDER BY score DESC, count DESC
+        LIMIT ? OFFSET ?
+        """,
+        (kind, -1 if limit is None else limit, offset),
+    )
+    return [dict(r) for r in rows]
+
+# ============ Calendar ============
+def _add_calendar(conn, kind, text, date, time):
+    h = text_hash(text)
+    conn.execute(
+        "INSERT INTO calendar (kind, text_hash, text, date, time) VALUES (?, ?, ?, ?, ?)",
+        (kind, h, text, date, time),
+    )
+    _index_text(conn, kind, text, h)
+
+@metrics.timed(metrics.storage_seconds, "add_calendar")
+def add_calendar(kind, text, date, time):
+    with transaction() as conn:
+        _add_calendar(conn, kind, text, date, time)
+
+@metrics.timed(metrics.storage_seconds, "add_calendar_if_missing")
+def add_calendar_if_missing(kind, text, date, time) -> bool:
+    with transaction() as conn:
+        exists = conn.execute(
+            "SELECT 1 FROM calendar WHERE kind = ? AND text_hash = ? LIMIT 1", (kind, text_hash(text))
+        ).fetchone()
+        if exists:
+            return False
+        _add_calendar(conn, kind, text, date, time)
+        return True
+
+@metrics.timed(metrics.storage_seconds, "calendar_entries")
+def calendar_entries(kind) -> list:
+    rows = connect().execute("SELECT text, date, time FROM calendar WHERE kind = ? ORDER BY id", (kind,))
+    return [dict(r) for r in rows]
+
+# ============ Search ============
+def _index_text(conn, kind, text, h):
+    conn.execute("INSERT OR IGNORE INTO search_docs (kind, text_hash, text) VALUES (?, ?, ?)", (kind, h, text))
+
+@metrics.timed(metrics.storage_seconds, "search_texts")
+def search_texts(q: str, limit=5) -> list:
+    """Best-matching stored excuses/apologies for q, most relevant first."""
+    q = q.strip()
+    if not q:
+        return []
+    conn = connect()
+    words = re.findall(r"\w+", q)
+    if SEARCH_MODE == "trigram" and len(q) >= 3:
+        # Trigram phrase query == case-insensitive substring match
+        rows = conn.execute(
+            "SELECT text FROM search_fts WHERE search_fts MATCH ? ORDER BY rank LIMIT ?",
+            ('"' + q.replace('"', '""') + '"', limit),
+        )
+    elif SEARCH_MODE == "unicode61" and words:
+        rows = conn.execute(
+            "SELECT text FROM search_fts WHERE search_fts MATCH ? ORDER BY rank LIMIT ?",
+            (" ".join(f'"{w}"*' for w in words), limit),
+        )
+    else:
+        escaped = q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        rows = conn.execute(
+            "SELECT text FROM search_docs WHERE text LIKE ? ESCAPE '\\' ORDER BY id DESC LIMIT ?",
+            (f"%{escaped}%", limit),
+        )
+    return list(dict.fromkeys(r["text"] for r in rows))
+
+# ============ Generation ============
+@metrics.timed(metrics.storage_seconds, "record_generations")
+def record_generations(kind, entries):
+    """Counts generated texts and adds them to the calendar in a single transaction.
+
+    entries: [(text, date, time, urgency_points), ...]
+    """
+    with transaction() as conn:
+        for text, date, time, urgency_points in entries:
+            _bump_score(conn, kind, text, urgency_points)
+            _add_calendar(conn, kind, text, date, time)
+
+def record_generation(kind, text, date, time, urgency_points=0):
+    record_generations(kind, [(text, date, time, urgency_points)])
+
+# ============ JSON Migration ============
+def _read_json(path, default):
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return data if isinstance(data, type(default)) else default
+    except Exception:
+        return default
+
+def migrate_json_files(score_files: dict, calendar_files: dict) -> bool:
+    """One-shot import of the legacy JSON files, e.g. score_files={"excuse": "smart_scores.json"}."""
+    init_db()
+    with transaction() as conn:
+        done = conn.execute("SELECT value FROM meta WHERE key = 'json_migrated'").fetchone()
+        if done:
+            return False
+        for kind, path in score_files.items():
+            for text, meta in _read_json(path, {}).items():
+                if not isinstance(meta, dict):
+                    continue
+                conn.execute(
+                    """
+                    INSERT INTO scores (kind, text_hash, text, count, urgency_score, favorited, tone_bonus, length_bonus)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(kind, text_hash) DO UPDATE SET
+                        count = excluded.count,
+                        urgency_score = excluded.urgency_score,
+                        favorited = excluded.favorited
+                    """,
+                    (kind, text_hash(text), text, int(meta.get("count", 0)),
+                     int(meta.get("urgency_score", 0)), int(bool(meta.get("favorited", False))),
+                     rankings.tone_bonus(text), rankings.length_bonus(text)),
+                )
+                _rescore(conn, kind, text_hash(text))
+        for kind, path in calendar_files.items():
+            for entry in _read_json(path, []):
+                if isinstance(entry, dict) and entry.get("text"):
+                    _add_calendar(conn, kind, entry["text"], entry.get("date", ""), entry.get("time", ""))
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('json_migrated', datetime('now'))")
+    print("✅ Imported legacy JSON scores/calendars into", DB_PATH)
+    return True
+
+if __name__ == "__main__":
+    migrate_json_files(
+        {"excuse": "smart_scores.json", "apology": "apology_scores.json"},
+        {"excuse": "excuse_calendar.json", "apology": "apology_calendar.json"},
+    )